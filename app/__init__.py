@@ -58,6 +58,35 @@ def create_app():
     os.makedirs(uploads_dir, exist_ok=True)
     app.config['UPLOAD_FOLDER_EQUIPAMENTOS'] = uploads_dir
     app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB por requisição
+    # Backend das fotos: 'local' (pasta acima) ou 's3' (qualquer serviço compatível; ver app/foto_storage.py)
+    app.config['PHOTO_STORAGE'] = os.environ.get('PHOTO_STORAGE', 'local').lower()
+    app.config['PHOTO_S3_BUCKET'] = os.environ.get('PHOTO_S3_BUCKET')
+    app.config['PHOTO_S3_PREFIX'] = os.environ.get('PHOTO_S3_PREFIX', 'equipamentos/')
+    app.config['PHOTO_S3_ENDPOINT'] = os.environ.get('PHOTO_S3_ENDPOINT')  # ex.: http://localhost:9000 (MinIO)
+    app.config['PHOTO_S3_REGION'] = os.environ.get('PHOTO_S3_REGION')
+    app.config['PHOTO_S3_ACCESS_KEY'] = os.environ.get('PHOTO_S3_ACCESS_KEY')
+    app.config['PHOTO_S3_SECRET_KEY'] = os.environ.get('PHOTO_S3_SECRET_KEY')
+    # Base pública do bucket (CDN); sem ela as fotos são lidas por URLs GET pré-assinadas
+    app.config['PHOTO_PUBLIC_URL'] = os.environ.get('PHOTO_PUBLIC_URL')
+    app.config['PHOTO_URL_EXPIRES'] = int(os.environ.get('PHOTO_URL_EXPIRES', 3600))
+    app.config['PHOTO_UPLOAD_EXPIRES'] = int(os.environ.get('PHOTO_UPLOAD_EXPIRES', 900))
+    app.config['PHOTO_MAX_BYTES'] = int(os.environ.get('PHOTO_MAX_BYTES', 10 * 1024 * 1024))
+    # Coleta de fotos órfãs (app/coleta_fotos.py): 'quarentena' move e remove depois de PHOTO_QUARANTINE_DAYS;
+    # 'remover' apaga direto. Arquivos mais novos que PHOTO_GC_GRACE_HOURS podem ser uploads em andamento
+    app.config['PHOTO_GC_MODE'] = os.environ.get('PHOTO_GC_MODE', 'quarentena').lower()
+    app.config['PHOTO_GC_GRACE_HOURS'] = int(os.environ.get('PHOTO_GC_GRACE_HOURS', 24))
+    app.config['PHOTO_QUARANTINE_DAYS'] = int(os.environ.get('PHOTO_QUARANTINE_DAYS', 30))
+    # Fora de static/: fotos em quarentena não são servidas
+    if is_vercel:
+        app.config['PHOTO_QUARANTINE_FOLDER'] = os.path.join(tempfile.gettempdir(), 'quarentena_fotos')
+    else:
+        app.config['PHOTO_QUARANTINE_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'quarentena_fotos')
+    # Alerta no log quando as fotos passam desse total (0 = sem alerta)
+    app.config['PHOTO_STORAGE_ALERT_BYTES'] = int(os.environ.get('PHOTO_STORAGE_ALERT_BYTES', 0))
+    if is_vercel and app.config['PHOTO_STORAGE'] == 'local':
+        app.logger.warning('PHOTO_STORAGE=local na Vercel: as fotos ficam no tempdir e se perdem entre invocações')
+    # Linhas por insert na importação de planilhas de equipamentos
+    app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
     
     # Backups do banco de dados
     if is_vercel:
@@ -66,6 +95,26 @@ def create_app():
         backup_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'backups')
     os.makedirs(backup_dir, exist_ok=True)
     app.config['BACKUP_FOLDER'] = backup_dir
+    # Backups lógicos: leitura completa do banco a cada N dias (incrementais nos demais) e
+    # retenção avô-pai-filho (snapshots diários, semanais e mensais mantidos)
+    app.config['BACKUP_FULL_DAYS'] = int(os.environ.get('BACKUP_FULL_DAYS', 7))
+    app.config['BACKUP_KEEP_DAILY'] = int(os.environ.get('BACKUP_KEEP_DAILY', 7))
+    app.config['BACKUP_KEEP_WEEKLY'] = int(os.environ.get('BACKUP_KEEP_WEEKLY', 4))
+    app.config['BACKUP_KEEP_MONTHLY'] = int(os.environ.get('BACKUP_KEEP_MONTHLY', 12))
+    # Restauração: linhas por upsert e upserts simultâneos por tabela
+    app.config['BACKUP_RESTORE_BATCH_SIZE'] = int(os.environ.get('BACKUP_RESTORE_BATCH_SIZE', 1000))
+    app.config['BACKUP_RESTORE_WORKERS'] = int(os.environ.get('BACKUP_RESTORE_WORKERS', 4))
+    
+    # Artefatos dos jobs de relatório (PDF/CSV/XLSX gerados em segundo plano)
+    if is_vercel:
+        relatorios_dir = os.path.join(tempfile.gettempdir(), 'relatorios')
+    else:
+        relatorios_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'relatorios')
+    os.makedirs(relatorios_dir, exist_ok=True)
+    app.config['RELATORIOS_FOLDER'] = relatorios_dir
+    # Na Vercel o job é gerado dentro da própria requisição (ver relatorio_jobs.submeter_job)
+    app.config['RELATORIO_JOBS_SINCRONOS'] = is_vercel or \
+        os.environ.get('RELATORIO_JOBS_SINCRONOS', 'false').lower() == 'true'
     
     # Inicializa o Supabase client
     try:
@@ -92,41 +141,39 @@ def create_app():
         from app.models_supabase import Usuario
         return Usuario.get_by_id(int(user_id))
     
+    # Instrumentação por requisição: chamadas ao Supabase/APIs externas no Server-Timing e em log JSON,
+    # com alerta acima de SUPABASE_CALL_BUDGET chamadas (0 desativa o alerta)
+    app.config['INSTRUMENTATION_ENABLED'] = os.environ.get('INSTRUMENTATION_ENABLED', 'true').lower() == 'true'
+    app.config['SERVER_TIMING_ENABLED'] = os.environ.get('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+    app.config['SUPABASE_CALL_BUDGET'] = int(os.environ.get('SUPABASE_CALL_BUDGET', 10))
+    from app.instrumentacao import init_instrumentacao
+    init_instrumentacao(app)
+    
+    # Métricas Prometheus (GET /metrics): cada processo grava um snapshot em METRICS_DIR, somado no scrape.
+    # Todos os processos da máquina (workers web e worker.py) devem usar a mesma pasta
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'inventario_metricas')
+    app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+    from app.metricas import init_metricas
+    init_metricas(app)
+    
+    # Serialização JSON rápida e compressão das respostas
+    from app.response_layer import init_response_layer
+    init_response_layer(app)
+    
     # Registra as rotas
     from app.routes import main
     app.register_blueprint(main)
     
-    # Configura tarefas agendadas (desabilitadas em ambientes serverless como Vercel)
-    if not is_vercel and os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true':
-        from apscheduler.schedulers.background import BackgroundScheduler
-        from app.routes import realizar_backup_automatico
-        from app.email_service import verificar_e_enviar_notificacoes
-
-        scheduler = BackgroundScheduler()
-
-        # Backup diário às 02:00
-        scheduler.add_job(
-            func=lambda: realizar_backup_automatico(app),
-            trigger='cron',
-            hour=2,
-            minute=0,
-            id='backup_diario',
-            name='Backup Diário do Banco de Dados',
-            replace_existing=True
-        )
-
-        # Verificar notificações de email diariamente às 09:00
-        if app.config['MAIL_ENABLED']:
-            scheduler.add_job(
-                func=lambda: verificar_e_enviar_notificacoes(app),
-                trigger='cron',
-                hour=9,
-                minute=0,
-                id='notificacoes_email',
-                name='Verificar e Enviar Notificações de Email',
-                replace_existing=True
-            )
+    # Tarefas agendadas rodam no processo dedicado `python worker.py`; o processo web só as executa
+    # com SCHEDULER_ENABLED=true (nunca em ambientes serverless como Vercel)
+    app.config['SCHEDULER_THREADS'] = int(os.environ.get('SCHEDULER_THREADS', 4))
+    app.config['WORKER_ENABLED'] = os.environ.get('WORKER_ENABLED', 'false').lower() == 'true'
+    if not is_vercel and os.environ.get('SCHEDULER_ENABLED', 'false').lower() == 'true':
+        from app.agendador import criar_agendador
 
+        scheduler = criar_agendador(app)
         scheduler.start()
 
         # Shutdown do scheduler quando a app terminar
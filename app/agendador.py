@@ -0,0 +1,274 @@
+"""
+Coordenação das tarefas agendadas entre processos
+Cada processo que cria a aplicação tem seu próprio APScheduler; antes de executar, o job
+reivindica a janela atual em agendador_execucoes (ver supabase_init.sql) e só o processo que
+conseguir executa. Durante a execução o lease é renovado; se o dono morrer, outro processo
+assume a execução abandonada. A tabela também serve de histórico de execuções.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from app import metricas
+from app.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+TABELA = 'agendador_execucoes'
+RPC_INEXISTENTE = 'PGRST202'
+
+EXECUTANDO = 'Executando'
+CONCLUIDO = 'Concluído'
+ERRO = 'Erro'
+
+# Identifica este processo no histórico (host:pid:sufixo aleatório)
+DONO = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+# Tempo sem renovação após o qual outro processo pode assumir a execução
+LEASE_SEGUNDOS = int(os.environ.get('SCHEDULER_LEASE_SECONDS', 120))
+# Dias de histórico mantidos
+DIAS_HISTORICO = 30
+
+# job_id -> (funcao, janela_segundos), para retomar execuções abandonadas
+_jobs: Dict[str, Any] = {}
+_sem_coordenacao_avisado = False
+
+
+def janela_atual(janela_segundos: int, agora: Optional[float] = None) -> str:
+    """Início (UTC) da janela de agendamento que contém `agora`"""
+    agora = time.time() if agora is None else agora
+    inicio = int(agora // janela_segundos) * janela_segundos
+    return datetime.utcfromtimestamp(inicio).isoformat()
+
+
+def _reivindicar(job_id: str, janela: str) -> Optional[Dict[str, Any]]:
+    """
+    Linha da execução se este processo deve executar; None se outro processo já executou/está executando.
+    Sem a função SQL (supabase_init.sql não aplicado) executa sem coordenação, como antes.
+    """
+    global _sem_coordenacao_avisado
+    client = get_supabase_client()
+    try:
+        linhas = client.rpc('reivindicar_execucao_job', {
+            'p_job_id': job_id, 'p_janela': janela, 'p_dono': DONO, 'p_lease_segundos': LEASE_SEGUNDOS
+        }).execute().data or []
+        return linhas[0] if linhas else None
+    except Exception as e:
+        if getattr(e, 'code', None) != RPC_INEXISTENTE:
+            raise
+        if not _sem_coordenacao_avisado:
+            logger.warning('Função reivindicar_execucao_job não encontrada no banco; jobs executam sem coordenação')
+            _sem_coordenacao_avisado = True
+        return {}
+
+
+def _renovar_lease(execucao_id: int, parar: threading.Event):
+    """Renova o lease a cada terço do prazo enquanto o job executa"""
+    while not parar.wait(LEASE_SEGUNDOS / 3):
+        try:
+            get_supabase_client().table(TABELA).update({
+                'lease_expira_em': (datetime.utcnow() + timedelta(seconds=LEASE_SEGUNDOS)).isoformat()
+            }).eq('id', execucao_id).eq('dono', DONO).execute()
+        except Exception as e:
+            logger.warning(f'Falha ao renovar lease da execução {execucao_id}: {e}')
+
+
+def _finalizar(execucao_id: int, inicio: float, erro: Optional[str]):
+    get_supabase_client().table(TABELA).update({
+        'status': ERRO if erro else CONCLUIDO,
+        'fim': datetime.utcnow().isoformat(),
+        'duracao_ms': int((time.monotonic() - inicio) * 1000),
+        'erro': erro[:1000] if erro else None
+    }).eq('id', execucao_id).eq('dono', DONO).execute()
+
+
+def executar_uma_vez(app, job_id: str, funcao: Callable[[Any], Any], janela_segundos: int,
+                     janela: Optional[str] = None) -> bool:
+    """
+    Executa funcao(app) se este processo reivindicar a janela do job.
+
+    Returns:
+        True se executou aqui (com ou sem erro), False se outro processo ficou com a execução
+    """
+    janela = janela or janela_atual(janela_segundos)
+    with app.app_context():
+        try:
+            execucao = _reivindicar(job_id, janela)
+        except Exception as e:
+            logger.error(f'Erro ao reivindicar o job {job_id}: {e}', exc_info=True)
+            return False
+    if execucao is None:
+        logger.info(f'Job {job_id} ({janela}) já executado/em execução em outro processo')
+        return False
+
+    execucao_id = execucao.get('id')
+    parar = threading.Event()
+    if execucao_id:
+        threading.Thread(target=_renovar_lease, args=(execucao_id, parar), name=f'lease-{job_id}', daemon=True).start()
+
+    inicio = time.monotonic()
+    erro = None
+    try:
+        if funcao(app) is False:
+            erro = 'Job retornou falha'
+    except Exception as e:
+        logger.error(f'Erro ao executar o job {job_id}: {e}', exc_info=True)
+        erro = str(e) or type(e).__name__
+    finally:
+        parar.set()
+    metricas.observar('agendador_job_duracao_segundos', time.monotonic() - inicio,
+                      job=job_id, status='erro' if erro else 'sucesso')
+    metricas.salvar(forcar=True)
+
+    if execucao_id:
+        with app.app_context():
+            try:
+                _finalizar(execucao_id, inicio, erro)
+            except Exception as e:
+                logger.warning(f'Falha ao registrar o fim da execução {execucao_id}: {e}')
+    return True
+
+
+def registrar_job(scheduler, app, job_id: str, funcao: Callable[[Any], Any], nome: str,
+                  janela_segundos: int, **trigger):
+    """
+    Agenda funcao(app) no APScheduler com execução única no cluster.
+
+    Args:
+        janela_segundos: granularidade da deduplicação (ex.: 86400 para jobs diários,
+                         o intervalo para jobs periódicos)
+        trigger: argumentos do gatilho do APScheduler (trigger='cron', hour=2, ...)
+    """
+    _jobs[job_id] = (funcao, janela_segundos)
+    scheduler.add_job(
+        func=lambda: executar_uma_vez(app, job_id, funcao, janela_segundos),
+        id=job_id,
+        name=nome,
+        replace_existing=True,
+        **trigger
+    )
+
+
+def retomar_abandonadas(app) -> int:
+    """
+    Failover: assume execuções cujo dono parou de renovar o lease (processo morto) e
+    remove o histórico antigo. Agendado em todos os processos; a reivindicação garante um só executor.
+    """
+    with app.app_context():
+        client = get_supabase_client()
+        agora = datetime.utcnow()
+        abandonadas = client.table(TABELA).select('job_id, janela').eq('status', EXECUTANDO) \
+            .lt('lease_expira_em', agora.isoformat()).in_('job_id', list(_jobs) or ['']) \
+            .limit(20).execute().data or []
+        client.table(TABELA).delete().neq('status', EXECUTANDO) \
+            .lt('inicio', (agora - timedelta(days=DIAS_HISTORICO)).isoformat()).execute()
+
+    retomadas = 0
+    for execucao in abandonadas:
+        funcao, janela_segundos = _jobs[execucao['job_id']]
+        logger.warning(f'Retomando execução abandonada do job {execucao["job_id"]} ({execucao["janela"]})')
+        if executar_uma_vez(app, execucao['job_id'], funcao, janela_segundos, janela=execucao['janela']):
+            retomadas += 1
+    return retomadas
+
+
+def listar_execucoes(job_id: Optional[str] = None, limite: int = 50) -> List[Dict[str, Any]]:
+    """Histórico de execuções, mais recentes primeiro"""
+    client = get_supabase_client()
+    query = client.table(TABELA).select('*')
+    if job_id:
+        query = query.eq('job_id', job_id)
+    return query.order('inicio', desc=True).limit(limite).execute().data or []
+
+
+def criar_agendador(app, bloqueante: bool = False):
+    """
+    Cria o APScheduler com todas as tarefas da aplicação (sem iniciar).
+
+    Args:
+        bloqueante: BlockingScheduler para o processo worker (worker.py); BackgroundScheduler
+                    quando as tarefas rodam dentro do processo web (SCHEDULER_ENABLED=true)
+    """
+    from apscheduler.executors.pool import ThreadPoolExecutor
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from app.routes import realizar_backup_automatico
+    from app.email_service import verificar_e_enviar_notificacoes
+    from app.relatorio_jobs import manutencao_jobs, processar_pendentes
+    from app.financeiro_service import atualizar_metricas_agendado
+    from app.coleta_fotos import coletar_fotos_agendado
+
+    classe = BlockingScheduler if bloqueante else BackgroundScheduler
+    scheduler = classe(
+        executors={'default': ThreadPoolExecutor(app.config.get('SCHEDULER_THREADS', 4))},
+        job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 300}
+    )
+    # Usado pelos jobs de relatório para agendar a execução imediata
+    app.extensions['scheduler'] = scheduler
+
+    # Cada job executa uma única vez no cluster por janela, mesmo com vários processos criando a aplicação
+    dia = 24 * 60 * 60
+
+    # Backup diário às 02:00
+    registrar_job(
+        scheduler, app, 'backup_diario', realizar_backup_automatico,
+        'Backup Diário do Banco de Dados', dia,
+        trigger='cron', hour=2, minute=0
+    )
+
+    # Indicadores financeiros (ROI/depreciação) por equipamento diariamente às 01:30
+    registrar_job(
+        scheduler, app, 'metricas_equipamentos', atualizar_metricas_agendado,
+        'Recalcular Indicadores Financeiros dos Equipamentos', dia,
+        trigger='cron', hour=1, minute=30
+    )
+
+    # Fotos órfãs (equipamentos excluídos/fotos substituídas) diariamente às 03:30
+    registrar_job(
+        scheduler, app, 'coleta_fotos', coletar_fotos_agendado,
+        'Coletar Fotos Órfãs', dia,
+        trigger='cron', hour=3, minute=30
+    )
+
+    # Verificar notificações de email diariamente às 09:00
+    if app.config['MAIL_ENABLED']:
+        registrar_job(
+            scheduler, app, 'notificacoes_email', verificar_e_enviar_notificacoes,
+            'Verificar e Enviar Notificações de Email', dia,
+            trigger='cron', hour=9, minute=0
+        )
+
+    # Jobs de relatório: retoma pendentes e remove artefatos expirados
+    registrar_job(
+        scheduler, app, 'relatorio_jobs', manutencao_jobs,
+        'Manutenção dos Jobs de Relatório', 5 * 60,
+        trigger='interval', minutes=5
+    )
+
+    # Failover: assume execuções de processos que morreram sem concluir
+    scheduler.add_job(
+        func=lambda: retomar_abandonadas(app),
+        trigger='interval',
+        minutes=1,
+        id='retomar_execucoes',
+        name='Retomar Execuções Abandonadas',
+        replace_existing=True
+    )
+
+    if bloqueante:
+        # Consumidor da fila de relatórios: o processo web (WORKER_ENABLED=true) só registra o job
+        scheduler.add_job(
+            func=lambda: processar_pendentes(app),
+            trigger='interval',
+            seconds=int(os.environ.get('WORKER_POLL_SECONDS', 5)),
+            id='consumir_relatorios',
+            name='Consumir Fila de Relatórios',
+            replace_existing=True
+        )
+
+    return scheduler
@@ -0,0 +1,208 @@
+"""
+Auditoria de inventário físico
+As leituras (números de série dos QR Codes) são gravadas em lotes no conjunto auditoria_leituras
+e reconciliadas contra equipamentos.numero_serie numa única consulta por conjunto
+(função reconciliar_auditoria em supabase_init.sql).
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.supabase_client import get_supabase_client
+from app.export_service import paginar
+
+logger = logging.getLogger(__name__)
+
+
+# Leituras por upsert
+TAMANHO_LOTE_LEITURAS = 1000
+RPC_INEXISTENTE = 'PGRST202'
+
+# Status esperados para equipamentos fisicamente presentes / que não deveriam estar no local
+STATUS_PRESENTES = ('Estoque', 'Manutenção')
+STATUS_AUSENTES = ('Emprestado', 'Inativo')
+SITUACOES = ('faltante', 'inesperado', 'status_divergente')
+
+
+def criar_auditoria(nome: str, departamento: Optional[str] = None, tipo: Optional[str] = None,
+                    usuario_id: Optional[int] = None) -> Dict[str, Any]:
+    """Abre uma sessão de auditoria (opcionalmente restrita a um departamento e/ou tipo)"""
+    if not nome:
+        raise ValueError('Informe o nome da auditoria')
+    client = get_supabase_client()
+    dados = {
+        'nome': nome,
+        'departamento': departamento or None,
+        'tipo': tipo or None,
+        'usuario_id': usuario_id,
+        'status': 'Aberta',
+        'data_inicio': datetime.utcnow().isoformat()
+    }
+    response = client.table('auditorias').insert(dados).execute()
+    return response.data[0]
+
+
+def obter_auditoria(auditoria_id: int) -> Optional[Dict[str, Any]]:
+    client = get_supabase_client()
+    response = client.table('auditorias').select('*').eq('id', auditoria_id).execute()
+    return response.data[0] if response.data else None
+
+
+def listar_auditorias() -> List[Dict[str, Any]]:
+    client = get_supabase_client()
+    response = client.table('auditorias').select(
+        'id,nome,departamento,tipo,status,usuario_id,data_inicio,data_fim'
+    ).order('data_inicio', desc=True).execute()
+    return response.data or []
+
+
+# Linhas do conteúdo do QR Code (ver gerar_qrcode) que não são o número de série
+PREFIXOS_QR_IGNORADOS = ('ID:', 'Nome:', 'Marca:', 'Modelo:')
+
+
+def extrair_numero_serie(leitura: Optional[str]) -> Optional[str]:
+    """
+    Aceita o número de série puro ou o texto completo da etiqueta gerada por gerar_qrcode
+    ("ID: 1\nNome: ...\nN° Série: ABC123\n...").
+    """
+    leitura = (leitura or '').strip()
+    if 'Série:' in leitura:
+        return leitura.split('Série:', 1)[1].split('\n', 1)[0].strip() or None
+    if leitura.startswith(PREFIXOS_QR_IGNORADOS):
+        return None
+    return leitura or None
+
+
+def registrar_leituras(auditoria_id: int, numeros_serie: Iterable[str],
+                       tamanho_lote: int = TAMANHO_LOTE_LEITURAS) -> int:
+    """
+    Grava as leituras em upserts de `tamanho_lote` linhas; repetições são ignoradas pelo banco.
+
+    Returns:
+        Quantidade de números de série distintos recebidos nesta chamada
+    """
+    client = get_supabase_client()
+    agora = datetime.utcnow().isoformat()
+    vistos = set()
+    lote = []
+
+    def gravar():
+        client.table('auditoria_leituras').upsert(
+            [{'auditoria_id': auditoria_id, 'numero_serie': ns, 'data_leitura': agora} for ns in lote],
+            on_conflict='auditoria_id,numero_serie',
+            ignore_duplicates=True
+        ).execute()
+
+    for numero_serie in numeros_serie:
+        numero_serie = extrair_numero_serie(numero_serie)
+        if not numero_serie or numero_serie in vistos:
+            continue
+        vistos.add(numero_serie)
+        lote.append(numero_serie)
+        if len(lote) >= tamanho_lote:
+            gravar()
+            lote = []
+    if lote:
+        gravar()
+    return len(vistos)
+
+
+def contar_leituras(auditoria_id: int) -> int:
+    client = get_supabase_client()
+    response = client.table('auditoria_leituras').select('numero_serie', count='exact') \
+        .eq('auditoria_id', auditoria_id).limit(1).execute()
+    return response.count or 0
+
+
+def _divergencias_rpc(auditoria_id: int) -> Iterator[Dict[str, Any]]:
+    client = get_supabase_client()
+    # numero_serie é único no resultado (junção completa por número de série)
+    yield from paginar(
+        lambda: client.rpc('reconciliar_auditoria', {'p_auditoria_id': auditoria_id}),
+        coluna_ordem='numero_serie'
+    )
+
+
+def _divergencias_em_memoria(auditoria: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Mesma reconciliação da função SQL, com conjuntos em Python (banco sem a função)"""
+    client = get_supabase_client()
+
+    def montar_equipamentos():
+        query = client.table('equipamentos').select('id,numero_serie,nome,tipo,status,departamento_atual')
+        if auditoria.get('departamento'):
+            query = query.eq('departamento_atual', auditoria['departamento'])
+        if auditoria.get('tipo'):
+            query = query.eq('tipo', auditoria['tipo'])
+        return query
+
+    escopo = {eq['numero_serie']: eq for eq in paginar(montar_equipamentos)}
+    lidos = {
+        leitura['numero_serie'] for leitura in paginar(
+            lambda: client.table('auditoria_leituras').select('numero_serie').eq('auditoria_id', auditoria['id']),
+            coluna_ordem='numero_serie'
+        )
+    }
+
+    def linha(situacao, numero_serie, eq=None):
+        eq = eq or {}
+        return {
+            'situacao': situacao, 'numero_serie': numero_serie, 'equipamento_id': eq.get('id'),
+            'nome': eq.get('nome'), 'tipo': eq.get('tipo'), 'status': eq.get('status'),
+            'departamento_atual': eq.get('departamento_atual')
+        }
+
+    for numero_serie, eq in escopo.items():
+        if numero_serie not in lidos and eq.get('status') in STATUS_PRESENTES:
+            yield linha('faltante', numero_serie, eq)
+    for numero_serie in lidos - escopo.keys():
+        yield linha('inesperado', numero_serie)
+    for numero_serie in lidos & escopo.keys():
+        if escopo[numero_serie].get('status') in STATUS_AUSENTES:
+            yield linha('status_divergente', numero_serie, escopo[numero_serie])
+
+
+def reconciliar(auditoria: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compara as leituras da auditoria com o cadastro.
+
+    Returns:
+        {'resumo': {...contagens}, 'faltantes': [...], 'inesperados': [...], 'status_divergentes': [...]}
+    """
+    try:
+        divergencias = list(_divergencias_rpc(auditoria['id']))
+    except Exception as e:
+        if getattr(e, 'code', None) != RPC_INEXISTENTE:
+            raise
+        logger.warning('Função reconciliar_auditoria não encontrada no banco; reconciliando em memória')
+        divergencias = list(_divergencias_em_memoria(auditoria))
+
+    por_situacao = {situacao: [] for situacao in SITUACOES}
+    for divergencia in divergencias:
+        por_situacao.setdefault(divergencia['situacao'], []).append(divergencia)
+
+    total_lidos = contar_leituras(auditoria['id'])
+    resumo = {
+        'total_lidos': total_lidos,
+        'conferidos': total_lidos - len(por_situacao['inesperado']) - len(por_situacao['status_divergente']),
+        'faltantes': len(por_situacao['faltante']),
+        'inesperados': len(por_situacao['inesperado']),
+        'status_divergentes': len(por_situacao['status_divergente'])
+    }
+    return {
+        'resumo': resumo,
+        'faltantes': por_situacao['faltante'],
+        'inesperados': por_situacao['inesperado'],
+        'status_divergentes': por_situacao['status_divergente']
+    }
+
+
+def finalizar_auditoria(auditoria: Dict[str, Any]) -> Dict[str, Any]:
+    """Reconcilia, grava o resumo e fecha a sessão (novas leituras deixam de ser aceitas)"""
+    resultado = reconciliar(auditoria)
+    client = get_supabase_client()
+    client.table('auditorias').update({
+        'status': 'Finalizada',
+        'resumo': resultado['resumo'],
+        'data_fim': datetime.utcnow().isoformat()
+    }).eq('id', auditoria['id']).execute()
+    return resultado
@@ -0,0 +1,617 @@
+"""
+Backups lógicos do banco (Supabase) com armazenamento deduplicado
+Cada snapshot guarda todas as linhas das tabelas copiadas, em NDJSON ordenado por id e dividido em
+chunks endereçados pelo conteúdo (SHA-256). Os chunks ficam uma única vez em disco e os snapshots
+são só manifestos que listam os chunks de cada tabela:
+
+    BACKUP_FOLDER/chunks/<ab>/<sha256>.gz     NDJSON comprimido de um trecho da tabela
+    BACKUP_FOLDER/snapshots/<nome>.json       manifesto: tabelas -> chunks, linhas, marca d'água
+
+As fronteiras dos chunks dependem do conteúdo das linhas (não da posição), então uma inserção ou
+alteração muda só os chunks em volta dela. O snapshot incremental lê do banco apenas as linhas com
+data_atualizacao posterior à marca d'água e a lista de ids, e reaproveita o restante do snapshot
+anterior: tempo de backup e espaço em disco crescem com as alterações, não com o tamanho das tabelas.
+A retenção é avô-pai-filho (diária/semanal/mensal) e os chunks sem referência são coletados depois.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from app.export_service import paginar
+from app.supabase_client import get_supabase_client
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre backup e coleta (resta a carência de CARENCIA_COLETA)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# Tabelas copiadas, na ordem de dependência (chaves estrangeiras)
+TABELAS = ('usuarios', 'equipamentos', 'emprestimos', 'equipamentos_fotos', 'manutencoes', 'push_subscriptions')
+COLUNA_ALTERACAO = 'data_atualizacao'
+# Colunas GENERATED ALWAYS (ver supabase_init.sql): vêm no select('*') do backup, mas o Postgres
+# rejeita upserts que as informem, então a restauração as descarta
+COLUNAS_GERADAS = {'equipamentos': frozenset({'busca'})}
+COLUNA_INEXISTENTE = '42703'
+
+COMPLETO = 'completo'
+INCREMENTAL = 'incremental'
+PASTA_CHUNKS = 'chunks'
+PASTA_SNAPSHOTS = 'snapshots'
+PADRAO_LEGADO = 'backup_*.db'  # cópias SQLite da versão anterior (só download/exclusão)
+
+# Fronteira de chunk: linha cujo CRC32 é múltiplo de DIVISOR_CHUNK, respeitando mínimo e máximo
+# de linhas (chunks de ~500 linhas em média)
+MINIMO_LINHAS_CHUNK = 32
+DIVISOR_CHUNK = 512
+MAXIMO_LINHAS_CHUNK = 4096
+
+# Linhas alteradas durante o backup anterior podem ter data_atualizacao um pouco menor que a
+# marca d'água gravada; o incremental relê essa margem
+MARGEM_MARCA_DAGUA = timedelta(minutes=5)
+# Chunks gravados (ou reaproveitados) há menos tempo que isso não são coletados: podem pertencer
+# a um snapshot ainda em andamento
+CARENCIA_COLETA = timedelta(hours=6)
+TAMANHO_BLOCO = 64 * 1024
+ARQUIVO_TRAVA = '.trava'
+
+
+@contextmanager
+def _trava(pasta: str, exclusiva: bool):
+    """
+    Trava de arquivo da pasta de backups: compartilhada enquanto um snapshot é gerado (vários podem
+    rodar juntos), exclusiva na coleta de lixo, que assim não remove um chunk reaproveitado por um
+    snapshot cujo manifesto ainda não foi gravado
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(pasta, exist_ok=True)
+    with open(os.path.join(pasta, ARQUIVO_TRAVA), 'a') as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH)
+        yield
+
+
+# ==================== CHUNKS ====================
+
+def _caminho_chunk(pasta: str, hash_: str) -> str:
+    return os.path.join(pasta, PASTA_CHUNKS, hash_[:2], f'{hash_}.gz')
+
+
+def _gravar_chunk(pasta: str, dados: bytes, linhas: int) -> Dict[str, Any]:
+    """Grava o chunk se ainda não existir (deduplicação); chunks reaproveitados têm o mtime renovado"""
+    hash_ = hashlib.sha256(dados).hexdigest()
+    caminho = _caminho_chunk(pasta, hash_)
+    novo = not os.path.exists(caminho)
+    if novo:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        with open(temporario, 'wb') as f:
+            # mtime=0: o mesmo conteúdo gera sempre o mesmo arquivo comprimido
+            with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                gz.write(dados)
+        os.replace(temporario, caminho)
+    else:
+        os.utime(caminho)
+    return {'hash': hash_, 'linhas': linhas, 'bytes': len(dados),
+            'bytes_comprimidos': os.path.getsize(caminho), 'novo': novo}
+
+
+def ler_chunk(pasta: str, hash_: str, verificar: bool = False) -> bytes:
+    with gzip.open(_caminho_chunk(pasta, hash_), 'rb') as f:
+        dados = f.read()
+    if verificar and hashlib.sha256(dados).hexdigest() != hash_:
+        raise ValueError(f'Checksum divergente no chunk {hash_}')
+    return dados
+
+
+class _Fatiador:
+    """Divide as linhas NDJSON em chunks com fronteiras definidas pelo conteúdo"""
+
+    def __init__(self, pasta: str):
+        self.pasta = pasta
+        self.chunks: List[Dict[str, Any]] = []
+        self._linhas: List[bytes] = []
+
+    def adicionar(self, linha: bytes):
+        self._linhas.append(linha)
+        quantidade = len(self._linhas)
+        if quantidade >= MAXIMO_LINHAS_CHUNK or \
+                (quantidade >= MINIMO_LINHAS_CHUNK and zlib.crc32(linha) % DIVISOR_CHUNK == 0):
+            self._fechar()
+
+    def finalizar(self) -> List[Dict[str, Any]]:
+        if self._linhas:
+            self._fechar()
+        return self.chunks
+
+    def _fechar(self):
+        self.chunks.append(_gravar_chunk(self.pasta, b''.join(self._linhas), len(self._linhas)))
+        self._linhas = []
+
+
+# ==================== SNAPSHOTS ====================
+
+def _serializar(linha: Dict[str, Any]) -> bytes:
+    # Chaves ordenadas: a mesma linha gera sempre os mesmos bytes (e os mesmos chunks)
+    return (json.dumps(linha, ensure_ascii=False, default=str, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _caminho_manifesto(pasta: str, nome: str) -> str:
+    return os.path.join(pasta, PASTA_SNAPSHOTS, f'{os.path.basename(nome)}.json')
+
+
+def ler_manifesto(pasta: str, nome: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_caminho_manifesto(pasta, nome), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def listar_manifestos(pasta: str) -> List[Dict[str, Any]]:
+    """Manifestos dos snapshots, do mais recente ao mais antigo"""
+    manifestos = []
+    for caminho in glob.glob(os.path.join(pasta, PASTA_SNAPSHOTS, '*.json')):
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                manifestos.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f'Manifesto ilegível {os.path.basename(caminho)}: {e}')
+    return sorted(manifestos, key=lambda m: m['criado_em'], reverse=True)
+
+
+def linhas_brutas(pasta: str, manifesto: Dict[str, Any], tabela: str,
+                  verificar: bool = False) -> Iterator[bytes]:
+    """Linhas NDJSON da tabela no snapshot, em ordem de id"""
+    for chunk in (manifesto['tabelas'].get(tabela) or {}).get('chunks', []):
+        yield from ler_chunk(pasta, chunk['hash'], verificar).splitlines(keepends=True)
+
+
+def _linhas_banco(tabela: str, desde: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    client = get_supabase_client()
+
+    def montar_query():
+        query = client.table(tabela).select('*')
+        return query.gte(COLUNA_ALTERACAO, desde) if desde else query
+
+    yield from paginar(montar_query)
+
+
+def _ids_banco(tabela: str) -> Iterator[int]:
+    client = get_supabase_client()
+    for linha in paginar(lambda: client.table(tabela).select('id')):
+        yield linha['id']
+
+
+def _buscar_linha(tabela: str, id_: int) -> Optional[Dict[str, Any]]:
+    linhas = get_supabase_client().table(tabela).select('*').eq('id', id_).limit(1).execute().data
+    return linhas[0] if linhas else None
+
+
+def _mesclar(tabela: str, anteriores: Iterator[bytes], alteradas: Iterator[Dict[str, Any]],
+             ids: Iterator[int]) -> Iterator[Tuple[bytes, Optional[Dict[str, Any]]]]:
+    """
+    Junta (em ordem de id) as linhas do snapshot anterior com as alteradas desde a marca d'água,
+    mantendo só os ids que ainda existem no banco. Devolve (linha serializada, linha lida do banco ou None).
+    """
+    def com_id(linhas):
+        for linha in linhas:
+            yield json.loads(linha)['id'], linha
+
+    anteriores_ = com_id(anteriores)
+    anterior = next(anteriores_, None)
+    alterada = next(alteradas, None)
+    for id_ in ids:
+        while anterior is not None and anterior[0] < id_:
+            anterior = next(anteriores_, None)
+        while alterada is not None and alterada['id'] < id_:
+            alterada = next(alteradas, None)
+        if alterada is not None and alterada['id'] == id_:
+            yield _serializar(alterada), alterada
+        elif anterior is not None and anterior[0] == id_:
+            yield anterior[1], None
+        else:
+            # Linha sem alteração recente que não estava no snapshot anterior (ex.: relógio fora da margem)
+            linha = _buscar_linha(tabela, id_)
+            if linha:
+                yield _serializar(linha), linha
+
+
+def _snapshot_tabela(pasta: str, tabela: str, anterior: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Grava os chunks de uma tabela; incremental quando há snapshot anterior com marca d'água"""
+    info_anterior = (anterior or {}).get('tabelas', {}).get(tabela) or {}
+    desde = _marca_dagua_inicial(info_anterior.get('marca_dagua')) if anterior else None
+
+    fatiador = _Fatiador(pasta)
+    linhas, lidas_do_banco, marca_dagua = 0, 0, info_anterior.get('marca_dagua')
+
+    if desde:
+        try:
+            alteradas = _linhas_banco(tabela, desde)
+            primeira = next(alteradas, None)  # erro de coluna inexistente aparece aqui
+        except Exception as e:
+            if getattr(e, 'code', None) != COLUNA_INEXISTENTE:
+                raise
+            logger.warning(f'Tabela {tabela} sem a coluna {COLUNA_ALTERACAO}; lendo a tabela inteira')
+            desde = None
+        else:
+            def alteradas_completas():
+                if primeira is not None:
+                    yield primeira
+                yield from alteradas
+            fonte = _mesclar(tabela, linhas_brutas(pasta, anterior, tabela), alteradas_completas(), _ids_banco(tabela))
+
+    if not desde:
+        marca_dagua = None
+        fonte = ((_serializar(linha), linha) for linha in _linhas_banco(tabela))
+
+    for serializada, do_banco in fonte:
+        fatiador.adicionar(serializada)
+        linhas += 1
+        if do_banco is not None:
+            lidas_do_banco += 1
+            alteracao = do_banco.get(COLUNA_ALTERACAO)
+            if alteracao and (marca_dagua is None or str(alteracao) > marca_dagua):
+                marca_dagua = str(alteracao)
+
+    chunks = fatiador.finalizar()
+    return {
+        'modo': INCREMENTAL if desde else COMPLETO,
+        'linhas': linhas,
+        'linhas_lidas': lidas_do_banco,
+        'bytes': sum(c['bytes'] for c in chunks),
+        'marca_dagua': marca_dagua,
+        'chunks_novos': sum(c.pop('novo') for c in chunks),
+        'chunks': chunks
+    }
+
+
+def _marca_dagua_inicial(marca_dagua: Optional[str]) -> Optional[str]:
+    if not marca_dagua:
+        return None
+    try:
+        inicio = datetime.fromisoformat(marca_dagua.replace('Z', '+00:00')) - MARGEM_MARCA_DAGUA
+    except ValueError:
+        return None
+    return inicio.replace(tzinfo=None).isoformat()
+
+
+def _ultima_leitura_completa(manifestos: List[Dict[str, Any]]) -> Optional[datetime]:
+    for manifesto in manifestos:
+        if manifesto['modo'] == COMPLETO:
+            return datetime.fromisoformat(manifesto['criado_em'])
+    return None
+
+
+def criar_backup(pasta: str, origem: str = 'auto', incremental: Optional[bool] = None,
+                 dias_completo: int = 7) -> Dict[str, Any]:
+    """
+    Gera um snapshot em `pasta`. Todo snapshot é completo para a restauração; o modo indica só
+    como ele foi lido do banco.
+
+    Args:
+        origem: 'auto' ou 'manual' (aparece no nome)
+        incremental: True/False força o modo; None lê o banco inteiro a cada dias_completo dias
+                     (verificação periódica) e faz incrementais nos demais
+
+    Returns:
+        Manifesto do snapshot gerado
+    """
+    with _trava(pasta, exclusiva=False):
+        manifestos = listar_manifestos(pasta)
+        anterior = manifestos[0] if manifestos else None
+        if incremental is None:
+            ultima_completa = _ultima_leitura_completa(manifestos)
+            incremental = ultima_completa is not None and \
+                datetime.utcnow() - ultima_completa < timedelta(days=dias_completo)
+        if not anterior:
+            incremental = False
+
+        agora = datetime.utcnow()
+        nome = f'backup_{origem}_{agora.strftime("%Y%m%d_%H%M%S")}'
+        manifesto: Dict[str, Any] = {
+            'versao': 2,
+            'nome': nome,
+            'origem': origem,
+            'criado_em': agora.isoformat(),
+            'modo': INCREMENTAL if incremental else COMPLETO,
+            'base': anterior['nome'] if incremental else None,
+            'tabelas': {}
+        }
+        for tabela in TABELAS:
+            manifesto['tabelas'][tabela] = _snapshot_tabela(pasta, tabela, anterior if incremental else None)
+
+        caminho = _caminho_manifesto(pasta, nome)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f'{caminho}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, ensure_ascii=False, indent=1)
+        os.replace(temporario, caminho)
+
+    tabelas = manifesto['tabelas'].values()
+    logger.info(
+        f'Backup {manifesto["modo"]} {nome}: {sum(t["linhas"] for t in tabelas)} linhas, '
+        f'{sum(t["linhas_lidas"] for t in tabelas)} lidas do banco, {sum(t["chunks_novos"] for t in tabelas)} chunks novos'
+    )
+    return manifesto
+
+
+def verificar_backup(pasta: str, nome: str) -> List[str]:
+    """Confere o SHA-256 de cada chunk do snapshot; retorna os problemas encontrados"""
+    manifesto = ler_manifesto(pasta, nome)
+    if not manifesto:
+        return ['Manifesto ausente ou ilegível']
+    problemas = []
+    for tabela, info in manifesto['tabelas'].items():
+        for chunk in info['chunks']:
+            try:
+                ler_chunk(pasta, chunk['hash'], verificar=True)
+            except FileNotFoundError:
+                problemas.append(f'{tabela}: chunk {chunk["hash"][:12]} ausente')
+            except (OSError, ValueError, EOFError) as e:
+                problemas.append(f'{tabela}: chunk {chunk["hash"][:12]} inválido ({e})')
+    return problemas
+
+
+def remover_snapshot(pasta: str, nome: str) -> bool:
+    """Remove o manifesto; os chunks sem outra referência saem na próxima coleta"""
+    try:
+        os.remove(_caminho_manifesto(pasta, nome))
+    except FileNotFoundError:
+        return False
+    try:
+        os.remove(_caminho_digest(pasta, nome))
+    except FileNotFoundError:
+        pass
+    return True
+
+
+# ==================== LISTAGEM E TAMANHOS ====================
+
+def _formatar_mb(tamanho: int) -> str:
+    return f'{tamanho / (1024 * 1024):.2f} MB'
+
+
+def arquivos_legados(pasta: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(pasta, PADRAO_LEGADO)), key=os.path.getmtime, reverse=True)
+
+
+def uso_disco(pasta: str) -> Dict[str, int]:
+    """Bytes ocupados pelos chunks e pelos manifestos"""
+    chunks = arquivos = 0
+    for caminho in glob.glob(os.path.join(pasta, PASTA_CHUNKS, '*', '*.gz')):
+        chunks += os.path.getsize(caminho)
+        arquivos += 1
+    manifestos = sum(os.path.getsize(c) for c in glob.glob(os.path.join(pasta, PASTA_SNAPSHOTS, '*.json')))
+    return {'chunks': arquivos, 'bytes_chunks': chunks, 'bytes_manifestos': manifestos}
+
+
+def listar_backups(pasta: str) -> Dict[str, Any]:
+    """
+    Snapshots (mais recentes primeiro) com tamanho lógico (NDJSON sem compressão), armazenado
+    (chunks referenciados, comprimidos) e novo (chunks que este snapshot acrescentou ao disco),
+    mais os backups SQLite legados e o total físico em disco.
+    """
+    manifestos = listar_manifestos(pasta)
+    vistos: Set[str] = set()
+    novos_por_snapshot: Dict[str, int] = {}
+    for manifesto in reversed(manifestos):
+        novos = 0
+        for info in manifesto['tabelas'].values():
+            for chunk in info['chunks']:
+                if chunk['hash'] not in vistos:
+                    vistos.add(chunk['hash'])
+                    novos += chunk['bytes_comprimidos']
+        novos_por_snapshot[manifesto['nome']] = novos
+
+    backups = []
+    for manifesto in manifestos:
+        tabelas = manifesto['tabelas']
+        logico = sum(info['bytes'] for info in tabelas.values())
+        unicos = {c['hash']: c['bytes_comprimidos'] for info in tabelas.values() for c in info['chunks']}
+        criado_em = datetime.fromisoformat(manifesto['criado_em'])
+        backups.append({
+            'nome': manifesto['nome'],
+            'tamanho': _formatar_mb(logico),
+            'tamanho_logico_bytes': logico,
+            'tamanho_armazenado_bytes': sum(unicos.values()),
+            'tamanho_novo_bytes': novos_por_snapshot[manifesto['nome']],
+            'data': criado_em.strftime('%d/%m/%Y %H:%M:%S'),
+            'timestamp': criado_em.timestamp(),
+            'tipo': 'Manual' if manifesto['origem'] == 'manual' else 'Automático',
+            'modo': manifesto['modo'],
+            'linhas': {tabela: info['linhas'] for tabela, info in tabelas.items()}
+        })
+
+    for caminho in arquivos_legados(pasta):
+        tamanho = os.path.getsize(caminho)
+        data_modificacao = datetime.fromtimestamp(os.path.getmtime(caminho))
+        backups.append({
+            'nome': os.path.basename(caminho),
+            'tamanho': _formatar_mb(tamanho),
+            'tamanho_logico_bytes': tamanho,
+            'tamanho_armazenado_bytes': tamanho,
+            'tamanho_novo_bytes': tamanho,
+            'data': data_modificacao.strftime('%d/%m/%Y %H:%M:%S'),
+            'timestamp': data_modificacao.timestamp(),
+            'tipo': 'Manual' if 'manual' in caminho else 'Automático',
+            'modo': 'sqlite',
+            'linhas': {}
+        })
+
+    disco = uso_disco(pasta)
+    logico_total = sum(b['tamanho_logico_bytes'] for b in backups)
+    fisico_total = disco['bytes_chunks'] + disco['bytes_manifestos'] + \
+        sum(os.path.getsize(c) for c in arquivos_legados(pasta))
+    return {
+        'backups': backups,
+        'armazenamento': {
+            'logico_bytes': logico_total,
+            'fisico_bytes': fisico_total,
+            'logico': _formatar_mb(logico_total),
+            'fisico': _formatar_mb(fisico_total),
+            'chunks': disco['chunks'],
+            'reducao': round(logico_total / fisico_total, 1) if fisico_total else None
+        }
+    }
+
+
+# ==================== RETENÇÃO E COLETA ====================
+
+def snapshots_retidos(manifestos: List[Dict[str, Any]], diarios: int, semanais: int, mensais: int,
+                      hoje: Optional[datetime] = None) -> Set[str]:
+    """
+    Avô-pai-filho: o snapshot mais recente de cada um dos últimos `diarios` dias, `semanais`
+    semanas (ISO) e `mensais` meses. O snapshot mais recente é sempre mantido.
+    """
+    hoje = hoje or datetime.utcnow()
+    retidos: Set[str] = set()
+    periodos = (
+        (diarios, lambda d: d.date(), timedelta(days=diarios)),
+        (semanais, lambda d: tuple(d.isocalendar()[:2]), timedelta(weeks=semanais)),
+        (mensais, lambda d: (d.year, d.month), timedelta(days=31 * mensais)),
+    )
+    for quantidade, periodo, janela in periodos:
+        vistos = set()
+        for manifesto in manifestos:  # do mais recente ao mais antigo
+            criado_em = datetime.fromisoformat(manifesto['criado_em'])
+            chave = periodo(criado_em)
+            if chave in vistos or len(vistos) >= quantidade or hoje - criado_em > janela:
+                continue
+            vistos.add(chave)
+            retidos.add(manifesto['nome'])
+    if manifestos:
+        retidos.add(manifestos[0]['nome'])
+    return retidos
+
+
+def aplicar_retencao(pasta: str, diarios: int = 7, semanais: int = 4, mensais: int = 12) -> List[str]:
+    """Remove os manifestos fora da política avô-pai-filho; retorna os nomes removidos"""
+    manifestos = listar_manifestos(pasta)
+    retidos = snapshots_retidos(manifestos, diarios, semanais, mensais)
+    removidos = []
+    for manifesto in manifestos:
+        if manifesto['nome'] not in retidos and remover_snapshot(pasta, manifesto['nome']):
+            logger.info(f'Snapshot removido pela retenção: {manifesto["nome"]}')
+            removidos.append(manifesto['nome'])
+    return removidos
+
+
+def coletar_lixo(pasta: str, carencia: timedelta = CARENCIA_COLETA) -> Tuple[int, int]:
+    """
+    Remove chunks que nenhum manifesto referencia (e mais antigos que a carência). Roda com a trava
+    exclusiva da pasta: espera os snapshots em andamento gravarem o manifesto.
+
+    Returns:
+        (chunks removidos, bytes liberados)
+    """
+    limite = (datetime.now() - carencia).timestamp()
+    removidos = liberados = 0
+    with _trava(pasta, exclusiva=True):
+        referenciados = {
+            chunk['hash'] for manifesto in listar_manifestos(pasta)
+            for info in manifesto['tabelas'].values() for chunk in info['chunks']
+        }
+        for caminho in glob.glob(os.path.join(pasta, PASTA_CHUNKS, '*', '*')):
+            hash_ = os.path.basename(caminho).split('.')[0]
+            if hash_ in referenciados or os.path.getmtime(caminho) > limite:
+                continue
+            liberados += os.path.getsize(caminho)
+            os.remove(caminho)
+            removidos += 1
+    if removidos:
+        logger.info(f'Coleta de backups: {removidos} chunk(s) sem referência removido(s), {liberados} bytes')
+    return removidos, liberados
+
+
+# ==================== DOWNLOAD ====================
+
+# Trecho do .tar de download: bytes em memória ou (caminho, tamanho) de um arquivo inteiro
+Segmento = Union[bytes, Tuple[str, int]]
+
+
+def _membros_tar(pasta: str, manifesto: Dict[str, Any]) -> List[Tuple[tarfile.TarInfo, List[Segmento]]]:
+    """
+    Membros do .tar de download: manifesto.json e <tabela>.ndjson.gz por tabela. Cada chunk é um
+    membro gzip completo, então a concatenação dos arquivos dos chunks já é um .gz válido.
+    """
+    mtime = int(datetime.fromisoformat(manifesto['criado_em']).timestamp())
+    conteudo_manifesto = json.dumps(manifesto, ensure_ascii=False, indent=1).encode('utf-8')
+    membros = []
+
+    info = tarfile.TarInfo('manifesto.json')
+    info.size, info.mtime = len(conteudo_manifesto), mtime
+    membros.append((info, [conteudo_manifesto]))
+
+    for tabela, dados in manifesto['tabelas'].items():
+        partes = [(caminho, os.path.getsize(caminho))
+                  for caminho in (_caminho_chunk(pasta, chunk['hash']) for chunk in dados['chunks'])]
+        info = tarfile.TarInfo(f'{tabela}.ndjson.gz')
+        info.size, info.mtime = sum(tamanho for _, tamanho in partes), mtime
+        membros.append((info, partes))
+    return membros
+
+
+def segmentos_tar(pasta: str, nome: str) -> Optional[List[Segmento]]:
+    """
+    Layout do .tar do snapshot (cabeçalhos, chunks e preenchimento), sem ler os chunks: o download
+    sabe o tamanho total e atende intervalos (Range) lendo só os chunks envolvidos.
+    None se o snapshot não existe.
+    """
+    manifesto = ler_manifesto(pasta, nome)
+    if not manifesto:
+        return None
+    segmentos: List[Segmento] = []
+    for info, partes in _membros_tar(pasta, manifesto):
+        segmentos.append(info.tobuf(format=tarfile.GNU_FORMAT))
+        segmentos.extend(partes)
+        resto = info.size % tarfile.BLOCKSIZE
+        if resto:
+            segmentos.append(b'\0' * (tarfile.BLOCKSIZE - resto))
+    segmentos.append(b'\0' * (tarfile.BLOCKSIZE * 2))
+    return segmentos
+
+
+def etag_snapshot(pasta: str, nome: str) -> Optional[str]:
+    """
+    Hash do manifesto: ele fixa os chunks (pelo SHA-256 do conteúdo) e, portanto, todos os bytes
+    do .tar. Serve de ETag forte sem ler os chunks.
+    """
+    manifesto = ler_manifesto(pasta, nome)
+    if not manifesto:
+        return None
+    return hashlib.sha256(json.dumps(manifesto, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _caminho_digest(pasta: str, nome: str) -> str:
+    return os.path.join(pasta, PASTA_SNAPSHOTS, f'{os.path.basename(nome)}.sha256')
+
+
+def ler_digest_tar(pasta: str, nome: str) -> Optional[str]:
+    """SHA-256 do .tar do snapshot, gravado no primeiro download completo"""
+    try:
+        with open(_caminho_digest(pasta, nome), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def gravar_digest_tar(pasta: str, nome: str, digest: str):
+    if not os.path.exists(_caminho_manifesto(pasta, nome)):
+        return
+    caminho = _caminho_digest(pasta, nome)
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write(digest)
+    os.replace(temporario, caminho)
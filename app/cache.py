@@ -0,0 +1,277 @@
+"""
+Cache em memória (LRU com expiração) compartilhado pelos serviços de relatório
+e cache single-flight com stale-while-revalidate para os painéis (dashboard executivo, previsão)
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Caches nomeados (nome -> cache), lidos pelas métricas (taxa de acerto em /metrics)
+CACHES: Dict[str, Any] = {}
+
+
+class CacheTTL:
+    """Cache LRU thread-safe com tempo de vida por item (em segundos)"""
+
+    def __init__(self, max_itens: int = 128, ttl: float = 300, nome: Optional[str] = None):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = Lock()
+        self.acertos = 0
+        self.falhas = 0
+        if nome:
+            CACHES[nome] = self
+
+    def get(self, chave: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._itens[chave]
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[1]
+
+    def set(self, chave: Hashable, valor: Any, ttl: Optional[float] = None):
+        expira_em = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._itens[chave] = (expira_em, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._itens)
+
+
+class BackendMemoria:
+    """Armazenamento das entradas no próprio processo (padrão)"""
+
+    def __init__(self, max_itens: int = 64):
+        self._cache = CacheTTL(max_itens=max_itens)
+
+    def get(self, chave: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(chave)
+
+    def set(self, chave: str, entrada: Dict[str, Any], ttl: float):
+        self._cache.set(chave, entrada, ttl=ttl)
+
+    def adquirir(self, chave: str, ttl: float) -> Optional[str]:
+        # Dentro do processo o single-flight já é garantido pelo CacheSWR
+        return 'local'
+
+    def liberar(self, chave: str, token: str):
+        pass
+
+
+class BackendRedis:
+    """
+    Armazenamento compartilhado entre processos/instâncias (REDIS_URL).
+    As entradas são gravadas em JSON e o cálculo é travado com SET NX, então só um
+    processo recalcula cada chave por vez. A trava guarda um token do dono: só quem a
+    adquiriu a remove (comparação e remoção atômicas em Lua).
+    """
+
+    LIBERAR = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, url: str, prefixo: str = 'inventario:', timeout: float = 2):
+        import redis
+        self._redis = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        # from_url não conecta; sem o ping, um Redis inacessível só apareceria na primeira requisição
+        self._redis.ping()
+        self._liberar = self._redis.register_script(self.LIBERAR)
+        self._prefixo = prefixo
+
+    def get(self, chave: str) -> Optional[Dict[str, Any]]:
+        bruto = self._redis.get(self._prefixo + chave)
+        return json.loads(bruto) if bruto else None
+
+    def set(self, chave: str, entrada: Dict[str, Any], ttl: float):
+        self._redis.set(self._prefixo + chave, json.dumps(entrada, default=str), px=int(ttl * 1000))
+
+    def adquirir(self, chave: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self._redis.set(f'{self._prefixo}trava:{chave}', token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def liberar(self, chave: str, token: str):
+        self._liberar(keys=[f'{self._prefixo}trava:{chave}'], args=[token])
+
+
+class _Calculo:
+    """Cálculo em andamento de uma chave (aguardado pelas requisições concorrentes)"""
+
+    def __init__(self):
+        self.concluido = threading.Event()
+        self.valor = None
+        self.erro = None
+
+
+class CacheSWR:
+    """
+    Single-flight + stale-while-revalidate.
+
+    - Requisições simultâneas para a mesma chave aguardam um único cálculo e recebem o mesmo resultado.
+    - Até `ttl` segundos o resultado é servido direto; até `ttl + obsoleto` é servido enquanto
+      uma thread recalcula em segundo plano; depois disso a requisição espera o novo cálculo.
+    - O backend define onde as entradas ficam (memória do processo ou Redis, entre processos).
+      Se ele falhar (ex.: Redis fora do ar), o valor é calculado sem cache em vez de propagar o erro.
+    """
+
+    def __init__(self, ttl: float = 30, obsoleto: float = 300, backend=None, espera_maxima: float = 120,
+                 nome: Optional[str] = None):
+        self.ttl = ttl
+        self.obsoleto = obsoleto
+        self.backend = backend or BackendMemoria()
+        self.espera_maxima = espera_maxima
+        self._calculos: Dict[str, _Calculo] = {}
+        self._lock = Lock()
+        self.acertos = 0
+        self.obsoletos = 0
+        self.falhas = 0
+        self.compartilhados = 0
+        if nome:
+            CACHES[nome] = self
+
+    def obter(self, chave: str, calcular: Callable[[], Any]) -> Any:
+        entrada = self._backend_get(chave)
+        if entrada is not None:
+            idade = time.time() - entrada['criado_em']
+            if idade < self.ttl:
+                self.acertos += 1
+                return entrada['valor']
+            if idade < self.ttl + self.obsoleto:
+                self.obsoletos += 1
+                self._revalidar_em_segundo_plano(chave, calcular)
+                return entrada['valor']
+
+        self.falhas += 1
+        return self._calcular_uma_vez(chave, calcular)
+
+    def _calcular_uma_vez(self, chave: str, calcular: Callable[[], Any]) -> Any:
+        with self._lock:
+            calculo = self._calculos.get(chave)
+            lider = calculo is None
+            if lider:
+                calculo = self._calculos[chave] = _Calculo()
+
+        if not lider:
+            self.compartilhados += 1
+            if not calculo.concluido.wait(self.espera_maxima):
+                raise TimeoutError(f'Tempo esgotado aguardando o cálculo de {chave}')
+            if calculo.erro is not None:
+                raise calculo.erro
+            return calculo.valor
+
+        try:
+            calculo.valor = self._calcular_com_trava(chave, calcular)
+            return calculo.valor
+        except Exception as e:
+            calculo.erro = e
+            raise
+        finally:
+            with self._lock:
+                self._calculos.pop(chave, None)
+            calculo.concluido.set()
+
+    def _backend_get(self, chave: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.backend.get(chave)
+        except Exception as e:
+            logger.warning(f'Cache indisponível ao ler {chave} ({e}); calculando sem cache')
+            return None
+
+    def _calcular_com_trava(self, chave: str, calcular: Callable[[], Any]) -> Any:
+        """Trava entre processos (backend): quem não conseguir aguarda o resultado do outro processo"""
+        try:
+            token = self.backend.adquirir(chave, self.espera_maxima)
+            backend_ok = True
+        except Exception as e:
+            logger.warning(f'Cache indisponível ao travar {chave} ({e}); calculando sem cache')
+            token, backend_ok = None, False
+
+        if backend_ok and token is None:
+            limite = time.monotonic() + self.espera_maxima
+            while time.monotonic() < limite:
+                time.sleep(0.2)
+                try:
+                    entrada = self.backend.get(chave)
+                except Exception as e:
+                    logger.warning(f'Cache indisponível aguardando {chave} ({e}); calculando sem cache')
+                    backend_ok = False
+                    break
+                if entrada is not None and time.time() - entrada['criado_em'] < self.ttl:
+                    return entrada['valor']
+            else:
+                logger.warning(f'Cálculo de {chave} em outro processo não terminou; calculando localmente')
+
+        try:
+            valor = calcular()
+            if backend_ok:
+                try:
+                    self.backend.set(chave, {'valor': valor, 'criado_em': time.time()}, ttl=self.ttl + self.obsoleto)
+                except Exception as e:
+                    logger.warning(f'Não foi possível gravar {chave} no cache: {e}')
+            return valor
+        finally:
+            # Só libera a trava própria: no caminho de espera esgotada ela pode ser de outro processo
+            if token is not None:
+                try:
+                    self.backend.liberar(chave, token)
+                except Exception as e:
+                    logger.warning(f'Não foi possível liberar a trava de {chave}: {e}')
+
+    def _revalidar_em_segundo_plano(self, chave: str, calcular: Callable[[], Any]):
+        with self._lock:
+            if chave in self._calculos:
+                return
+
+        def revalidar():
+            try:
+                self._calcular_uma_vez(chave, calcular)
+            except Exception as e:
+                logger.warning(f'Falha ao revalidar {chave} em segundo plano: {e}')
+
+        threading.Thread(target=revalidar, name=f'revalidar-{chave}', daemon=True).start()
+
+
+def backend_padrao():
+    """Redis se REDIS_URL estiver definido (e o pacote redis instalado); senão, memória do processo"""
+    url = os.environ.get('REDIS_URL')
+    if url:
+        try:
+            return BackendRedis(url)
+        except Exception as e:
+            logger.warning(f'Redis indisponível ({e}); usando cache em memória do processo')
+    return BackendMemoria()
+
+
+# Painéis pesados (dashboard executivo, previsão de demanda)
+cache_paineis = CacheSWR(
+    ttl=float(os.environ.get('PAINEIS_CACHE_TTL', 30)),
+    obsoleto=float(os.environ.get('PAINEIS_CACHE_OBSOLETO', 300)),
+    backend=backend_padrao(),
+    nome='paineis'
+)
@@ -0,0 +1,145 @@
+"""
+Coleta das fotos órfãs e relatório de uso do armazenamento de fotos
+Excluir um equipamento apaga as linhas de equipamentos_fotos em cascata e substituir a foto troca a
+linha, mas os arquivos continuam no armazenamento. A coleta carrega as chaves referenciadas numa
+única consulta (função fotos_referenciadas, ver supabase_init.sql), percorre o armazenamento em
+streaming e põe em quarentena (ou remove) o que não está no conjunto; no mesmo passo soma o espaço
+usado por tipo de equipamento.
+"""
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from app.export_service import paginar
+from app.foto_storage import chave_da_url, chave_valida, obter_armazenamento
+from app.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+RPC_INEXISTENTE = 'PGRST202'
+QUARENTENA = 'quarentena'
+REMOVER = 'remover'
+MODOS = (QUARENTENA, REMOVER)
+SEM_TIPO = 'Sem tipo'
+
+
+def _formatar_mb(tamanho: int) -> str:
+    return f'{tamanho / (1024 * 1024):.2f} MB'
+
+
+def fotos_referenciadas() -> Dict[str, str]:
+    """chave -> tipo do equipamento, para todas as fotos registradas"""
+    client = get_supabase_client()
+    try:
+        linhas = client.rpc('fotos_referenciadas', {}).execute().data or []
+    except Exception as e:
+        if getattr(e, 'code', None) != RPC_INEXISTENTE:
+            raise
+        logger.warning('Função fotos_referenciadas não encontrada no banco; lendo equipamentos_fotos em páginas')
+        linhas = (
+            {'url': linha.get('url'), 'tipo': (linha.get('equipamentos') or {}).get('tipo')}
+            for linha in paginar(lambda: client.table('equipamentos_fotos').select('id,url,equipamentos(tipo)'))
+        )
+
+    referenciadas: Dict[str, str] = {}
+    for linha in linhas:
+        chave = chave_da_url(linha.get('url'))
+        if chave:
+            referenciadas[chave] = linha.get('tipo') or SEM_TIPO
+    return referenciadas
+
+
+def coletar(armazenamento, referenciadas: Dict[str, str], modo: str = QUARENTENA,
+            carencia: timedelta = timedelta(hours=24), simular: bool = False,
+            agora: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Percorre o armazenamento uma vez: soma o uso das fotos referenciadas por tipo de equipamento e
+    trata as órfãs. Órfãs mais novas que `carencia` são mantidas: podem ser uploads diretos cujo
+    equipamento ainda não foi salvo.
+
+    Args:
+        simular: só calcula o relatório, sem mover/remover nada
+    """
+    if modo not in MODOS:
+        raise ValueError(f'Modo inválido. Use: {", ".join(MODOS)}')
+    limite = (agora or time.time()) - carencia.total_seconds()
+    por_tipo: Dict[str, Dict[str, int]] = {}
+    orfas = {'arquivos': 0, 'bytes': 0, 'recentes': 0, 'falhas': 0}
+    ignorados = 0
+
+    for chave, tamanho, modificado_em in armazenamento.listar():
+        tipo = referenciadas.get(chave)
+        if tipo is not None:
+            uso = por_tipo.setdefault(tipo, {'arquivos': 0, 'bytes': 0})
+            uso['arquivos'] += 1
+            uso['bytes'] += tamanho
+            continue
+        if not chave_valida(chave):
+            ignorados += 1  # arquivos que não são fotos (ex.: .gitkeep)
+            continue
+        if modificado_em >= limite:
+            orfas['recentes'] += 1
+            continue
+        if not simular:
+            try:
+                if modo == QUARENTENA:
+                    armazenamento.quarentenar(chave)
+                else:
+                    armazenamento.remover(chave)
+            except Exception as e:
+                logger.warning(f'Não foi possível tratar a foto órfã {chave}: {e}')
+                orfas['falhas'] += 1
+                continue
+        orfas['arquivos'] += 1
+        orfas['bytes'] += tamanho
+
+    total = sum(uso['bytes'] for uso in por_tipo.values())
+    return {
+        'modo': modo,
+        'simulacao': simular,
+        'por_tipo': [
+            {'tipo': tipo, **uso, 'tamanho': _formatar_mb(uso['bytes'])}
+            for tipo, uso in sorted(por_tipo.items(), key=lambda item: item[1]['bytes'], reverse=True)
+        ],
+        'total_bytes': total,
+        'total': _formatar_mb(total),
+        'orfas': {**orfas, 'tamanho': _formatar_mb(orfas['bytes'])},
+        'ignorados': ignorados
+    }
+
+
+def executar_coleta(app, simular: bool = False, modo: Optional[str] = None) -> Dict[str, Any]:
+    """Coleta com a configuração da aplicação e limpeza da quarentena vencida"""
+    with app.app_context():
+        config = app.config
+        armazenamento = obter_armazenamento(app)
+        resultado = coletar(
+            armazenamento, fotos_referenciadas(),
+            modo=modo or config['PHOTO_GC_MODE'],
+            carencia=timedelta(hours=config['PHOTO_GC_GRACE_HOURS']),
+            simular=simular
+        )
+        if not simular:
+            limite = time.time() - config['PHOTO_QUARANTINE_DAYS'] * 24 * 60 * 60
+            removidos, liberados = armazenamento.limpar_quarentena(limite)
+            resultado['quarentena_removidos'] = removidos
+            resultado['quarentena_liberado'] = _formatar_mb(liberados)
+
+        alerta = config['PHOTO_STORAGE_ALERT_BYTES']
+        if alerta and resultado['total_bytes'] + resultado['orfas']['bytes'] > alerta:
+            logger.warning(f'Fotos de equipamentos ocupam {resultado["total"]}, acima de PHOTO_STORAGE_ALERT_BYTES')
+        return resultado
+
+
+def coletar_fotos_agendado(app):
+    """Tarefa agendada (diária): trata as fotos órfãs e registra o uso por tipo"""
+    try:
+        resultado = executar_coleta(app)
+        logger.info(
+            f'Coleta de fotos: {resultado["orfas"]["arquivos"]} órfã(s) ({resultado["orfas"]["tamanho"]}) '
+            f'em {resultado["modo"]}; em uso: {resultado["total"]}'
+        )
+    except Exception as e:
+        logger.error(f'Erro na coleta de fotos órfãs: {e}', exc_info=True)
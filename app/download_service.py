@@ -0,0 +1,194 @@
+"""
+Downloads de arquivos grandes (backups e fotos enviadas)
+O conteúdo é lido do disco em blocos, sem carregar o arquivo em memória, e pode ser formado por
+vários trechos (o .tar de um snapshot é montado a partir dos chunks). As respostas aceitam
+Range/If-Range com um intervalo por requisição (206/416): um download interrompido continua de onde
+parou em vez de recomeçar. O ETag forte e os cabeçalhos Digest/Repr-Digest (SHA-256) identificam
+o conteúdo exato; sem Range, conteúdo comprimível é enviado com gzip em streaming.
+"""
+import base64
+import hashlib
+import logging
+import os
+import zlib
+from functools import lru_cache
+from mimetypes import guess_type
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+from flask import current_app, request, Response
+
+logger = logging.getLogger(__name__)
+
+
+TAMANHO_BLOCO = 64 * 1024
+
+# Trecho do conteúdo: bytes em memória ou (caminho, tamanho) de um arquivo lido desde o início
+Segmento = Union[bytes, Tuple[str, int]]
+
+
+def _tamanho(segmento: Segmento) -> int:
+    return len(segmento) if isinstance(segmento, bytes) else segmento[1]
+
+
+class Conteudo:
+    """
+    Conteúdo de um download.
+
+    Args:
+        etag: hash do conteúdo (ETag forte)
+        digest: SHA-256 hexadecimal dos bytes, se conhecido (cabeçalhos Digest/Repr-Digest)
+        comprimivel: pode ser enviado com gzip (não vale a pena para imagens e .gz)
+        ao_concluir: callback(sha256) chamado ao fim de um envio completo quando o digest
+                     não era conhecido (ex.: gravar o digest do .tar do snapshot)
+    """
+
+    def __init__(self, segmentos: List[Segmento], nome: str, etag: str, mimetype: Optional[str] = None,
+                 digest: Optional[str] = None, comprimivel: bool = False,
+                 ao_concluir: Optional[Callable[[str], None]] = None):
+        self.segmentos = segmentos
+        self.nome = nome
+        self.etag = etag
+        self.mimetype = mimetype or guess_type(nome)[0] or 'application/octet-stream'
+        self.digest = digest
+        self.comprimivel = comprimivel
+        self.ao_concluir = ao_concluir
+        self.tamanho = sum(_tamanho(s) for s in segmentos)
+
+    def ler(self, inicio: int = 0, fim: Optional[int] = None) -> Iterator[bytes]:
+        """Bytes de [inicio, fim), abrindo só os arquivos que cruzam o intervalo"""
+        fim = self.tamanho if fim is None else fim
+        posicao = 0
+        for segmento in self.segmentos:
+            tamanho = _tamanho(segmento)
+            de, ate = max(inicio - posicao, 0), min(fim - posicao, tamanho)
+            posicao += tamanho
+            if de >= ate:
+                if posicao >= fim:
+                    break
+                continue
+            if isinstance(segmento, bytes):
+                yield segmento[de:ate]
+                continue
+            caminho = segmento[0]
+            with open(caminho, 'rb') as f:
+                f.seek(de)
+                restante = ate - de
+                while restante > 0:
+                    bloco = f.read(min(TAMANHO_BLOCO, restante))
+                    if not bloco:
+                        raise IOError(f'Arquivo {os.path.basename(caminho)} menor que o esperado')
+                    restante -= len(bloco)
+                    yield bloco
+
+
+@lru_cache(maxsize=1024)
+def _sha256_arquivo(caminho: str, tamanho: int, mtime_ns: int) -> str:
+    # tamanho e mtime entram na chave: arquivo alterado é recalculado
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def conteudo_arquivo(caminho: str, nome: Optional[str] = None, mimetype: Optional[str] = None,
+                     comprimivel: bool = False) -> Conteudo:
+    """Conteúdo de um arquivo em disco, com ETag/Digest pelo SHA-256 (calculado uma vez por versão)"""
+    estado = os.stat(caminho)
+    digest = _sha256_arquivo(caminho, estado.st_size, estado.st_mtime_ns)
+    return Conteudo([(caminho, estado.st_size)], nome or os.path.basename(caminho), digest,
+                    mimetype=mimetype, digest=digest, comprimivel=comprimivel)
+
+
+def _digest_base64(digest: str) -> str:
+    return base64.b64encode(bytes.fromhex(digest)).decode('ascii')
+
+
+def _comprimir_stream(partes: Iterator[bytes], nivel: int) -> Iterator[bytes]:
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # wbits 31: formato gzip
+    for parte in partes:
+        comprimido = compressor.compress(parte)
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
+
+
+def _com_digest(conteudo: Conteudo) -> Iterator[bytes]:
+    """Envia tudo calculando o SHA-256; o callback só recebe o digest se o envio chegou ao fim"""
+    h = hashlib.sha256()
+    for parte in conteudo.ler():
+        h.update(parte)
+        yield parte
+    try:
+        conteudo.ao_concluir(h.hexdigest())
+    except Exception as e:
+        logger.warning(f'Falha ao registrar o digest de {conteudo.nome}: {e}')
+
+
+def _intervalo(conteudo: Conteudo) -> Union[Tuple[int, int], None, bool]:
+    """
+    (inicio, fim) do Range pedido; None para enviar tudo (sem Range, If-Range desatualizado ou
+    vários intervalos); False se o intervalo não pode ser atendido (416).
+    """
+    intervalo = request.range
+    if intervalo is None or intervalo.units != 'bytes' or len(intervalo.ranges) != 1:
+        return None
+    # If-Range: o intervalo só vale se o cliente tem a mesma versão; datas não são aceitas
+    if 'If-Range' in request.headers and request.if_range.etag != conteudo.etag:
+        return None
+    limites = intervalo.range_for_length(conteudo.tamanho)
+    return limites if limites is not None else False
+
+
+def enviar(conteudo: Conteudo, como_anexo: bool = True) -> Response:
+    """Resposta 200/206/304/416 para o conteúdo, conforme If-None-Match, Range e Accept-Encoding"""
+    response = Response(mimetype=conteudo.mimetype)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = \
+        f'{"attachment" if como_anexo else "inline"}; filename="{conteudo.nome}"'
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.set_etag(conteudo.etag)
+
+    # A versão gzip tem ETag próprio (sufixo, como na camada de compressão)
+    if request.if_none_match.contains(conteudo.etag) or request.if_none_match.contains(f'{conteudo.etag}-gzip'):
+        response.status_code = 304
+        return response
+
+    if conteudo.digest:
+        digest = _digest_base64(conteudo.digest)
+        response.headers['Digest'] = f'sha-256={digest}'
+        response.headers['Repr-Digest'] = f'sha-256=:{digest}:'
+
+    limites = _intervalo(conteudo)
+    if limites is False:
+        response.status_code = 416
+        response.headers['Content-Range'] = f'bytes */{conteudo.tamanho}'
+        return response
+    if limites is not None:
+        inicio, fim = limites
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {inicio}-{fim - 1}/{conteudo.tamanho}'
+        response.content_length = fim - inicio
+        response.response = conteudo.ler(inicio, fim)
+        return response
+
+    config = current_app.config
+    if conteudo.comprimivel and config.get('COMPRESSION_ENABLED', True) \
+            and conteudo.tamanho >= config.get('COMPRESSION_MIN_SIZE', 1024):
+        response.vary.add('Accept-Encoding')
+        if request.accept_encodings['gzip']:
+            # Digest descreve os bytes sem compressão: não vale para esta representação
+            response.headers.pop('Digest', None)
+            response.headers.pop('Repr-Digest', None)
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(f'{conteudo.etag}-gzip')
+            response.response = _comprimir_stream(conteudo.ler(), config.get('COMPRESSION_GZIP_LEVEL', 6))
+            return response
+
+    response.content_length = conteudo.tamanho
+    if conteudo.digest is None and conteudo.ao_concluir is not None:
+        response.response = _com_digest(conteudo)
+    else:
+        response.response = conteudo.ler()
+    return response
@@ -6,11 +6,23 @@ from flask_mail import Message, Mail
 from datetime import datetime, date, timedelta
 import logging
 
+from app.metricas import contar_notificacao
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _enviar(mail, msg):
+    """Envia a mensagem contando sucesso/falha do canal de e-mail nas métricas"""
+    try:
+        mail.send(msg)
+    except Exception:
+        contar_notificacao('email', False)
+        raise
+    contar_notificacao('email', True)
+
+
 def verificar_e_enviar_notificacoes(app):
     """
     Verifica empréstimos e envia notificações por e-mail, push e WhatsApp.
@@ -162,7 +174,7 @@ def enviar_email_lembrete(app, emprestimo, dias_restantes):
             html=corpo_html
         )
         
-        mail.send(msg)
+        _enviar(mail, msg)
         logger.info(f'E-mail de lembrete enviado para {emprestimo.email_responsavel} - Equipamento: {emprestimo.equipamento.nome}')
         
     except Exception as e:
@@ -237,7 +249,7 @@ def enviar_email_atraso(app, emprestimo, dias_atraso):
             html=corpo_html
         )
         
-        mail.send(msg)
+        _enviar(mail, msg)
         logger.info(f'E-mail de atraso enviado para {emprestimo.email_responsavel} - Equipamento: {emprestimo.equipamento.nome} ({dias_atraso} dias)')
         
     except Exception as e:
@@ -337,7 +349,7 @@ def enviar_email_confirmacao_emprestimo(app, emprestimo):
             html=corpo_html
         )
         
-        mail.send(msg)
+        _enviar(mail, msg)
         logger.info(f'E-mail de confirmação enviado para {emprestimo.email_responsavel}')
         
     except Exception as e:
@@ -434,7 +446,7 @@ def enviar_email_confirmacao_devolucao(app, emprestimo):
             html=corpo_html
         )
         
-        mail.send(msg)
+        _enviar(mail, msg)
         logger.info(f'E-mail de devolução enviado para {emprestimo.email_responsavel}')
         
     except Exception as e:
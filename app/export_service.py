@@ -0,0 +1,153 @@
+"""
+Exportação em streaming (CSV / NDJSON) de equipamentos, empréstimos e manutenções
+Lê o Supabase em páginas e gera as linhas sob demanda, sem materializar a tabela inteira.
+"""
+import csv
+import io
+from typing import Callable, Dict, Iterator, List, Optional, Any
+
+from flask import current_app
+
+from app.supabase_client import get_supabase_client
+from app.models_supabase import Equipamento, Emprestimo
+
+
+TAMANHO_PAGINA = 1000
+# Tamanho aproximado de cada bloco enviado ao cliente
+TAMANHO_BLOCO = 64 * 1024
+
+# Colunas exportadas por recurso (ordem do CSV)
+COLUNAS = {
+    'equipamentos': [
+        'id', 'nome', 'tipo', 'marca', 'modelo', 'numero_serie', 'processador', 'memoria_ram',
+        'armazenamento', 'sistema_operacional', 'status', 'data_aquisicao', 'valor',
+        'vida_util_anos', 'departamento_atual', 'observacoes', 'data_cadastro', 'data_atualizacao'
+    ],
+    'emprestimos': [
+        'id', 'equipamento_id', 'equipamento_nome', 'equipamento_tipo', 'equipamento_numero_serie',
+        'responsavel', 'departamento', 'email_responsavel', 'telefone_responsavel',
+        'data_emprestimo', 'data_devolucao_prevista', 'data_devolucao_real', 'status', 'observacoes'
+    ],
+    'manutencoes': [
+        'id', 'equipamento_id', 'equipamento_nome', 'tipo', 'descricao', 'data_inicio', 'data_fim',
+        'custo', 'responsavel', 'fornecedor', 'status', 'data_registro'
+    ],
+}
+
+
+def paginar(montar_query: Callable[[], Any], tamanho_pagina: int = TAMANHO_PAGINA,
+            coluna_ordem: str = 'id') -> Iterator[Dict[str, Any]]:
+    """
+    Percorre uma tabela em páginas usando range() e ordenação por uma coluna única.
+
+    Args:
+        montar_query: função que retorna uma query nova (select + filtros) a cada página
+        tamanho_pagina: quantidade de linhas por requisição ao Supabase
+        coluna_ordem: coluna com valores únicos usada para ordenar as páginas
+    """
+    inicio = 0
+    while True:
+        response = montar_query().order(coluna_ordem).range(inicio, inicio + tamanho_pagina - 1).execute()
+        linhas = response.data or []
+        yield from linhas
+        if len(linhas) < tamanho_pagina:
+            break
+        inicio += tamanho_pagina
+
+
+def _nome_equipamento(eq: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not eq:
+        return None
+    return f"{eq.get('nome')} - {eq.get('marca')} {eq.get('modelo')}"
+
+
+def linhas_equipamentos(filtros: Dict[str, Optional[str]]) -> Iterator[Dict[str, Any]]:
+    """Equipamentos (filtro opcional por departamento_atual)"""
+    departamento = filtros.get('departamento')
+
+    def montar_query():
+        query = get_supabase_client().table('equipamentos').select(Equipamento.COLUNAS)
+        if departamento and departamento != 'todos':
+            query = query.eq('departamento_atual', departamento)
+        return query
+
+    yield from paginar(montar_query)
+
+
+def linhas_emprestimos(filtros: Dict[str, Optional[str]]) -> Iterator[Dict[str, Any]]:
+    """Empréstimos com os mesmos filtros de /relatorios/emprestimos, achatando o equipamento"""
+    def montar_query():
+        query = get_supabase_client().table('emprestimos').select(
+            '*, equipamentos(nome,tipo,marca,modelo,numero_serie)'
+        )
+        return Emprestimo.aplicar_filtros(query, **filtros)
+
+    for linha in paginar(montar_query):
+        eq = linha.pop('equipamentos', None) or {}
+        linha['equipamento_nome'] = _nome_equipamento(eq)
+        linha['equipamento_tipo'] = eq.get('tipo')
+        linha['equipamento_numero_serie'] = eq.get('numero_serie')
+        yield linha
+
+
+def linhas_manutencoes(filtros: Dict[str, Optional[str]]) -> Iterator[Dict[str, Any]]:
+    """Manutenções (data_inicio/data_fim aplicados sobre a data de início da manutenção)"""
+    data_inicio = filtros.get('data_inicio')
+    data_fim = filtros.get('data_fim')
+
+    def montar_query():
+        query = get_supabase_client().table('manutencoes').select('*, equipamentos(nome,marca,modelo)')
+        if data_inicio:
+            query = query.gte('data_inicio', data_inicio)
+        if data_fim:
+            query = query.lte('data_inicio', data_fim)
+        return query
+
+    for linha in paginar(montar_query):
+        linha['equipamento_nome'] = _nome_equipamento(linha.pop('equipamentos', None))
+        yield linha
+
+
+GERADORES = {
+    'equipamentos': linhas_equipamentos,
+    'emprestimos': linhas_emprestimos,
+    'manutencoes': linhas_manutencoes,
+}
+
+
+def gerar_csv(linhas: Iterator[Dict[str, Any]], colunas: List[str]) -> Iterator[str]:
+    """Gera o CSV linha a linha (com BOM para o Excel reconhecer UTF-8)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=colunas, extrasaction='ignore')
+
+    buffer.write('\ufeff')
+    writer.writeheader()
+
+    for linha in linhas:
+        writer.writerow(linha)
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def gerar_ndjson(linhas: Iterator[Dict[str, Any]], colunas: List[str]) -> Iterator[str]:
+    """Gera um objeto JSON por linha"""
+    dumps = current_app.json.dumps
+    bloco, tamanho = [], 0
+    for linha in linhas:
+        texto = dumps({c: linha.get(c) for c in colunas})
+        bloco.append(texto)
+        tamanho += len(texto) + 1
+        if tamanho >= TAMANHO_BLOCO:
+            yield '\n'.join(bloco) + '\n'
+            bloco, tamanho = [], 0
+    if bloco:
+        yield '\n'.join(bloco) + '\n'
+
+
+FORMATOS = {
+    'csv': (gerar_csv, 'text/csv'),
+    'ndjson': (gerar_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,245 @@
+"""
+Indicadores financeiros dos equipamentos (ROI, depreciação e custo de manutenção)
+Calculados a partir de agregados por equipamento lidos em páginas do Supabase (memória proporcional
+ao número de equipamentos, não de empréstimos). A tabela metricas_equipamentos guarda o resultado,
+recalculado diariamente, para o dashboard executivo ler só o ranking.
+"""
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.export_service import paginar
+from app.models_supabase import Departamento
+from app.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+# Vida útil assumida quando o equipamento não informa vida_util_anos
+VIDA_UTIL_PADRAO_ANOS = 5
+# Cada dia de uso vale 0.3% do valor do equipamento (cálculo simplificado de ROI)
+VALOR_DIA_USO = 0.003
+
+TABELA_METRICAS = 'metricas_equipamentos'
+RPC_INEXISTENTE = 'PGRST202'
+TAMANHO_LOTE = 1000
+CAMPOS_EQUIPAMENTO = ('nome', 'tipo', 'marca', 'modelo')
+
+# Recálculo disparado pelo dashboard com metricas_equipamentos vazia: roda uma vez por processo,
+# em segundo plano ('calculando' -> 'concluido'; volta a None se falhar)
+_estado_recalculo: Optional[str] = None
+_lock_recalculo = threading.Lock()
+
+
+def _data(valor: Any) -> Optional[date]:
+    """Aceita date, 'YYYY-MM-DD' e timestamps ISO"""
+    if not valor:
+        return None
+    if isinstance(valor, date):
+        return valor
+    try:
+        return datetime.strptime(str(valor)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def metricas_roi(equipamento: Dict[str, Any], dias_uso: int, custo_manutencao: float,
+                 hoje: Optional[date] = None) -> Dict[str, Any]:
+    """
+    ROI e valor residual (depreciação linear) de um equipamento com valor de aquisição.
+
+    Args:
+        equipamento: dicionário com valor, data_aquisicao e vida_util_anos
+        dias_uso: soma dos dias dos empréstimos devolvidos
+        custo_manutencao: soma dos custos de manutenção
+    """
+    hoje = hoje or date.today()
+    valor = equipamento.get('valor') or 0
+    vida_util_anos = equipamento.get('vida_util_anos') or VIDA_UTIL_PADRAO_ANOS
+
+    data_aquisicao = _data(equipamento.get('data_aquisicao'))
+    if data_aquisicao:
+        idade_anos = (hoje - data_aquisicao).days / 365.25
+        taxa_depreciacao = min(idade_anos / vida_util_anos, 1.0)  # Máximo 100%
+        valor_residual = valor * (1 - taxa_depreciacao)
+    else:
+        idade_anos = 0
+        valor_residual = valor
+
+    valor_gerado = (valor * VALOR_DIA_USO) * dias_uso
+    custo_total = valor + custo_manutencao
+    roi_percentual = ((valor_gerado - custo_total) / custo_total * 100) if custo_total > 0 else 0
+
+    return {
+        'valor_aquisicao': valor,
+        'valor_residual': round(valor_residual, 2),
+        'dias_uso': dias_uso,
+        'custo_manutencao': custo_manutencao,
+        'roi_percentual': round(roi_percentual, 2),
+        'idade_anos': round(idade_anos, 1)
+    }
+
+
+def dias_uso_por_equipamento() -> Dict[int, int]:
+    """Soma dos dias de empréstimo (devolvidos) por equipamento"""
+    client = get_supabase_client()
+    dias: Dict[int, int] = {}
+    for linha in paginar(lambda: client.table('emprestimos')
+                         .select('id,equipamento_id,data_emprestimo,data_devolucao_real')
+                         .eq('status', 'Devolvido')):
+        inicio, fim = _data(linha.get('data_emprestimo')), _data(linha.get('data_devolucao_real'))
+        if inicio and fim:
+            dias[linha['equipamento_id']] = dias.get(linha['equipamento_id'], 0) + max((fim - inicio).days, 0)
+    return dias
+
+
+def custo_manutencao_por_equipamento() -> Dict[int, float]:
+    client = get_supabase_client()
+    custos: Dict[int, float] = {}
+    for linha in paginar(lambda: client.table('manutencoes').select('id,equipamento_id,custo')):
+        custos[linha['equipamento_id']] = custos.get(linha['equipamento_id'], 0) + (linha.get('custo') or 0)
+    return custos
+
+
+def roi_equipamentos(hoje: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+    """ROI de cada equipamento com valor de aquisição, na ordem do id"""
+    dias_uso = dias_uso_por_equipamento()
+    custos = custo_manutencao_por_equipamento()
+    client = get_supabase_client()
+    for eq in paginar(lambda: client.table('equipamentos')
+                      .select('id,nome,tipo,marca,modelo,numero_serie,valor,data_aquisicao,vida_util_anos')
+                      .gt('valor', 0)):
+        yield {
+            'id': eq['id'],
+            'nome': eq.get('nome'),
+            'tipo': eq.get('tipo'),
+            'marca': eq.get('marca'),
+            'modelo': eq.get('modelo'),
+            'numero_serie': eq.get('numero_serie'),
+            **metricas_roi(eq, dias_uso.get(eq['id'], 0), custos.get(eq['id'], 0), hoje)
+        }
+
+
+def atualizar_metricas() -> int:
+    """
+    Recalcula metricas_equipamentos (função SQL atualizar_metricas_equipamentos; sem ela,
+    calcula em Python e grava com upsert em lotes).
+
+    Returns:
+        Número de equipamentos calculados
+    """
+    client = get_supabase_client()
+    try:
+        return client.rpc('atualizar_metricas_equipamentos', {}).execute().data or 0
+    except Exception as e:
+        if getattr(e, 'code', None) != RPC_INEXISTENTE:
+            raise
+        logger.warning('Função atualizar_metricas_equipamentos não encontrada no banco; calculando em Python')
+
+    inicio = datetime.utcnow().isoformat()
+    lote, total = [], 0
+    colunas = ('valor_aquisicao', 'valor_residual', 'idade_anos', 'dias_uso', 'custo_manutencao', 'roi_percentual')
+    for linha in roi_equipamentos():
+        lote.append({'equipamento_id': linha['id'], 'atualizado_em': inicio, **{c: linha[c] for c in colunas}})
+        if len(lote) >= TAMANHO_LOTE:
+            client.table(TABELA_METRICAS).upsert(lote, on_conflict='equipamento_id').execute()
+            total += len(lote)
+            lote = []
+    if lote:
+        client.table(TABELA_METRICAS).upsert(lote, on_conflict='equipamento_id').execute()
+        total += len(lote)
+
+    # Equipamentos que deixaram de ter valor de aquisição não foram regravados nesta rodada
+    client.table(TABELA_METRICAS).delete().lt('atualizado_em', inicio).execute()
+    return total
+
+
+def atualizar_metricas_agendado(app):
+    """Tarefa agendada (diária): recalcula os indicadores por equipamento"""
+    with app.app_context():
+        try:
+            total = atualizar_metricas()
+            logger.info(f'Indicadores financeiros recalculados para {total} equipamento(s)')
+        except Exception as e:
+            logger.error(f'Erro ao recalcular indicadores financeiros: {e}', exc_info=True)
+
+
+def _recalcular_em_segundo_plano():
+    global _estado_recalculo
+    try:
+        total = atualizar_metricas()
+        logger.info(f'Indicadores financeiros calculados para {total} equipamento(s) (tabela estava vazia)')
+        _estado_recalculo = 'concluido'
+    except Exception as e:
+        logger.error(f'Erro ao calcular indicadores financeiros: {e}', exc_info=True)
+        _estado_recalculo = None
+
+
+def _disparar_recalculo() -> bool:
+    """
+    Dispara atualizar_metricas() em uma thread, uma única vez por processo.
+    Retorna False quando o recálculo já terminou (tabela vazia de fato: nenhum equipamento com valor).
+    """
+    global _estado_recalculo
+    with _lock_recalculo:
+        if _estado_recalculo == 'concluido':
+            return False
+        if _estado_recalculo is None:
+            _estado_recalculo = 'calculando'
+            threading.Thread(target=_recalcular_em_segundo_plano, name='metricas-equipamentos', daemon=True).start()
+    return True
+
+
+def _linha_ranking(linha: Dict[str, Any]) -> Dict[str, Any]:
+    equipamento = linha.pop('equipamentos', None) or {}
+    linha.pop('equipamento_id', None)
+    linha.pop('atualizado_em', None)
+    return {**{c: equipamento.get(c) for c in CAMPOS_EQUIPAMENTO}, **linha}
+
+
+def _ranking_em_memoria(limite: int) -> Dict[str, Any]:
+    """Fallback sem a tabela metricas_equipamentos: calcula tudo e ordena"""
+    linhas = sorted(roi_equipamentos(), key=lambda x: x['roi_percentual'], reverse=True)
+    for linha in linhas:
+        linha.pop('id', None)
+        linha.pop('numero_serie', None)
+    return {
+        'top_10': linhas[:limite],
+        'bottom_10': linhas[-limite:] if len(linhas) > limite else [],
+        'roi_medio': round(sum(r['roi_percentual'] for r in linhas) / len(linhas), 2) if linhas else 0
+    }
+
+
+def ranking_roi(limite: int = 10) -> Dict[str, Any]:
+    """
+    Maiores e menores ROI (ordem decrescente) e ROI médio, lidos de metricas_equipamentos
+    com ORDER BY / LIMIT. Com a tabela vazia, dispara o cálculo em segundo plano (uma vez) e
+    responde com o ranking calculado em memória enquanto isso.
+    """
+    client = get_supabase_client()
+    selecao = f'*, equipamentos({",".join(CAMPOS_EQUIPAMENTO)})'
+    try:
+        resumo = client.rpc('metricas_equipamentos_resumo', {}).execute().data or {}
+        if not resumo.get('total') and _disparar_recalculo():
+            return _ranking_em_memoria(limite)
+
+        top = client.table(TABELA_METRICAS).select(selecao) \
+            .order('roi_percentual', desc=True).order('equipamento_id').limit(limite).execute().data or []
+        bottom: List[Dict[str, Any]] = []
+        if (resumo.get('total') or 0) > limite:
+            bottom = client.table(TABELA_METRICAS).select(selecao) \
+                .order('roi_percentual').order('equipamento_id', desc=True).limit(limite).execute().data or []
+            bottom.reverse()
+
+        return {
+            'top_10': [_linha_ranking(linha) for linha in top],
+            'bottom_10': [_linha_ranking(linha) for linha in bottom],
+            'roi_medio': float(resumo.get('roi_medio') or 0),
+            'atualizado_em': resumo.get('atualizado_em')
+        }
+    except Exception as e:
+        if getattr(e, 'code', None) not in Departamento.ERROS_TABELA_INEXISTENTE + (RPC_INEXISTENTE,):
+            raise
+        logger.warning('Tabela metricas_equipamentos não encontrada no banco; calculando o ranking em memória')
+    return _ranking_em_memoria(limite)
@@ -0,0 +1,345 @@
+"""
+Armazenamento das fotos de equipamentos
+Backends intercambiáveis (PHOTO_STORAGE): 'local' grava em UPLOAD_FOLDER_EQUIPAMENTOS e 's3' usa
+qualquer serviço compatível com S3 (AWS, Cloudflare R2, MinIO local para testes via PHOTO_S3_ENDPOINT).
+O navegador envia a foto direto para o armazenamento com uma URL de upload assinada; o servidor
+só assina e depois confere que o objeto existe. equipamentos_fotos.url guarda a chave do objeto
+e a URL de exibição é resolvida pelo backend ativo.
+"""
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+
+TIPOS_IMAGEM = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+# Prefixo das URLs gravadas antes do backend de armazenamento (arquivos em static/uploads)
+PREFIXO_LEGADO = '/static/uploads/equipamentos/'
+ROTA_LOCAL = '/uploads/equipamentos/'
+# Prefixo (no bucket) das fotos órfãs em quarentena; no armazenamento local é uma pasta própria
+PREFIXO_QUARENTENA = 'quarentena/'
+TAMANHO_BLOCO = 64 * 1024
+
+
+class ErroArmazenamento(Exception):
+    """Upload inválido (formato, tamanho ou assinatura)"""
+
+
+def nova_chave(nome_arquivo: str) -> str:
+    """Chave única do objeto a partir do nome enviado pelo cliente"""
+    nome = secure_filename(nome_arquivo or '')
+    extensao = nome.rsplit('.', 1)[1].lower() if '.' in nome else ''
+    if extensao not in TIPOS_IMAGEM:
+        raise ErroArmazenamento('Formato de imagem não permitido. Use PNG, JPG, JPEG, GIF ou WEBP.')
+    return f'{uuid.uuid4().hex}_{nome}'
+
+
+def tipo_da_chave(chave: str) -> str:
+    return TIPOS_IMAGEM.get(chave.rsplit('.', 1)[-1].lower(), 'application/octet-stream')
+
+
+def chave_valida(chave: str) -> bool:
+    return bool(chave) and chave == secure_filename(chave) and chave.rsplit('.', 1)[-1].lower() in TIPOS_IMAGEM
+
+
+class ArmazenamentoLocal:
+    """
+    Fotos em disco. O upload "direto" vai para PUT /uploads/equipamentos/<chave> com um token
+    assinado (SECRET_KEY) que fixa a chave, o tipo e o tamanho; o corpo é gravado em streaming.
+    """
+    tipo = 'local'
+
+    def __init__(self, pasta: str, segredo: str, pasta_quarentena: Optional[str] = None):
+        self.pasta = pasta
+        self.pasta_quarentena = pasta_quarentena or os.path.join(os.path.dirname(pasta), 'quarentena_equipamentos')
+        self._assinador = URLSafeTimedSerializer(segredo, salt='upload-foto-equipamento')
+
+    def caminho(self, chave: str) -> str:
+        return os.path.join(self.pasta, os.path.basename(chave))
+
+    def url(self, chave: str) -> str:
+        return f'{ROTA_LOCAL}{chave}'
+
+    def existe(self, chave: str) -> bool:
+        return os.path.isfile(self.caminho(chave))
+
+    def remover(self, chave: str):
+        try:
+            os.remove(self.caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def listar(self) -> Iterator[Tuple[str, int, float]]:
+        """(chave, bytes, mtime) de cada arquivo, lendo o diretório em streaming"""
+        try:
+            entradas = os.scandir(self.pasta)
+        except FileNotFoundError:
+            return
+        with entradas:
+            for entrada in entradas:
+                if entrada.is_file() and not entrada.name.endswith('.tmp'):
+                    estado = entrada.stat()
+                    yield entrada.name, estado.st_size, estado.st_mtime
+
+    def quarentenar(self, chave: str):
+        os.makedirs(self.pasta_quarentena, exist_ok=True)
+        destino = os.path.join(self.pasta_quarentena, os.path.basename(chave))
+        shutil.move(self.caminho(chave), destino)
+        os.utime(destino)  # o prazo da quarentena conta a partir da mudança
+
+    def limpar_quarentena(self, limite: float) -> Tuple[int, int]:
+        """Remove da quarentena os arquivos movidos antes de `limite` (epoch); retorna (arquivos, bytes)"""
+        removidos, liberados = 0, 0
+        try:
+            entradas = os.scandir(self.pasta_quarentena)
+        except FileNotFoundError:
+            return 0, 0
+        with entradas:
+            for entrada in entradas:
+                estado = entrada.stat()
+                if entrada.is_file() and estado.st_mtime < limite:
+                    os.remove(entrada.path)
+                    removidos += 1
+                    liberados += estado.st_size
+        return removidos, liberados
+
+    def salvar(self, chave: str, origem: BinaryIO, tamanho_maximo: int) -> int:
+        """Grava o stream em blocos (arquivo temporário + rename); retorna o total de bytes"""
+        os.makedirs(self.pasta, exist_ok=True)
+        caminho = self.caminho(chave)
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        total = 0
+        try:
+            with open(temporario, 'wb') as f:
+                for bloco in iter(lambda: origem.read(TAMANHO_BLOCO), b''):
+                    total += len(bloco)
+                    if total > tamanho_maximo:
+                        raise ErroArmazenamento(f'Foto maior que o limite de {tamanho_maximo} bytes')
+                    f.write(bloco)
+            os.replace(temporario, caminho)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+        return total
+
+    def assinar_upload(self, chave: str, content_type: str, tamanho: int, expira_segundos: int) -> Dict[str, Any]:
+        token = self._assinador.dumps({'chave': chave, 'tipo': content_type, 'tamanho': tamanho})
+        return {
+            'url': f'{ROTA_LOCAL}{chave}?token={token}',
+            'metodo': 'PUT',
+            'headers': {'Content-Type': content_type}
+        }
+
+    def validar_token(self, chave: str, token: str, expira_segundos: int) -> Dict[str, Any]:
+        try:
+            dados = self._assinador.loads(token, max_age=expira_segundos)
+        except BadSignature:
+            raise ErroArmazenamento('Token de upload inválido ou expirado')
+        if dados.get('chave') != chave:
+            raise ErroArmazenamento('Token de upload emitido para outro arquivo')
+        return dados
+
+
+class ArmazenamentoS3:
+    """
+    Bucket compatível com S3 (boto3). O upload usa uma URL PUT pré-assinada com Content-Type e
+    Content-Length assinados; o bucket precisa liberar PUT da origem da aplicação no CORS.
+    """
+    tipo = 's3'
+
+    def __init__(self, bucket: str, prefixo: str = 'equipamentos/', endpoint: Optional[str] = None,
+                 regiao: Optional[str] = None, access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None, url_publica: Optional[str] = None,
+                 expira_leitura: int = 3600):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError('PHOTO_STORAGE=s3 requer o pacote boto3 (pip install boto3)')
+        self.bucket = bucket
+        self.prefixo = prefixo
+        self.url_publica = url_publica.rstrip('/') if url_publica else None
+        self.expira_leitura = expira_leitura
+        self._client = boto3.client(
+            's3', endpoint_url=endpoint, region_name=regiao,
+            aws_access_key_id=access_key, aws_secret_access_key=secret_key,
+            # Endereçamento por caminho: funciona com MinIO e outros serviços sem DNS por bucket
+            config=Config(signature_version='s3v4', s3={'addressing_style': 'path'})
+        )
+
+    def _objeto(self, chave: str) -> str:
+        return f'{self.prefixo}{chave}'
+
+    def url(self, chave: str) -> str:
+        if self.url_publica:
+            return f'{self.url_publica}/{self._objeto(chave)}'
+        return self._client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._objeto(chave)},
+            ExpiresIn=self.expira_leitura
+        )
+
+    def existe(self, chave: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self._objeto(chave))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def remover(self, chave: str):
+        self._client.delete_object(Bucket=self.bucket, Key=self._objeto(chave))
+
+    def _objetos(self, prefixo: str) -> Iterator[Dict[str, Any]]:
+        paginador = self._client.get_paginator('list_objects_v2')
+        for pagina in paginador.paginate(Bucket=self.bucket, Prefix=prefixo):
+            yield from pagina.get('Contents', [])
+
+    def listar(self) -> Iterator[Tuple[str, int, float]]:
+        """(chave, bytes, data de gravação) dos objetos do prefixo, página a página (1000 por requisição)"""
+        for objeto in self._objetos(self.prefixo):
+            chave = objeto['Key'][len(self.prefixo):]
+            if chave and '/' not in chave:
+                yield chave, objeto['Size'], objeto['LastModified'].timestamp()
+
+    def quarentenar(self, chave: str):
+        self._client.copy_object(
+            Bucket=self.bucket, Key=f'{PREFIXO_QUARENTENA}{self._objeto(chave)}',
+            CopySource={'Bucket': self.bucket, 'Key': self._objeto(chave)}
+        )
+        self.remover(chave)
+
+    def limpar_quarentena(self, limite: float) -> Tuple[int, int]:
+        antigos = [o for o in self._objetos(PREFIXO_QUARENTENA) if o['LastModified'].timestamp() < limite]
+        for inicio in range(0, len(antigos), 1000):
+            self._client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': o['Key']} for o in antigos[inicio:inicio + 1000]], 'Quiet': True
+            })
+        return len(antigos), sum(o['Size'] for o in antigos)
+
+    def salvar(self, chave: str, origem: BinaryIO, tamanho_maximo: int) -> int:
+        """Upload pelo servidor (formulário multipart antigo); o boto3 envia em partes"""
+        contador = _LeitorLimitado(origem, tamanho_maximo)
+        self._client.upload_fileobj(contador, self.bucket, self._objeto(chave),
+                                    ExtraArgs={'ContentType': tipo_da_chave(chave)})
+        return contador.total
+
+    def assinar_upload(self, chave: str, content_type: str, tamanho: int, expira_segundos: int) -> Dict[str, Any]:
+        url = self._client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': self.bucket, 'Key': self._objeto(chave),
+                    'ContentType': content_type, 'ContentLength': tamanho},
+            ExpiresIn=expira_segundos
+        )
+        return {'url': url, 'metodo': 'PUT', 'headers': {'Content-Type': content_type}}
+
+
+class _LeitorLimitado:
+    """Stream que interrompe a leitura ao passar do tamanho máximo"""
+
+    def __init__(self, origem: BinaryIO, tamanho_maximo: int):
+        self.origem = origem
+        self.tamanho_maximo = tamanho_maximo
+        self.total = 0
+
+    def read(self, tamanho: int = -1) -> bytes:
+        bloco = self.origem.read(tamanho)
+        self.total += len(bloco)
+        if self.total > self.tamanho_maximo:
+            raise ErroArmazenamento(f'Foto maior que o limite de {self.tamanho_maximo} bytes')
+        return bloco
+
+
+def obter_armazenamento(app=None):
+    """Backend configurado (criado uma vez por aplicação)"""
+    app = app or current_app
+    armazenamento = app.extensions.get('armazenamento_fotos')
+    if armazenamento is not None:
+        return armazenamento
+
+    config = app.config
+    if config['PHOTO_STORAGE'] == 's3':
+        armazenamento = ArmazenamentoS3(
+            config['PHOTO_S3_BUCKET'],
+            prefixo=config['PHOTO_S3_PREFIX'],
+            endpoint=config['PHOTO_S3_ENDPOINT'],
+            regiao=config['PHOTO_S3_REGION'],
+            access_key=config['PHOTO_S3_ACCESS_KEY'],
+            secret_key=config['PHOTO_S3_SECRET_KEY'],
+            url_publica=config['PHOTO_PUBLIC_URL'],
+            expira_leitura=config['PHOTO_URL_EXPIRES']
+        )
+    else:
+        armazenamento = ArmazenamentoLocal(config['UPLOAD_FOLDER_EQUIPAMENTOS'], config['SECRET_KEY'],
+                                           config.get('PHOTO_QUARANTINE_FOLDER'))
+    app.extensions['armazenamento_fotos'] = armazenamento
+    return armazenamento
+
+
+def iniciar_upload(nome_arquivo: str, content_type: Optional[str], tamanho: int) -> Dict[str, Any]:
+    """
+    Reserva uma chave e assina o upload direto.
+
+    Returns:
+        {'chave', 'upload': {'url', 'metodo', 'headers'}, 'expira_em'}
+    """
+    config = current_app.config
+    chave = nova_chave(nome_arquivo)
+    esperado = tipo_da_chave(chave)
+    if content_type and content_type != esperado:
+        raise ErroArmazenamento(f'Tipo {content_type} não corresponde à extensão do arquivo ({esperado})')
+    if tamanho <= 0 or tamanho > config['PHOTO_MAX_BYTES']:
+        raise ErroArmazenamento(f'Tamanho inválido: envie fotos de até {config["PHOTO_MAX_BYTES"]} bytes')
+
+    expira = config['PHOTO_UPLOAD_EXPIRES']
+    return {
+        'chave': chave,
+        'upload': obter_armazenamento().assinar_upload(chave, esperado, tamanho, expira),
+        'expira_em': (datetime.utcnow() + timedelta(seconds=expira)).isoformat()
+    }
+
+
+def salvar_arquivo(file_storage) -> Optional[str]:
+    """Upload pelo servidor (formulário multipart); retorna a chave gravada"""
+    if not file_storage or file_storage.filename == '':
+        return None
+    chave = nova_chave(file_storage.filename)
+    obter_armazenamento().salvar(chave, file_storage.stream, current_app.config['PHOTO_MAX_BYTES'])
+    return chave
+
+
+def chave_da_url(valor: Optional[str]) -> Optional[str]:
+    """Chave do objeto a partir do valor gravado em equipamentos_fotos.url (None para URLs externas)"""
+    if not valor or valor.startswith(('http://', 'https://')):
+        return None
+    for prefixo in (PREFIXO_LEGADO, ROTA_LOCAL):
+        if valor.startswith(prefixo):
+            return valor[len(prefixo):]
+    return valor
+
+
+def resolver_url(valor: Optional[str]) -> Optional[str]:
+    """URL de exibição da foto pelo backend ativo; URLs externas são mantidas"""
+    chave = chave_da_url(valor)
+    if chave is None:
+        return valor
+    try:
+        return obter_armazenamento().url(chave)
+    except Exception as e:
+        logger.warning(f'Não foi possível resolver a URL da foto {chave}: {e}')
+        return None
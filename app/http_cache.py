@@ -0,0 +1,103 @@
+"""
+Cache HTTP (ETag / Last-Modified) para as rotas JSON de leitura
+Usa a tabela versoes_tabelas, mantida por triggers no banco (ver supabase_init.sql),
+para responder 304 antes de executar as consultas pesadas.
+"""
+import hashlib
+import logging
+from datetime import datetime, date, time
+from functools import wraps
+from typing import Dict, Optional, Tuple, Iterable
+
+from flask import request, g, make_response
+
+from app.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+def obter_versoes(tabelas: Iterable[str]) -> Optional[Dict[str, Tuple[int, Optional[datetime]]]]:
+    """
+    Retorna {tabela: (versao, atualizado_em)} para as tabelas informadas.
+    Retorna None se a tabela de versões não estiver disponível (cache desativado).
+    """
+    tabelas = list(tabelas)
+    try:
+        client = get_supabase_client()
+        response = client.table('versoes_tabelas').select('tabela,versao,atualizado_em').in_('tabela', tabelas).execute()
+    except Exception as e:
+        logger.warning(f'Versões de tabelas indisponíveis, GET condicional desativado: {e}')
+        return None
+
+    versoes = {tabela: (0, None) for tabela in tabelas}
+    for row in response.data or []:
+        atualizado_em = row.get('atualizado_em')
+        try:
+            atualizado_em = datetime.fromisoformat(atualizado_em.replace('Z', '+00:00')) if atualizado_em else None
+        except ValueError:
+            atualizado_em = None
+        versoes[row['tabela']] = (int(row.get('versao') or 0), atualizado_em)
+    return versoes
+
+
+def calcular_etag(versoes: Dict[str, Tuple[int, Optional[datetime]]]) -> str:
+    """ETag forte derivado da URL (com query string), das versões das tabelas e da data atual"""
+    # A data entra no hash porque métricas como "atrasados" mudam na virada do dia
+    partes = [request.path, request.query_string.decode('utf-8', 'ignore'), date.today().isoformat()]
+    partes.extend(f'{tabela}:{versao}' for tabela, (versao, _) in sorted(versoes.items()))
+    return hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+def nao_cachear():
+    """Marca a resposta atual para não receber ETag (ex.: payload de erro com status 200)"""
+    g.http_cache_ignorar = True
+
+
+def conditional_get(*tabelas):
+    """
+    Decorator para rotas GET: responde 304 se o If-None-Match/If-Modified-Since do cliente
+    ainda for válido para as versões atuais de `tabelas`; caso contrário executa a rota
+    e anexa ETag, Last-Modified e Cache-Control à resposta.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+
+            versoes = obter_versoes(tabelas)
+            if versoes is None:
+                return f(*args, **kwargs)
+
+            etag = calcular_etag(versoes)
+            # Início do dia conta como modificação (ver calcular_etag)
+            datas = [atualizado_em.replace(tzinfo=None) for _, atualizado_em in versoes.values() if atualizado_em]
+            last_modified = max(datas + [datetime.combine(date.today(), time.min)]).replace(microsecond=0)
+
+            nao_modificado = False
+            etag_resposta = etag
+            if request.if_none_match:
+                # A camada de compressão acrescenta o encoding ao ETag (ex.: "abc-gzip")
+                for candidato in (etag, f'{etag}-br', f'{etag}-gzip'):
+                    if request.if_none_match.contains_weak(candidato):
+                        nao_modificado, etag_resposta = True, candidato
+                        break
+            elif request.if_modified_since:
+                nao_modificado = last_modified <= request.if_modified_since.replace(tzinfo=None)
+
+            if nao_modificado:
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or g.get('http_cache_ignorar'):
+                    return response
+
+            response.set_etag(etag_resposta)
+            response.last_modified = last_modified
+            # Sempre revalidar; a resposta depende da sessão do usuário
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            response.vary.add('Accept-Encoding')
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,295 @@
+"""
+Importação em lote de equipamentos a partir de planilhas CSV / XLSX
+Lê o arquivo em streaming, valida cada linha, confere duplicidade de número de série
+contra um conjunto carregado uma única vez e grava em inserts de várias linhas.
+"""
+import csv
+import io
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.supabase_client import get_supabase_client
+from app.models_supabase import Equipamento
+from app.export_service import paginar
+
+try:
+    import openpyxl
+except Exception:  # openpyxl ausente: apenas CSV é aceito
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+
+TAMANHO_LOTE = 500
+# Máximo de erros detalhados no relatório (o total continua sendo contado)
+MAX_ERROS_RELATORIO = 1000
+
+# Colunas aceitas na planilha (as demais são ignoradas)
+COLUNAS_IMPORTACAO = (
+    'nome', 'tipo', 'marca', 'modelo', 'numero_serie', 'processador', 'memoria_ram',
+    'armazenamento', 'sistema_operacional', 'status', 'data_aquisicao', 'valor',
+    'vida_util_anos', 'departamento_atual', 'observacoes'
+)
+
+# Tamanhos das colunas VARCHAR (ver supabase_init.sql); validar aqui evita derrubar o lote inteiro
+TAMANHOS_MAXIMOS = {
+    'nome': 100, 'tipo': 50, 'marca': 50, 'modelo': 100, 'numero_serie': 100,
+    'processador': 100, 'memoria_ram': 50, 'armazenamento': 50, 'sistema_operacional': 50,
+    'status': 20, 'departamento_atual': 100
+}
+
+FORMATOS_DATA = ('%Y-%m-%d', '%d/%m/%Y')
+
+
+def normalizar_cabecalho(nome: Any) -> str:
+    """'Número Serie ' -> 'numero_serie'"""
+    texto = str(nome or '').strip().lower().replace(' ', '_')
+    for origem, destino in (('á', 'a'), ('â', 'a'), ('ã', 'a'), ('é', 'e'), ('ê', 'e'),
+                            ('í', 'i'), ('ó', 'o'), ('ô', 'o'), ('õ', 'o'), ('ú', 'u'), ('ç', 'c')):
+        texto = texto.replace(origem, destino)
+    return texto
+
+
+def ler_csv(arquivo) -> Iterator[Dict[str, Any]]:
+    """Lê um CSV (separador ',' ou ';', com ou sem BOM) linha a linha"""
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    primeira_linha = texto.readline()
+    delimitador = ';' if primeira_linha.count(';') > primeira_linha.count(',') else ','
+    cabecalho = [normalizar_cabecalho(c) for c in next(csv.reader([primeira_linha], delimiter=delimitador), [])]
+
+    for valores in csv.reader(texto, delimiter=delimitador):
+        if not any(v.strip() for v in valores):
+            yield {}
+            continue
+        # Linhas curtas (colunas finais omitidas) recebem as mesmas chaves do cabeçalho
+        yield dict(zip(cabecalho, valores + [''] * (len(cabecalho) - len(valores))))
+
+
+def ler_xlsx(arquivo) -> Iterator[Dict[str, Any]]:
+    """Lê a primeira aba de um XLSX em modo somente leitura (sem carregar a planilha inteira)"""
+    if openpyxl is None:
+        raise ValueError('Importação de XLSX requer o pacote openpyxl (pip install openpyxl)')
+
+    workbook = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        linhas = workbook.worksheets[0].iter_rows(values_only=True)
+        cabecalho = [normalizar_cabecalho(c) for c in next(linhas, ())]
+        for valores in linhas:
+            if not any(v not in (None, '') for v in valores):
+                yield {}
+                continue
+            yield dict(zip(cabecalho, tuple(valores) + (None,) * (len(cabecalho) - len(valores))))
+    finally:
+        workbook.close()
+
+
+def ler_planilha(arquivo, nome_arquivo: str) -> Iterator[Dict[str, Any]]:
+    """Escolhe o leitor pela extensão do arquivo"""
+    extensao = (nome_arquivo or '').rsplit('.', 1)[-1].lower()
+    if extensao == 'csv':
+        return ler_csv(arquivo)
+    if extensao == 'xlsx':
+        return ler_xlsx(arquivo)
+    raise ValueError('Formato não suportado. Envie um arquivo .csv ou .xlsx')
+
+
+def _texto(valor: Any) -> Optional[str]:
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        # Números de série numéricos vindos do Excel ("12345.0")
+        valor = int(valor)
+    texto = str(valor).strip()
+    return texto or None
+
+
+def _numero(texto: str) -> float:
+    """Aceita '1234.5', '1234,5' e 'R$ 1.234,50'"""
+    texto = texto.replace('R$', '').replace(' ', '')
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    return float(texto)
+
+
+def validar_linha(linha: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Converte e valida uma linha da planilha.
+
+    Returns:
+        (dados prontos para o insert, lista de erros)
+    """
+    erros = []
+    dados = {}
+
+    for campo in COLUNAS_IMPORTACAO:
+        valor = linha.get(campo)
+        if campo == 'data_aquisicao':
+            dados[campo] = None
+            if isinstance(valor, datetime):
+                dados[campo] = valor.date().isoformat()
+            elif _texto(valor):
+                for formato in FORMATOS_DATA:
+                    try:
+                        dados[campo] = datetime.strptime(_texto(valor), formato).date().isoformat()
+                        break
+                    except ValueError:
+                        continue
+                else:
+                    erros.append(f'data_aquisicao inválida: {valor}')
+        elif campo in ('valor', 'vida_util_anos'):
+            dados[campo] = None
+            texto = _texto(valor)
+            if texto:
+                try:
+                    numero = _numero(texto) if isinstance(valor, str) else float(valor)
+                    dados[campo] = int(numero) if campo == 'vida_util_anos' else numero
+                except ValueError:
+                    erros.append(f'{campo} inválido: {valor}')
+        else:
+            dados[campo] = _texto(valor)
+
+    faltando = [c for c in Equipamento.CAMPOS_OBRIGATORIOS if not dados.get(c)]
+    if faltando:
+        erros.append(f'Campos obrigatórios faltando: {", ".join(faltando)}')
+
+    for campo, tamanho in TAMANHOS_MAXIMOS.items():
+        if dados.get(campo) and len(dados[campo]) > tamanho:
+            erros.append(f'{campo} excede {tamanho} caracteres')
+
+    return dados, erros
+
+
+def numeros_serie_existentes() -> Dict[str, int]:
+    """Carrega {numero_serie: id} de todos os equipamentos (uma consulta, paginada pelo limite do PostgREST)"""
+    client = get_supabase_client()
+    return {
+        row['numero_serie']: row['id']
+        for row in paginar(lambda: client.table('equipamentos').select('id,numero_serie'))
+    }
+
+
+class ImportacaoEquipamentos:
+    """Acumula linhas válidas e grava em lotes, registrando os erros por linha"""
+
+    def __init__(self, tamanho_lote: int = TAMANHO_LOTE, atualizar_existentes: bool = False):
+        self.tamanho_lote = max(1, tamanho_lote)
+        self.atualizar_existentes = atualizar_existentes
+        self.client = get_supabase_client()
+        self.existentes = numeros_serie_existentes()
+        self.vistos = set()
+        # Colunas da planilha (as chaves da primeira linha): definem as colunas das atualizações
+        self.colunas_planilha: Optional[frozenset] = None
+        self.novos: List[Tuple[int, Dict[str, Any]]] = []
+        self.atualizacoes: List[Tuple[int, Dict[str, Any]]] = []
+        self.total = 0
+        self.inseridos = 0
+        self.atualizados = 0
+        self.total_erros = 0
+        self.erros: List[Dict[str, Any]] = []
+
+    def registrar_erro(self, numero_linha: int, numero_serie: Optional[str], mensagens: List[str]):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS_RELATORIO:
+            self.erros.append({'linha': numero_linha, 'numero_serie': numero_serie, 'erros': mensagens})
+
+    def adicionar(self, numero_linha: int, linha: Dict[str, Any]):
+        self.total += 1
+        if self.colunas_planilha is None:
+            self.colunas_planilha = frozenset(linha)
+        dados, erros = validar_linha(linha)
+        numero_serie = dados.get('numero_serie')
+
+        if numero_serie:
+            if numero_serie in self.vistos:
+                erros.append('numero_serie repetido na planilha')
+            elif numero_serie in self.existentes and not self.atualizar_existentes:
+                erros.append('numero_serie já cadastrado')
+
+        if erros:
+            self.registrar_erro(numero_linha, numero_serie, erros)
+            return
+
+        self.vistos.add(numero_serie)
+        if numero_serie in self.existentes:
+            # Atualização: só as colunas presentes na planilha; as ausentes mantêm o valor cadastrado
+            # (o mesmo conjunto de colunas em todas as linhas, como o upsert em lote exige)
+            dados = {campo: valor for campo, valor in dados.items() if campo in self.colunas_planilha}
+            dados['data_atualizacao'] = datetime.utcnow().isoformat()
+            self.atualizacoes.append((numero_linha, dados))
+            if len(self.atualizacoes) >= self.tamanho_lote:
+                self._gravar_atualizacoes()
+        else:
+            if dados['vida_util_anos'] is None:
+                dados['vida_util_anos'] = 5
+            dados['data_cadastro'] = datetime.utcnow().isoformat()
+            self.novos.append((numero_linha, dados))
+            if len(self.novos) >= self.tamanho_lote:
+                self._gravar_novos()
+
+    def _gravar(self, lote: List[Tuple[int, Dict[str, Any]]], executar) -> int:
+        """Grava o lote numa requisição; se falhar, repete linha a linha para isolar os erros"""
+        if not lote:
+            return 0
+        try:
+            executar([dados for _, dados in lote])
+            return len(lote)
+        except Exception as e:
+            logger.warning(f'Lote de {len(lote)} linhas rejeitado, gravando individualmente: {e}')
+
+        gravados = 0
+        for numero_linha, dados in lote:
+            try:
+                executar([dados])
+                gravados += 1
+            except Exception as e:
+                self.vistos.discard(dados['numero_serie'])
+                self.registrar_erro(numero_linha, dados['numero_serie'], [str(e)])
+        return gravados
+
+    def _gravar_novos(self):
+        self.inseridos += self._gravar(
+            self.novos,
+            lambda linhas: self.client.table('equipamentos').insert(linhas).execute()
+        )
+        self.novos = []
+
+    def _gravar_atualizacoes(self):
+        self.atualizados += self._gravar(
+            self.atualizacoes,
+            lambda linhas: self.client.table('equipamentos').upsert(linhas, on_conflict='numero_serie').execute()
+        )
+        self.atualizacoes = []
+
+    def finalizar(self) -> Dict[str, Any]:
+        self._gravar_novos()
+        self._gravar_atualizacoes()
+        return {
+            'total_linhas': self.total,
+            'inseridos': self.inseridos,
+            'atualizados': self.atualizados,
+            'total_erros': self.total_erros,
+            'erros': self.erros
+        }
+
+
+def importar_equipamentos(linhas: Iterable[Dict[str, Any]], tamanho_lote: int = TAMANHO_LOTE,
+                          atualizar_existentes: bool = False) -> Dict[str, Any]:
+    """
+    Importa equipamentos a partir das linhas já lidas da planilha.
+
+    Args:
+        linhas: iterável de dicts (cabeçalho normalizado -> valor), ex.: ler_planilha()
+        tamanho_lote: linhas por insert
+        atualizar_existentes: se True, números de série já cadastrados são atualizados (upsert)
+                              em vez de reportados como erro
+
+    Returns:
+        Relatório com totais e erros por linha (numeração da planilha, cabeçalho = linha 1)
+    """
+    importacao = ImportacaoEquipamentos(tamanho_lote=tamanho_lote, atualizar_existentes=atualizar_existentes)
+    for numero_linha, linha in enumerate(linhas, start=2):
+        if not linha:
+            continue
+        importacao.adicionar(numero_linha, linha)
+    return importacao.finalizar()
@@ -0,0 +1,186 @@
+"""
+Instrumentação por requisição das chamadas ao Supabase e das APIs externas
+O cliente devolvido por get_supabase_client() é envolvido por um proxy que mede cada execute()
+(tabela ou função RPC, operação e duração); as chamadas HTTP aos provedores (WhatsApp, Telegram,
+push) são medidas com `medir_http`. Ao fim da requisição, o resumo vai para o cabeçalho
+Server-Timing e para um log JSON; requisições acima de SUPABASE_CALL_BUDGET chamadas são sinalizadas
+(é assim que aparecem os N+1 nas rotas).
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+
+SUPABASE = 'supabase'
+HTTP = 'http'
+# Métodos do builder do postgrest que definem a operação da consulta
+OPERACOES = ('select', 'insert', 'update', 'upsert', 'delete')
+# Tabelas detalhadas no Server-Timing (as de maior tempo)
+MAXIMO_TABELAS_HEADER = 5
+
+# Callbacks(tipo, alvo, operacao, duracao_segundos, erro) chamados a cada chamada medida,
+# com ou sem requisição em andamento (ex.: métricas agregadas)
+_ouvintes: List[Callable[[str, str, str, float, bool], None]] = []
+
+
+def adicionar_ouvinte(funcao: Callable[[str, str, str, float, bool], None]):
+    _ouvintes.append(funcao)
+
+
+def registrar_chamada(tipo: str, alvo: str, operacao: str, duracao: float, erro: bool = False):
+    """Registra uma chamada externa na requisição atual (se houver) e avisa os ouvintes"""
+    for ouvinte in _ouvintes:
+        try:
+            ouvinte(tipo, alvo, operacao, duracao, erro)
+        except Exception as e:
+            logger.debug(f'Ouvinte de instrumentação falhou: {e}')
+    if not has_request_context():
+        return
+    chamadas = g.get('instrumentacao_chamadas')
+    if chamadas is None:
+        chamadas = g.instrumentacao_chamadas = []
+    chamadas.append({'tipo': tipo, 'alvo': alvo, 'operacao': operacao,
+                     'duracao_ms': round(duracao * 1000, 2), 'erro': erro})
+
+
+@contextmanager
+def medir(tipo: str, alvo: str, operacao: str = ''):
+    inicio = time.perf_counter()
+    erro = False
+    try:
+        yield
+    except Exception:
+        erro = True
+        raise
+    finally:
+        registrar_chamada(tipo, alvo, operacao, time.perf_counter() - inicio, erro)
+
+
+def medir_http(provedor: str, operacao: str = 'POST'):
+    """Mede uma chamada HTTP a um provedor externo: `with medir_http('telegram'): requests.post(...)`"""
+    return medir(HTTP, provedor, operacao)
+
+
+# ==================== PROXY DO CLIENTE SUPABASE ====================
+
+class _ConsultaInstrumentada:
+    """Envolve o builder do postgrest; cada método encadeado devolve outro proxy até o execute()"""
+
+    def __init__(self, builder: Any, alvo: str, operacao: str = ''):
+        self._builder = builder
+        self._alvo = alvo
+        self._operacao = operacao
+
+    def _envolver(self, resultado: Any, nome: str) -> Any:
+        if not hasattr(resultado, 'execute'):
+            return resultado
+        operacao = self._operacao or (nome if nome in OPERACOES else '')
+        return _ConsultaInstrumentada(resultado, self._alvo, operacao)
+
+    def execute(self, *args, **kwargs):
+        with medir(SUPABASE, self._alvo, self._operacao or 'select'):
+            return self._builder.execute(*args, **kwargs)
+
+    def __getattr__(self, nome: str):
+        atributo = getattr(self._builder, nome)
+        if not callable(atributo):
+            return self._envolver(atributo, nome)  # ex.: .not_
+
+        def chamar(*args, **kwargs):
+            return self._envolver(atributo(*args, **kwargs), nome)
+        return chamar
+
+
+class ClienteInstrumentado:
+    """Proxy do supabase.Client: table()/from_()/rpc() medidos; o resto passa direto"""
+
+    def __init__(self, cliente: Any):
+        self._cliente = cliente
+
+    def table(self, nome: str) -> _ConsultaInstrumentada:
+        return _ConsultaInstrumentada(self._cliente.table(nome), nome)
+
+    from_ = table
+
+    def rpc(self, funcao: str, parametros: Optional[Dict[str, Any]] = None, *args, **kwargs) -> _ConsultaInstrumentada:
+        return _ConsultaInstrumentada(self._cliente.rpc(funcao, parametros or {}, *args, **kwargs),
+                                      f'rpc:{funcao}', 'rpc')
+
+    def __getattr__(self, nome: str):
+        return getattr(self._cliente, nome)
+
+
+# ==================== RESUMO DA REQUISIÇÃO ====================
+
+def resumir(chamadas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totais por tipo (supabase/http) e por alvo (tabela, função ou provedor)"""
+    resumo: Dict[str, Any] = {}
+    for chamada in chamadas:
+        tipo = resumo.setdefault(chamada['tipo'], {'chamadas': 0, 'duracao_ms': 0.0, 'erros': 0, 'alvos': {}})
+        alvo = tipo['alvos'].setdefault(chamada['alvo'], {'chamadas': 0, 'duracao_ms': 0.0})
+        for item in (tipo, alvo):
+            item['chamadas'] += 1
+            item['duracao_ms'] = round(item['duracao_ms'] + chamada['duracao_ms'], 2)
+        if chamada['erro']:
+            tipo['erros'] += 1
+    return resumo
+
+
+def _server_timing(resumo: Dict[str, Any], duracao_ms: float) -> str:
+    metricas = [f'app;dur={duracao_ms:.1f}']
+    for tipo, dados in resumo.items():
+        metricas.append(f'{tipo};dur={dados["duracao_ms"]:.1f};desc="{dados["chamadas"]} chamada(s)"')
+        alvos = sorted(dados['alvos'].items(), key=lambda item: item[1]['duracao_ms'], reverse=True)
+        for alvo, valores in alvos[:MAXIMO_TABELAS_HEADER]:
+            nome = ''.join(c if c.isalnum() or c in '-_' else '-' for c in alvo)
+            metricas.append(f'{tipo}-{nome};dur={valores["duracao_ms"]:.1f};desc="{valores["chamadas"]}x"')
+    return ', '.join(metricas)
+
+
+def init_instrumentacao(app):
+    """Registra os hooks que medem a requisição e publicam o resumo"""
+    app.config.setdefault('INSTRUMENTATION_ENABLED', True)
+    app.config.setdefault('SERVER_TIMING_ENABLED', True)
+    app.config.setdefault('SUPABASE_CALL_BUDGET', 10)
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+
+    @app.before_request
+    def iniciar_medicao():
+        g.instrumentacao_inicio = time.perf_counter()
+
+    @app.after_request
+    def publicar_medicao(response):
+        inicio = g.get('instrumentacao_inicio')
+        if inicio is None:
+            return response
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        resumo = resumir(g.get('instrumentacao_chamadas') or [])
+
+        if app.config['SERVER_TIMING_ENABLED']:
+            response.headers['Server-Timing'] = _server_timing(resumo, duracao_ms)
+
+        chamadas_supabase = resumo.get(SUPABASE, {}).get('chamadas', 0)
+        orcamento = app.config['SUPABASE_CALL_BUDGET']
+        acima_orcamento = bool(orcamento) and chamadas_supabase > orcamento
+        registro = {
+            'evento': 'requisicao',
+            'metodo': request.method,
+            'rota': request.url_rule.rule if request.url_rule else request.path,
+            'caminho': request.path,
+            'status': response.status_code,
+            'duracao_ms': round(duracao_ms, 2),
+            **resumo,
+            'acima_orcamento': acima_orcamento
+        }
+        if acima_orcamento:
+            logger.warning(json.dumps(registro, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(registro, ensure_ascii=False))
+        return response
@@ -0,0 +1,274 @@
+"""
+Operações em lote sobre empréstimos e equipamentos (check-in, check-out e troca de status)
+Cada lote é resolvido com poucas consultas (filtros IN) e aplicado por conjunto via funções
+SQL (ver supabase_init.sql), em vez de cinco chamadas REST por item.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.supabase_client import get_supabase_client
+from app.models_supabase import Equipamento, Emprestimo
+
+logger = logging.getLogger(__name__)
+
+
+# Máximo de itens aceitos por requisição
+LIMITE_LOTE = 1000
+# Valores por filtro IN (mantém a URL do PostgREST num tamanho seguro)
+TAMANHO_BLOCO_IN = 200
+# Código do PostgREST para função RPC inexistente (supabase_init.sql não aplicado)
+RPC_INEXISTENTE = 'PGRST202'
+
+STATUS_LOTE = ('Estoque', 'Manutenção', 'Inativo')
+
+
+def em_blocos(valores: List[Any], tamanho: int = TAMANHO_BLOCO_IN) -> Iterator[List[Any]]:
+    for inicio in range(0, len(valores), tamanho):
+        yield valores[inicio:inicio + tamanho]
+
+
+def buscar_por(montar_query: Callable[[], Any], coluna: str, valores: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Executa montar_query().in_(coluna, bloco) para cada bloco de valores"""
+    valores = list(dict.fromkeys(valores))
+    linhas = []
+    for bloco in em_blocos(valores):
+        linhas.extend(montar_query().in_(coluna, bloco).execute().data or [])
+    return linhas
+
+
+def normalizar_entrada(ids: Optional[Iterable[Any]], numeros_serie: Optional[Iterable[Any]]):
+    """Valida o corpo da requisição: lista de ids (inteiros) ou de números de série"""
+    ids = [int(i) for i in (ids or [])]
+    numeros_serie = [str(n).strip() for n in (numeros_serie or []) if str(n).strip()]
+    if not ids and not numeros_serie:
+        raise ValueError('Informe uma lista de ids ou de numeros_serie')
+    if len(ids) + len(numeros_serie) > LIMITE_LOTE:
+        raise ValueError(f'Máximo de {LIMITE_LOTE} itens por lote')
+    return list(dict.fromkeys(ids)), list(dict.fromkeys(numeros_serie))
+
+
+def _rpc_ou_fallback(nome: str, parametros: Dict[str, Any], fallback: Callable[[], List[Dict[str, Any]]]):
+    client = get_supabase_client()
+    try:
+        return client.rpc(nome, parametros).execute().data or []
+    except Exception as e:
+        if getattr(e, 'code', None) != RPC_INEXISTENTE:
+            raise
+        logger.warning(f'Função {nome} não encontrada no banco; aplicando lote com updates por conjunto')
+        return fallback()
+
+
+def devolver_emprestimos(ids=None, numeros_serie=None) -> Dict[str, Any]:
+    """
+    Registra a devolução de vários empréstimos (por id do empréstimo ou número de série do equipamento).
+
+    Returns:
+        {'emprestimos': [Emprestimo devolvidos], 'erros': [{'item', 'erro'}]}
+    """
+    ids, numeros_serie = normalizar_entrada(ids, numeros_serie)
+    client = get_supabase_client()
+    erros = []
+    candidatos: Dict[int, Emprestimo] = {}
+
+    if ids:
+        linhas = buscar_por(lambda: client.table('emprestimos').select(Emprestimo.select_clause()), 'id', ids)
+        encontrados = {linha['id']: Emprestimo(linha) for linha in linhas}
+        for emprestimo_id in ids:
+            emprestimo = encontrados.get(emprestimo_id)
+            if not emprestimo:
+                erros.append({'item': emprestimo_id, 'erro': 'Empréstimo não encontrado'})
+            elif emprestimo.status == 'Devolvido':
+                erros.append({'item': emprestimo_id, 'erro': 'Este empréstimo já foi devolvido'})
+            else:
+                candidatos[emprestimo.id] = emprestimo
+
+    if numeros_serie:
+        # !inner permite filtrar empréstimos pelo número de série do equipamento embutido
+        linhas = buscar_por(
+            lambda: client.table('emprestimos').select(f'*, equipamentos!inner({Equipamento.COLUNAS})').eq('status', 'Ativo'),
+            'equipamentos.numero_serie', numeros_serie
+        )
+        por_serie = {}
+        for linha in linhas:
+            emprestimo = Emprestimo(linha)
+            por_serie[emprestimo.equipamento.numero_serie] = emprestimo
+        for numero_serie in numeros_serie:
+            emprestimo = por_serie.get(numero_serie)
+            if not emprestimo:
+                erros.append({'item': numero_serie, 'erro': 'Nenhum empréstimo ativo para este número de série'})
+            else:
+                candidatos[emprestimo.id] = emprestimo
+
+    if not candidatos:
+        return {'emprestimos': [], 'erros': erros}
+
+    def fallback():
+        agora = datetime.utcnow().isoformat()
+        atualizados = client.table('emprestimos').update({
+            'status': 'Devolvido', 'data_devolucao_real': agora
+        }).in_('id', list(candidatos)).neq('status', 'Devolvido').execute().data or []
+        equipamento_ids = list({linha['equipamento_id'] for linha in atualizados})
+        if equipamento_ids:
+            client.table('equipamentos').update({'status': 'Estoque', 'data_atualizacao': agora}) \
+                .in_('id', equipamento_ids).eq('status', 'Emprestado').execute()
+        return atualizados
+
+    linhas = _rpc_ou_fallback('devolver_emprestimos_lote', {'p_ids': list(candidatos)}, fallback)
+
+    devolvidos = []
+    for linha in linhas:
+        emprestimo = Emprestimo(linha)
+        emprestimo.equipamento = candidatos[emprestimo.id].equipamento
+        if emprestimo.equipamento:
+            emprestimo.equipamento.status = 'Estoque'
+        devolvidos.append(emprestimo)
+
+    # Devolvidos por outra requisição entre a consulta e o update
+    ids_devolvidos = {e.id for e in devolvidos}
+    for emprestimo_id in candidatos:
+        if emprestimo_id not in ids_devolvidos:
+            erros.append({'item': emprestimo_id, 'erro': 'Este empréstimo já foi devolvido'})
+
+    return {'emprestimos': devolvidos, 'erros': erros}
+
+
+def _resolver_equipamentos(ids: List[int], numeros_serie: List[str], erros: List[Dict[str, Any]]) -> Dict[int, Equipamento]:
+    """Carrega os equipamentos por id e/ou número de série, registrando os não encontrados"""
+    client = get_supabase_client()
+    equipamentos: Dict[int, Equipamento] = {}
+
+    if ids:
+        encontrados = {linha['id']: Equipamento(linha) for linha in buscar_por(
+            lambda: client.table('equipamentos').select(Equipamento.COLUNAS), 'id', ids
+        )}
+        for equipamento_id in ids:
+            if equipamento_id in encontrados:
+                equipamentos[equipamento_id] = encontrados[equipamento_id]
+            else:
+                erros.append({'item': equipamento_id, 'erro': 'Equipamento não encontrado'})
+
+    if numeros_serie:
+        encontrados = {linha['numero_serie']: Equipamento(linha) for linha in buscar_por(
+            lambda: client.table('equipamentos').select(Equipamento.COLUNAS), 'numero_serie', numeros_serie
+        )}
+        for numero_serie in numeros_serie:
+            if numero_serie in encontrados:
+                equipamentos[encontrados[numero_serie].id] = encontrados[numero_serie]
+            else:
+                erros.append({'item': numero_serie, 'erro': 'Equipamento não encontrado'})
+
+    return equipamentos
+
+
+def emprestar_equipamentos(dados: Dict[str, Any], ids=None, numeros_serie=None) -> Dict[str, Any]:
+    """
+    Registra o empréstimo de vários equipamentos para o mesmo responsável.
+
+    Args:
+        dados: responsavel, departamento (obrigatórios), email_responsavel, telefone_responsavel,
+               data_devolucao_prevista (YYYY-MM-DD), observacoes
+        ids / numeros_serie: equipamentos a emprestar
+
+    Returns:
+        {'emprestimos': [Emprestimo criados], 'erros': [{'item', 'erro'}]}
+    """
+    ids, numeros_serie = normalizar_entrada(ids, numeros_serie)
+    faltando = [c for c in ('responsavel', 'departamento') if not dados.get(c)]
+    if faltando:
+        raise ValueError(f'Campos obrigatórios faltando: {", ".join(faltando)}')
+
+    data_devolucao_prevista = None
+    if dados.get('data_devolucao_prevista'):
+        data_devolucao_prevista = datetime.strptime(dados['data_devolucao_prevista'], '%Y-%m-%d').date().isoformat()
+
+    parametros = {
+        'responsavel': dados['responsavel'],
+        'departamento': dados['departamento'],
+        'email_responsavel': dados.get('email_responsavel'),
+        'telefone_responsavel': dados.get('telefone_responsavel'),
+        'data_devolucao_prevista': data_devolucao_prevista,
+        'observacoes': dados.get('observacoes')
+    }
+
+    erros = []
+    equipamentos = _resolver_equipamentos(ids, numeros_serie, erros)
+    disponiveis = {}
+    for equipamento_id, equipamento in equipamentos.items():
+        if equipamento.status != 'Estoque':
+            erros.append({
+                'item': equipamento.numero_serie,
+                'erro': f'Equipamento não está disponível. Status atual: {equipamento.status}'
+            })
+        else:
+            disponiveis[equipamento_id] = equipamento
+
+    if not disponiveis:
+        return {'emprestimos': [], 'erros': erros}
+
+    client = get_supabase_client()
+
+    def fallback():
+        reservados = client.table('equipamentos').update({
+            'status': 'Emprestado', 'data_atualizacao': datetime.utcnow().isoformat()
+        }).in_('id', list(disponiveis)).eq('status', 'Estoque').execute().data or []
+        if not reservados:
+            return []
+        hoje = datetime.utcnow().date().isoformat()
+        return client.table('emprestimos').insert([
+            {**parametros, 'equipamento_id': linha['id'], 'status': 'Ativo', 'data_emprestimo': hoje}
+            for linha in reservados
+        ]).execute().data or []
+
+    linhas = _rpc_ou_fallback(
+        'emprestar_equipamentos_lote',
+        {'p_equipamento_ids': list(disponiveis), 'p_dados': parametros},
+        fallback
+    )
+
+    criados = []
+    for linha in linhas:
+        emprestimo = Emprestimo(linha)
+        emprestimo.equipamento = disponiveis[emprestimo.equipamento_id]
+        emprestimo.equipamento.status = 'Emprestado'
+        criados.append(emprestimo)
+
+    # Emprestados por outra requisição entre a consulta e o update
+    emprestados = {e.equipamento_id for e in criados}
+    for equipamento_id, equipamento in disponiveis.items():
+        if equipamento_id not in emprestados:
+            erros.append({'item': equipamento.numero_serie, 'erro': 'Equipamento não está disponível'})
+
+    return {'emprestimos': criados, 'erros': erros}
+
+
+def atualizar_status_equipamentos(status: str, ids=None, numeros_serie=None) -> Dict[str, Any]:
+    """
+    Altera o status de vários equipamentos num único UPDATE.
+    Equipamentos emprestados não são alterados (use a devolução em lote).
+
+    Returns:
+        {'equipamentos': [Equipamento atualizados], 'erros': [{'item', 'erro'}]}
+    """
+    if status not in STATUS_LOTE:
+        raise ValueError(f'Status inválido. Use: {", ".join(STATUS_LOTE)}')
+    ids, numeros_serie = normalizar_entrada(ids, numeros_serie)
+
+    erros = []
+    equipamentos = _resolver_equipamentos(ids, numeros_serie, erros)
+    alteraveis = []
+    for equipamento_id, equipamento in equipamentos.items():
+        if equipamento.status == 'Emprestado':
+            erros.append({'item': equipamento.numero_serie, 'erro': 'Equipamento emprestado; registre a devolução'})
+        else:
+            alteraveis.append(equipamento_id)
+
+    if not alteraveis:
+        return {'equipamentos': [], 'erros': erros}
+
+    client = get_supabase_client()
+    linhas = client.table('equipamentos').update({
+        'status': status, 'data_atualizacao': datetime.utcnow().isoformat()
+    }).in_('id', alteraveis).neq('status', 'Emprestado').execute().data or []
+
+    return {'equipamentos': [Equipamento(linha) for linha in linhas], 'erros': erros}
@@ -0,0 +1,396 @@
+"""
+Métricas no formato de exposição do Prometheus (GET /metrics)
+Cada processo (workers do servidor web, worker.py) acumula contadores e histogramas em memória e
+grava um snapshot em METRICS_DIR/<pid>.json a cada METRICS_FLUSH_SECONDS. O /metrics soma os
+snapshots de todos os processos da máquina (o do próprio processo vem da memória), então qualquer
+worker que atender o scrape devolve o total. Contadores e histogramas só crescem: os snapshots de
+processos encerrados são somados em acumulado.json em vez de descartados, e o total não "volta"
+quando um worker reinicia.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem compactação dos snapshots de processos encerrados
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+CONTADOR = 'counter'
+HISTOGRAMA = 'histogram'
+ARQUIVO_ACUMULADO = 'acumulado.json'
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_JOBS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+# nome -> (tipo, descrição, buckets)
+DEFINICOES: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {
+    'http_requisicoes_duracao_segundos': (HISTOGRAMA, 'Duração das requisições HTTP por rota', BUCKETS_HTTP),
+    'supabase_chamadas_duracao_segundos': (HISTOGRAMA, 'Duração das chamadas ao Supabase por tabela/função', BUCKETS_HTTP),
+    'supabase_chamadas_erros_total': (CONTADOR, 'Chamadas ao Supabase que falharam', ()),
+    'http_externo_duracao_segundos': (HISTOGRAMA, 'Duração das chamadas HTTP aos provedores externos', BUCKETS_HTTP),
+    'cache_consultas_total': (CONTADOR, 'Consultas aos caches em memória por resultado', ()),
+    'agendador_job_duracao_segundos': (HISTOGRAMA, 'Duração das tarefas agendadas executadas', BUCKETS_JOBS),
+    'notificacoes_total': (CONTADOR, 'Notificações enviadas por canal e resultado', ()),
+}
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+def _rotulos(valores: Dict[str, Any]) -> Rotulos:
+    return tuple(sorted((chave, str(valor)) for chave, valor in valores.items()))
+
+
+class _Registro:
+    """Contadores e histogramas do processo atual"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores: Dict[Tuple[str, Rotulos], float] = {}
+        # (nome, rótulos) -> [contagens por bucket (+Inf no fim), soma]
+        self.histogramas: Dict[Tuple[str, Rotulos], List[Any]] = {}
+        # Funções chamadas no snapshot: devolvem (nome, rótulos, valor) de contadores mantidos fora
+        # daqui (ex.: acertos dos caches)
+        self.coletores: List[Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]] = []
+
+    def incrementar(self, nome: str, valor: float, rotulos: Dict[str, Any]):
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def observar(self, nome: str, valor: float, rotulos: Dict[str, Any]):
+        buckets = DEFINICOES[nome][2]
+        chave = (nome, _rotulos(rotulos))
+        indice = next((i for i, limite in enumerate(buckets) if valor <= limite), len(buckets))
+        with self._lock:
+            histograma = self.histogramas.get(chave)
+            if histograma is None:
+                histograma = self.histogramas[chave] = [[0] * (len(buckets) + 1), 0.0]
+            histograma[0][indice] += 1
+            histograma[1] += valor
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            contadores = [[nome, dict(rotulos), valor] for (nome, rotulos), valor in self.contadores.items()]
+            histogramas = [[nome, dict(rotulos), list(contagens), soma]
+                           for (nome, rotulos), (contagens, soma) in self.histogramas.items()]
+        for coletor in self.coletores:
+            try:
+                contadores.extend([nome, rotulos, valor] for nome, rotulos, valor in coletor())
+            except Exception as e:
+                logger.debug(f'Coletor de métricas falhou: {e}')
+        return {'contadores': contadores, 'histogramas': histogramas}
+
+
+_registro = _Registro()
+_pasta: Optional[str] = None
+_intervalo = 5.0
+_ultimo_salvamento = 0.0
+_lock_salvamento = threading.Lock()
+
+
+def incrementar(nome: str, valor: float = 1, **rotulos):
+    _registro.incrementar(nome, valor, rotulos)
+    salvar()
+
+
+def observar(nome: str, valor: float, **rotulos):
+    _registro.observar(nome, valor, rotulos)
+    salvar()
+
+
+def adicionar_coletor(coletor: Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]):
+    _registro.coletores.append(coletor)
+
+
+# ==================== MULTIPROCESSO ====================
+
+def _caminho_processo(pid: int) -> str:
+    return os.path.join(_pasta, f'{pid}.json')
+
+
+def _gravar_json(caminho: str, dados: Dict[str, Any]):
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(temporario, caminho)
+
+
+def _ler_json(caminho: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def salvar(forcar: bool = False):
+    """Grava o snapshot do processo (no máximo a cada METRICS_FLUSH_SECONDS, salvo `forcar`)"""
+    global _ultimo_salvamento
+    if _pasta is None:
+        return
+    agora = time.monotonic()
+    if not forcar and agora - _ultimo_salvamento < _intervalo:
+        return
+    if not _lock_salvamento.acquire(blocking=forcar):
+        return
+    try:
+        _ultimo_salvamento = agora
+        _gravar_json(_caminho_processo(os.getpid()), _registro.snapshot())
+    except OSError as e:
+        logger.warning(f'Não foi possível gravar as métricas do processo: {e}')
+    finally:
+        _lock_salvamento.release()
+
+
+def _processo_ativo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _somar(destino: Dict[Tuple[str, Rotulos], Any], snapshot: Dict[str, Any]):
+    for nome, rotulos, valor in snapshot.get('contadores', []):
+        chave = (CONTADOR, nome, _rotulos(rotulos))
+        destino[chave] = destino.get(chave, 0) + valor
+    for nome, rotulos, contagens, soma in snapshot.get('histogramas', []):
+        chave = (HISTOGRAMA, nome, _rotulos(rotulos))
+        atual = destino.get(chave)
+        if atual is None:
+            destino[chave] = [list(contagens), soma]
+        elif len(atual[0]) == len(contagens):
+            atual[0] = [a + b for a, b in zip(atual[0], contagens)]
+            atual[1] += soma
+
+
+def _para_snapshot(somados: Dict[Tuple[str, str, Rotulos], Any]) -> Dict[str, Any]:
+    return {
+        'contadores': [[nome, dict(rotulos), valor] for (tipo, nome, rotulos), valor in somados.items()
+                       if tipo == CONTADOR],
+        'histogramas': [[nome, dict(rotulos), valor[0], valor[1]] for (tipo, nome, rotulos), valor in somados.items()
+                        if tipo == HISTOGRAMA]
+    }
+
+
+@contextmanager
+def _trava(exclusiva: bool):
+    """
+    Trava de arquivo da pasta: exclusiva na compactação, compartilhada na leitura do /metrics, que
+    assim nunca vê o acumulado novo junto com os snapshots que ele já somou (contagem em dobro)
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(_pasta, '.trava'), 'a') as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH)
+        yield
+
+
+def compactar():
+    """
+    Soma os snapshots de processos encerrados em acumulado.json (com trava de arquivo). Chamado na
+    inicialização, antes do primeiro snapshot: um arquivo com o PID atual é de um processo anterior
+    que teve o mesmo PID (ex.: contêiner reiniciado)
+    """
+    if _pasta is None or fcntl is None:
+        return
+    with _trava(exclusiva=True):
+        encerrados = []
+        for caminho in glob.glob(os.path.join(_pasta, '*.json')):
+            nome = os.path.splitext(os.path.basename(caminho))[0]
+            if nome.isdigit() and (int(nome) == os.getpid() or not _processo_ativo(int(nome))):
+                encerrados.append(caminho)
+        if not encerrados:
+            return
+        somados: Dict[Tuple[str, str, Rotulos], Any] = {}
+        caminho_acumulado = os.path.join(_pasta, ARQUIVO_ACUMULADO)
+        for caminho in [caminho_acumulado] + encerrados:
+            snapshot = _ler_json(caminho)
+            if snapshot:
+                _somar(somados, snapshot)
+        _gravar_json(caminho_acumulado, _para_snapshot(somados))
+        for caminho in encerrados:
+            os.remove(caminho)
+
+
+def _snapshots() -> Iterable[Dict[str, Any]]:
+    """Snapshot atual deste processo e os gravados pelos demais (inclusive o acumulado)"""
+    yield _registro.snapshot()
+    if _pasta is None:
+        return
+    proprio = _caminho_processo(os.getpid())
+    with _trava(exclusiva=False):
+        gravados = [_ler_json(caminho) for caminho in glob.glob(os.path.join(_pasta, '*.json'))
+                    if caminho != proprio]
+    yield from (snapshot for snapshot in gravados if snapshot)
+
+
+# ==================== EXPOSIÇÃO ====================
+
+def _escapar(valor: str) -> str:
+    return valor.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _formatar_rotulos(rotulos: Rotulos, extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{chave}="{_escapar(valor)}"' for chave, valor in pares) + '}'
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def _taxas_cache(somados: Dict[Tuple[str, str, Rotulos], Any]) -> Dict[str, float]:
+    """Taxa de acerto por cache (acertos, inclusive servidos obsoletos, sobre o total de consultas)"""
+    por_cache: Dict[str, Dict[str, float]] = {}
+    for (tipo, nome, rotulos), valor in somados.items():
+        if nome == 'cache_consultas_total':
+            rotulos = dict(rotulos)
+            por_cache.setdefault(rotulos.get('cache', ''), {})[rotulos.get('resultado', '')] = valor
+    taxas = {}
+    for cache, resultados in por_cache.items():
+        acertos = resultados.get('acerto', 0) + resultados.get('obsoleto', 0)
+        total = acertos + resultados.get('falha', 0)
+        if total:
+            taxas[cache] = acertos / total
+    return taxas
+
+
+def exportar() -> str:
+    """Todas as métricas (somadas entre os processos) no formato de texto do Prometheus"""
+    somados: Dict[Tuple[str, str, Rotulos], Any] = {}
+    for snapshot in _snapshots():
+        _somar(somados, snapshot)
+
+    linhas = []
+    for nome, (tipo, descricao, buckets) in DEFINICOES.items():
+        series = sorted((rotulos, valor) for (t, n, rotulos), valor in somados.items() if n == nome and t == tipo)
+        linhas.append(f'# HELP {nome} {descricao}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for rotulos, valor in series:
+            if tipo == CONTADOR:
+                linhas.append(f'{nome}{_formatar_rotulos(rotulos)} {_numero(valor)}')
+                continue
+            contagens, soma = valor
+            acumulado = 0
+            for limite, contagem in zip(list(buckets) + ['+Inf'], contagens):
+                acumulado += contagem
+                le = limite if limite == '+Inf' else _numero(limite)
+                linhas.append(f'{nome}_bucket{_formatar_rotulos(rotulos, ("le", le))} {acumulado}')
+            linhas.append(f'{nome}_sum{_formatar_rotulos(rotulos)} {_numero(soma)}')
+            linhas.append(f'{nome}_count{_formatar_rotulos(rotulos)} {acumulado}')
+
+    linhas.append('# HELP cache_taxa_acerto Fração das consultas atendidas pelo cache')
+    linhas.append('# TYPE cache_taxa_acerto gauge')
+    for cache, taxa in sorted(_taxas_cache(somados).items()):
+        linhas.append(f'cache_taxa_acerto{_formatar_rotulos((("cache", cache),))} {round(taxa, 4)}')
+    return '\n'.join(linhas) + '\n'
+
+
+# ==================== INTEGRAÇÕES ====================
+
+def contar_notificacao(canal: str, sucesso: bool):
+    incrementar('notificacoes_total', canal=canal, resultado='sucesso' if sucesso else 'falha')
+
+
+def notificacao(canal: str):
+    """
+    Decorator para funções de envio: conta sucesso quando o retorno é verdadeiro (ou um dict com
+    success=True) e falha quando é falso ou há exceção
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                resultado = f(*args, **kwargs)
+            except Exception:
+                contar_notificacao(canal, False)
+                raise
+            sucesso = resultado.get('success') if isinstance(resultado, dict) else resultado
+            contar_notificacao(canal, bool(sucesso))
+            return resultado
+        return decorated_function
+    return decorator
+
+
+def _registrar_chamada_externa(tipo: str, alvo: str, operacao: str, duracao: float, erro: bool):
+    from app.instrumentacao import SUPABASE
+
+    if tipo == SUPABASE:
+        _registro.observar('supabase_chamadas_duracao_segundos', duracao, {'alvo': alvo, 'operacao': operacao})
+        if erro:
+            _registro.incrementar('supabase_chamadas_erros_total', 1, {'alvo': alvo, 'operacao': operacao})
+    else:
+        _registro.observar('http_externo_duracao_segundos', duracao, {'provedor': alvo, 'erro': str(erro).lower()})
+    salvar()
+
+
+def _coletar_caches() -> Iterable[Tuple[str, Dict[str, Any], float]]:
+    from app.cache import CACHES
+
+    # CacheTTL tem acertos/falhas; CacheSWR também obsoletos/compartilhados (contados dentro de falhas)
+    atributos = {'acerto': 'acertos', 'falha': 'falhas', 'obsoleto': 'obsoletos', 'compartilhado': 'compartilhados'}
+    for nome, cache in list(CACHES.items()):
+        for resultado, atributo in atributos.items():
+            valor = getattr(cache, atributo, None)
+            if valor is not None:
+                yield 'cache_consultas_total', {'cache': nome, 'resultado': resultado}, valor
+
+
+def init_metricas(app):
+    """Configura a pasta compartilhada, mede as rotas e conecta a instrumentação do Supabase/HTTP"""
+    global _pasta, _intervalo
+    from flask import g, request
+    from app.instrumentacao import adicionar_ouvinte
+
+    app.config.setdefault('METRICS_ENABLED', True)
+    if not app.config['METRICS_ENABLED']:
+        return
+    _intervalo = float(app.config.get('METRICS_FLUSH_SECONDS', 5))
+    pasta = app.config.get('METRICS_DIR')
+    if pasta and _pasta is None:
+        os.makedirs(pasta, exist_ok=True)
+        _pasta = pasta
+        try:
+            compactar()
+        except OSError as e:
+            logger.warning(f'Não foi possível compactar as métricas de processos encerrados: {e}')
+        import atexit
+        atexit.register(lambda: salvar(forcar=True))
+
+    if app.extensions.get('metricas'):
+        return
+    app.extensions['metricas'] = True
+    adicionar_ouvinte(_registrar_chamada_externa)
+    adicionar_coletor(_coletar_caches)
+
+    @app.before_request
+    def iniciar_metricas():
+        g.metricas_inicio = time.perf_counter()
+
+    @app.after_request
+    def registrar_metricas(response):
+        inicio = g.get('metricas_inicio')
+        if inicio is not None:
+            observar(
+                'http_requisicoes_duracao_segundos', time.perf_counter() - inicio,
+                metodo=request.method,
+                rota=request.url_rule.rule if request.url_rule else 'sem_rota',
+                status=response.status_code
+            )
+        return response
@@ -3,11 +3,26 @@ Modelos usando Supabase REST API
 Substitui SQLAlchemy models.py
 """
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
 from app.supabase_client import get_supabase_client
 
 
+def parse_campos(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Converte o parâmetro ?fields= (ex.: "id,nome,equipamento.tipo") em lista de campos.
+    Retorna None quando nenhum campo foi solicitado (resposta completa).
+    """
+    if not fields:
+        return None
+    campos = []
+    for campo in fields.split(','):
+        campo = campo.strip()
+        if campo and campo not in campos:
+            campos.append(campo)
+    return campos or None
+
+
 class Usuario:
     """Modelo para usuários do sistema"""
     
@@ -167,6 +182,18 @@ class Usuario:
 class Equipamento:
     """Modelo para equipamentos de TI"""
     
+    # Colunas que podem ser projetadas via ?fields=
+    CAMPOS = (
+        'id', 'nome', 'tipo', 'marca', 'modelo', 'numero_serie', 'processador',
+        'memoria_ram', 'armazenamento', 'sistema_operacional', 'status',
+        'data_aquisicao', 'valor', 'vida_util_anos', 'departamento_atual',
+        'observacoes', 'data_cadastro', 'data_atualizacao'
+    )
+    # Projeção completa explícita: evita trazer colunas internas como o tsvector `busca`
+    COLUNAS = ','.join(CAMPOS)
+    # Campos exigidos no cadastro (formulário e importação em lote)
+    CAMPOS_OBRIGATORIOS = ('nome', 'tipo', 'marca', 'modelo', 'numero_serie', 'status')
+    
     def __init__(self, data: Dict[str, Any]):
         self.id = data.get('id')
         self.nome = data.get('nome')
@@ -187,9 +214,19 @@ class Equipamento:
         self.data_cadastro = data.get('data_cadastro')
         self.data_atualizacao = data.get('data_atualizacao')
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Converte o objeto para dicionário"""
-        return {
+    @staticmethod
+    def select_clause(campos: Optional[List[str]] = None) -> str:
+        """Monta a projeção de colunas do PostgREST (o id é sempre incluído)"""
+        if not campos:
+            return Equipamento.COLUNAS
+        invalidos = [c for c in campos if c not in Equipamento.CAMPOS]
+        if invalidos:
+            raise ValueError(f'Campos inválidos: {", ".join(invalidos)}')
+        return ','.join(['id'] + [c for c in campos if c != 'id'])
+    
+    def to_dict(self, campos: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Converte o objeto para dicionário (apenas os campos solicitados, se informados)"""
+        result = {
             'id': self.id,
             'nome': self.nome,
             'tipo': self.tipo,
@@ -209,13 +246,16 @@ class Equipamento:
             'data_cadastro': self.data_cadastro,
             'data_atualizacao': self.data_atualizacao
         }
+        if campos:
+            return {k: v for k, v in result.items() if k == 'id' or k in campos}
+        return result
     
     @staticmethod
     def get_by_id(equip_id: int) -> Optional['Equipamento']:
         """Busca equipamento por ID"""
         try:
             client = get_supabase_client()
-            response = client.table('equipamentos').select('*').eq('id', equip_id).execute()
+            response = client.table('equipamentos').select(Equipamento.COLUNAS).eq('id', equip_id).execute()
             if response.data and len(response.data) > 0:
                 return Equipamento(response.data[0])
             return None
@@ -224,11 +264,12 @@ class Equipamento:
             return None
     
     @staticmethod
-    def get_all() -> List['Equipamento']:
-        """Retorna todos os equipamentos"""
+    def get_all(campos: Optional[List[str]] = None) -> List['Equipamento']:
+        """Retorna todos os equipamentos (projetando apenas `campos`, se informados)"""
+        select = Equipamento.select_clause(campos)
         try:
             client = get_supabase_client()
-            response = client.table('equipamentos').select('*').execute()
+            response = client.table('equipamentos').select(select).execute()
             if response.data is None:
                 return []
             return [Equipamento(eq) for eq in response.data]
@@ -316,6 +357,51 @@ class Equipamento:
         client = get_supabase_client()
         client.table('equipamentos').delete().eq('id', self.id).execute()
     
+    @staticmethod
+    def buscar(termo: str, limite: int = 20, offset: int = 0, somente_serie: bool = False,
+               status: Optional[str] = None, tipo: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Busca ordenada por relevância (texto completo + similaridade + prefixo do número de série)
+        usando a função buscar_equipamentos do banco.
+
+        Returns:
+            (resultados da página, total de resultados)
+        """
+        client = get_supabase_client()
+        try:
+            linhas = client.rpc('buscar_equipamentos', {
+                'p_termo': termo,
+                'p_limite': limite,
+                'p_offset': offset,
+                'p_somente_serie': somente_serie,
+                'p_status': status,
+                'p_tipo': tipo
+            }).execute().data or []
+            total = linhas[0]['total'] if linhas else 0
+            for linha in linhas:
+                linha.pop('total', None)
+            return linhas, total
+        except Exception as e:
+            if getattr(e, 'code', None) != 'PGRST202':
+                raise
+
+        # Banco sem a função de busca: ILIKE simples, sem ranking
+        termo_seguro = ''.join(c for c in termo if c not in ',()*%\\"')
+        query = client.table('equipamentos').select(
+            'id,nome,tipo,marca,modelo,numero_serie,status,departamento_atual', count='exact'
+        )
+        if somente_serie:
+            query = query.ilike('numero_serie', f'{termo_seguro}%')
+        else:
+            colunas = ('nome', 'marca', 'modelo', 'numero_serie', 'processador', 'observacoes')
+            query = query.or_(','.join(f'{c}.ilike.*{termo_seguro}*' for c in colunas))
+        if status:
+            query = query.eq('status', status)
+        if tipo:
+            query = query.eq('tipo', tipo)
+        response = query.order('nome').range(offset, offset + limite - 1).execute()
+        return response.data or [], response.count or 0
+
     @staticmethod
     def count_by_status() -> Dict[str, int]:
         """Conta equipamentos por status"""
@@ -332,6 +418,15 @@ class Equipamento:
 class Emprestimo:
     """Modelo para empréstimos de equipamentos"""
     
+    # Colunas próprias que podem ser projetadas via ?fields=
+    CAMPOS = (
+        'id', 'equipamento_id', 'responsavel', 'departamento', 'email_responsavel',
+        'telefone_responsavel', 'telegram_chat_id', 'data_emprestimo',
+        'data_devolucao_prevista', 'data_devolucao_real', 'status', 'observacoes'
+    )
+    # Colunas do equipamento necessárias para montar equipamento_nome
+    CAMPOS_EQUIPAMENTO_NOME = ('nome', 'marca', 'modelo')
+    
     def __init__(self, data: Dict[str, Any]):
         self.id = data.get('id')
         self.equipamento_id = data.get('equipamento_id')
@@ -347,10 +442,49 @@ class Emprestimo:
         self.observacoes = data.get('observacoes')
         # Relacionamento com equipamento (se incluído no select)
         self.equipamento = None
-        if 'equipamentos' in data:
+        if data.get('equipamentos'):
             self.equipamento = Equipamento(data['equipamentos'])
     
-    def to_dict(self) -> Dict[str, Any]:
+    @staticmethod
+    def select_clause(campos: Optional[List[str]] = None) -> str:
+        """
+        Monta a projeção do PostgREST, incluindo o recurso embutido `equipamentos`.
+        Aceita colunas próprias, "equipamento" (registro completo),
+        "equipamento.<coluna>" e o derivado "equipamento_nome".
+        """
+        if not campos:
+            return f'*, equipamentos({Equipamento.COLUNAS})'
+        
+        colunas = ['id']
+        colunas_equipamento = []
+        equipamento_completo = False
+        invalidos = []
+        for campo in campos:
+            if campo in Emprestimo.CAMPOS:
+                if campo not in colunas:
+                    colunas.append(campo)
+            elif campo == 'equipamento':
+                equipamento_completo = True
+            elif campo == 'equipamento_nome':
+                colunas_equipamento.extend(Emprestimo.CAMPOS_EQUIPAMENTO_NOME)
+            elif campo.startswith('equipamento.') and campo[len('equipamento.'):] in Equipamento.CAMPOS:
+                colunas_equipamento.append(campo[len('equipamento.'):])
+            else:
+                invalidos.append(campo)
+        
+        if invalidos:
+            raise ValueError(f'Campos inválidos: {", ".join(invalidos)}')
+        
+        if equipamento_completo:
+            colunas.append(f'equipamentos({Equipamento.COLUNAS})')
+        elif colunas_equipamento:
+            embutidas = ['id'] + [c for c in dict.fromkeys(colunas_equipamento) if c != 'id']
+            colunas.append(f'equipamentos({",".join(embutidas)})')
+        return ','.join(colunas)
+    
+    def to_dict(self, campos: Optional[List[str]] = None) -> Dict[str, Any]:
+        if campos:
+            return self._to_dict_parcial(campos)
         result = {
             'id': self.id,
             'equipamento_id': self.equipamento_id,
@@ -382,11 +516,31 @@ class Emprestimo:
                 result['equipamento_nome'] = 'Equipamento desconhecido'
         return result
     
+    def _to_dict_parcial(self, campos: List[str]) -> Dict[str, Any]:
+        """Serializa apenas os campos solicitados, sem buscas adicionais ao banco"""
+        result = {'id': self.id}
+        for campo in campos:
+            if campo in Emprestimo.CAMPOS:
+                result[campo] = getattr(self, campo)
+        
+        campos_equipamento = [c[len('equipamento.'):] for c in campos if c.startswith('equipamento.')]
+        if 'equipamento' in campos:
+            result['equipamento'] = self.equipamento.to_dict() if self.equipamento else None
+        elif campos_equipamento:
+            result['equipamento'] = self.equipamento.to_dict(campos_equipamento) if self.equipamento else None
+        
+        if 'equipamento_nome' in campos:
+            if self.equipamento:
+                result['equipamento_nome'] = f"{self.equipamento.nome} - {self.equipamento.marca} {self.equipamento.modelo}"
+            else:
+                result['equipamento_nome'] = 'Equipamento desconhecido'
+        return result
+    
     @staticmethod
     def get_by_id(emprestimo_id: int) -> Optional['Emprestimo']:
         try:
             client = get_supabase_client()
-            response = client.table('emprestimos').select('*, equipamentos(*)').eq('id', emprestimo_id).execute()
+            response = client.table('emprestimos').select(Emprestimo.select_clause()).eq('id', emprestimo_id).execute()
             if response.data and len(response.data) > 0:
                 return Emprestimo(response.data[0])
             return None
@@ -395,9 +549,46 @@ class Emprestimo:
             return None
     
     @staticmethod
-    def get_all() -> List['Emprestimo']:
+    def aplicar_filtros(query, filtro: str = 'todos', data_inicio: Optional[str] = None,
+                        data_fim: Optional[str] = None, departamento: Optional[str] = None):
+        """
+        Aplica na query do PostgREST os mesmos filtros da tela de relatórios
+        (filtro: todos, ativos, historico, atrasados; período em YYYY-MM-DD; departamento)
+        """
+        if filtro == 'ativos':
+            query = query.eq('status', 'Ativo')
+        elif filtro == 'historico':
+            query = query.eq('status', 'Devolvido')
+        elif filtro == 'atrasados':
+            hoje = datetime.utcnow().date().isoformat()
+            query = query.eq('status', 'Ativo').lt('data_devolucao_prevista', hoje)
+        
+        if data_inicio:
+            try:
+                query = query.gte('data_emprestimo', datetime.strptime(data_inicio, '%Y-%m-%d').date().isoformat())
+            except ValueError:
+                pass
+        
+        if data_fim:
+            try:
+                # data_emprestimo é TIMESTAMP: inclui o dia inteiro de data_fim
+                dia_seguinte = datetime.strptime(data_fim, '%Y-%m-%d').date() + timedelta(days=1)
+                query = query.lt('data_emprestimo', dia_seguinte.isoformat())
+            except ValueError:
+                pass
+        
+        if departamento and departamento != 'todos':
+            query = query.eq('departamento', departamento)
+        return query
+    
+    @staticmethod
+    def get_all(campos: Optional[List[str]] = None, status: Optional[str] = None) -> List['Emprestimo']:
+        """Retorna os empréstimos (projetando apenas `campos` e filtrando por `status`, se informados)"""
         client = get_supabase_client()
-        response = client.table('emprestimos').select('*, equipamentos(*)').execute()
+        query = client.table('emprestimos').select(Emprestimo.select_clause(campos))
+        if status:
+            query = query.eq('status', status)
+        response = query.execute()
         return [Emprestimo(emp) for emp in response.data]
     
     @staticmethod
@@ -432,6 +623,61 @@ class Emprestimo:
         client.table('emprestimos').delete().eq('id', self.id).execute()
 
 
+class Departamento:
+    """Catálogo de departamentos (tabela mantida por trigger a partir de emprestimos)"""
+
+    # Códigos de erro de tabela inexistente (PostgREST / PostgreSQL)
+    ERROS_TABELA_INEXISTENTE = ('PGRST205', '42P01')
+
+    @staticmethod
+    def _agregar_emprestimos(prefixo: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Fallback sem a tabela departamentos: agrega os nomes direto dos empréstimos (em páginas)"""
+        from app.export_service import paginar
+
+        client = get_supabase_client()
+
+        def montar_query():
+            query = client.table('emprestimos').select('id,departamento')
+            return query.ilike('departamento', f'{prefixo}*') if prefixo else query
+
+        totais = {}
+        for row in paginar(montar_query):
+            nome = (row.get('departamento') or '').strip()
+            if nome:
+                totais[nome] = totais.get(nome, 0) + 1
+        return [{'nome': nome, 'total_emprestimos': total} for nome, total in totais.items()]
+
+    @staticmethod
+    def listar() -> List[str]:
+        """Nomes dos departamentos em ordem alfabética"""
+        client = get_supabase_client()
+        try:
+            response = client.table('departamentos').select('nome').gt('total_emprestimos', 0).order('nome').execute()
+            return [row['nome'] for row in response.data or []]
+        except Exception as e:
+            if getattr(e, 'code', None) not in Departamento.ERROS_TABELA_INEXISTENTE:
+                raise
+        return sorted(d['nome'] for d in Departamento._agregar_emprestimos())
+
+    @staticmethod
+    def autocompletar(prefixo: str, limite: int = 10) -> List[Dict[str, Any]]:
+        """Departamentos que começam com `prefixo`, dos mais usados para os menos usados"""
+        prefixo = ''.join(c for c in (prefixo or '').strip() if c not in ',()*%\\"')
+        client = get_supabase_client()
+        try:
+            query = client.table('departamentos').select('nome,total_emprestimos').gt('total_emprestimos', 0)
+            if prefixo:
+                query = query.ilike('nome', f'{prefixo}*')
+            response = query.order('total_emprestimos', desc=True).order('nome').limit(limite).execute()
+            return response.data or []
+        except Exception as e:
+            if getattr(e, 'code', None) not in Departamento.ERROS_TABELA_INEXISTENTE:
+                raise
+        sugestoes = Departamento._agregar_emprestimos(prefixo)
+        sugestoes.sort(key=lambda d: (-d['total_emprestimos'], d['nome']))
+        return sugestoes[:limite]
+
+
 class EquipamentoFoto:
     """Fotos associadas a equipamentos"""
     
@@ -443,10 +689,14 @@ class EquipamentoFoto:
         self.data_upload = data.get('data_upload')
     
     def to_dict(self) -> Dict[str, Any]:
+        from app.foto_storage import resolver_url
+
         return {
             'id': self.id,
             'equipamento_id': self.equipamento_id,
-            'url': self.url,
+            # A coluna guarda a chave do objeto; a URL vem do backend de armazenamento ativo
+            'url': resolver_url(self.url),
+            'chave': self.url,
             'principal': self.principal,
             'data_upload': self.data_upload
         }
@@ -457,6 +707,14 @@ class EquipamentoFoto:
         response = client.table('equipamentos_fotos').select('*').eq('equipamento_id', equipamento_id).execute()
         return [EquipamentoFoto(foto) for foto in response.data]
     
+    @staticmethod
+    def principal_de(equipamento_id: int) -> Optional['EquipamentoFoto']:
+        """Foto principal mais recente do equipamento"""
+        client = get_supabase_client()
+        response = client.table('equipamentos_fotos').select('*').eq('equipamento_id', equipamento_id) \
+            .order('principal', desc=True).order('data_upload', desc=True).limit(1).execute()
+        return EquipamentoFoto(response.data[0]) if response.data else None
+    
     @staticmethod
     def create(**kwargs) -> 'EquipamentoFoto':
         data = {
@@ -472,6 +730,12 @@ class EquipamentoFoto:
     def delete(self):
         client = get_supabase_client()
         client.table('equipamentos_fotos').delete().eq('id', self.id).execute()
+    
+    def remover_anteriores(self):
+        """Remove as outras fotos do equipamento (substituição); os arquivos saem na coleta de órfãs"""
+        client = get_supabase_client()
+        client.table('equipamentos_fotos').delete() \
+            .eq('equipamento_id', self.equipamento_id).neq('id', self.id).execute()
 
 
 class Manutencao:
@@ -517,6 +781,12 @@ class Manutencao:
             print(f"Erro ao buscar manutenção: {e}")
             return None
     
+    @staticmethod
+    def get_all() -> List['Manutencao']:
+        client = get_supabase_client()
+        response = client.table('manutencoes').select('*').execute()
+        return [Manutencao(man) for man in response.data]
+    
     @staticmethod
     def get_by_equipamento(equipamento_id: int) -> List['Manutencao']:
         client = get_supabase_client()
@@ -0,0 +1,79 @@
+"""
+Fila de notificações em segundo plano
+Operações em lote enfileiram um job por destinatário em vez de enviar e-mail/push/WhatsApp/Telegram
+dentro da requisição, item a item.
+"""
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class FilaNotificacoes:
+    """Fila FIFO consumida por uma thread daemon (iniciada no primeiro uso)"""
+
+    def __init__(self):
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _garantir_consumidor(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._consumir, name='fila-notificacoes', daemon=True)
+                self._thread.start()
+
+    def enfileirar(self, tarefa: Callable, *args, **kwargs):
+        self._fila.put((tarefa, args, kwargs))
+        self._garantir_consumidor()
+
+    def pendentes(self) -> int:
+        return self._fila.qsize()
+
+    def _consumir(self):
+        while True:
+            tarefa, args, kwargs = self._fila.get()
+            try:
+                tarefa(*args, **kwargs)
+            except Exception as e:
+                logger.error(f'Erro ao processar notificação: {e}', exc_info=True)
+            finally:
+                self._fila.task_done()
+
+
+fila_notificacoes = FilaNotificacoes()
+
+
+def chave_destinatario(emprestimo) -> str:
+    """Agrupa pelo primeiro contato disponível do responsável"""
+    contato = emprestimo.email_responsavel or emprestimo.telefone_responsavel or emprestimo.responsavel or ''
+    return str(contato).strip().lower()
+
+
+def _notificar_destinatario(app, funcao: Callable[[Any, Any], None], emprestimos: list):
+    with app.app_context():
+        for emprestimo in emprestimos:
+            try:
+                funcao(app, emprestimo)
+            except Exception as e:
+                # Falha de um canal/empréstimo não impede os demais
+                logger.warning(f'Falha ao notificar empréstimo {emprestimo.id}: {e}')
+
+
+def enfileirar_por_destinatario(app, funcao: Callable[[Any, Any], None], emprestimos: Iterable) -> int:
+    """
+    Enfileira um job por destinatário que chama funcao(app, emprestimo) para cada empréstimo dele.
+
+    Returns:
+        Quantidade de jobs (destinatários) enfileirados
+    """
+    grupos = OrderedDict()
+    for emprestimo in emprestimos:
+        grupos.setdefault(chave_destinatario(emprestimo), []).append(emprestimo)
+
+    for grupo in grupos.values():
+        fila_notificacoes.enfileirar(_notificar_destinatario, app, funcao, grupo)
+    return len(grupos)
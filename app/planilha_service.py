@@ -0,0 +1,176 @@
+"""
+Exportação XLSX do relatório de empréstimos em memória constante
+Empréstimos e manutenções são lidos em páginas do Supabase e escritos linha a linha num workbook
+write-only do openpyxl (cada aba vai para um arquivo temporário); o .xlsx final é enviado em blocos.
+"""
+import os
+import tempfile
+from datetime import date, datetime
+from typing import Any, Dict, IO, Iterator, Optional, Union
+
+from app.export_service import COLUNAS, TAMANHO_BLOCO, linhas_emprestimos, linhas_manutencoes
+from app.financeiro_service import roi_equipamentos
+
+try:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+except Exception:  # openpyxl ausente: exportação XLSX indisponível
+    openpyxl = None
+
+
+COLUNAS_EMPRESTIMOS = COLUNAS['emprestimos'] + ['dias', 'atrasado']
+COLUNAS_MANUTENCOES = COLUNAS['manutencoes']
+COLUNAS_ROI = [
+    'id', 'nome', 'tipo', 'marca', 'modelo', 'numero_serie', 'valor_aquisicao', 'valor_residual',
+    'dias_uso', 'custo_manutencao', 'roi_percentual', 'idade_anos'
+]
+COLUNAS_DATA = {'data_emprestimo', 'data_devolucao_prevista', 'data_devolucao_real', 'data_inicio', 'data_fim'}
+
+
+def disponivel() -> bool:
+    return openpyxl is not None
+
+
+def _data(valor: Any) -> Optional[date]:
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(str(valor)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _valor_celula(coluna: str, valor: Any) -> Any:
+    if coluna in COLUNAS_DATA:
+        return _data(valor) or valor
+    return valor
+
+
+def _cabecalho(aba, colunas):
+    negrito = Font(bold=True)
+    celulas = []
+    for coluna in colunas:
+        celula = WriteOnlyCell(aba, value=coluna)
+        celula.font = negrito
+        celulas.append(celula)
+    aba.append(celulas)
+
+
+def escrever_planilha(destino: Union[str, IO[bytes]], filtros: Dict[str, Optional[str]],
+                      hoje: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Grava o workbook em `destino` (caminho ou arquivo binário).
+
+    Abas: Resumo, Empréstimos (filtros do relatório), Manutenções (período sobre data_inicio)
+    e ROI por equipamento (indicadores do dashboard executivo, sobre todo o inventário).
+
+    Returns:
+        Resumo com as contagens e totais gravados
+    """
+    if openpyxl is None:
+        raise RuntimeError('Exportação XLSX requer o pacote openpyxl (pip install openpyxl)')
+
+    hoje = hoje or datetime.utcnow().date()
+    workbook = openpyxl.Workbook(write_only=True)
+    aba_resumo = workbook.create_sheet('Resumo')
+
+    # Empréstimos
+    aba = workbook.create_sheet('Empréstimos')
+    _cabecalho(aba, COLUNAS_EMPRESTIMOS)
+    emprestimos = {'total': 0, 'ativos': 0, 'devolvidos': 0, 'atrasados': 0}
+    for linha in linhas_emprestimos(filtros):
+        inicio = _data(linha.get('data_emprestimo'))
+        prevista = _data(linha.get('data_devolucao_prevista'))
+        ativo = linha.get('status') == 'Ativo'
+        fim = hoje if ativo else _data(linha.get('data_devolucao_real'))
+        linha['dias'] = (fim - inicio).days if inicio and fim else None
+        linha['atrasado'] = ativo and prevista is not None and prevista < hoje
+
+        emprestimos['total'] += 1
+        emprestimos['ativos'] += ativo
+        emprestimos['devolvidos'] += linha.get('status') == 'Devolvido'
+        emprestimos['atrasados'] += linha['atrasado']
+        aba.append([_valor_celula(c, linha.get(c)) for c in COLUNAS_EMPRESTIMOS])
+
+    # Manutenções
+    aba = workbook.create_sheet('Manutenções')
+    _cabecalho(aba, COLUNAS_MANUTENCOES)
+    manutencoes = {'total': 0, 'custo': 0}
+    for linha in linhas_manutencoes(filtros):
+        manutencoes['total'] += 1
+        manutencoes['custo'] += linha.get('custo') or 0
+        aba.append([_valor_celula(c, linha.get(c)) for c in COLUNAS_MANUTENCOES])
+
+    # ROI por equipamento
+    aba = workbook.create_sheet('ROI por equipamento')
+    _cabecalho(aba, COLUNAS_ROI)
+    roi = {'equipamentos': 0, 'valor_aquisicao': 0, 'valor_residual': 0, 'custo_manutencao': 0, 'soma_roi': 0}
+    for linha in roi_equipamentos(hoje):
+        roi['equipamentos'] += 1
+        roi['valor_aquisicao'] += linha['valor_aquisicao']
+        roi['valor_residual'] += linha['valor_residual']
+        roi['custo_manutencao'] += linha['custo_manutencao']
+        roi['soma_roi'] += linha['roi_percentual']
+        aba.append([linha.get(c) for c in COLUNAS_ROI])
+
+    resumo = {
+        'emprestimos': emprestimos,
+        'manutencoes': {'total': manutencoes['total'], 'custo': round(manutencoes['custo'], 2)},
+        'executivo': {
+            'equipamentos_com_valor': roi['equipamentos'],
+            'valor_aquisicao_total': round(roi['valor_aquisicao'], 2),
+            'valor_residual_total': round(roi['valor_residual'], 2),
+            'custo_manutencao_total': round(roi['custo_manutencao'], 2),
+            'roi_medio': round(roi['soma_roi'] / roi['equipamentos'], 2) if roi['equipamentos'] else 0
+        }
+    }
+
+    _cabecalho(aba_resumo, ['Indicador', 'Valor'])
+    aba_resumo.append(['Gerado em', datetime.now().strftime('%d/%m/%Y %H:%M')])
+    for chave in ('filtro', 'data_inicio', 'data_fim', 'departamento'):
+        aba_resumo.append([f'Filtro: {chave}', filtros.get(chave) or 'todos'])
+    aba_resumo.append([])
+    aba_resumo.append(['Empréstimos', emprestimos['total']])
+    aba_resumo.append(['Empréstimos ativos', emprestimos['ativos']])
+    aba_resumo.append(['Empréstimos devolvidos', emprestimos['devolvidos']])
+    aba_resumo.append(['Empréstimos atrasados', emprestimos['atrasados']])
+    aba_resumo.append(['Manutenções no período', manutencoes['total']])
+    aba_resumo.append(['Custo das manutenções no período', resumo['manutencoes']['custo']])
+    aba_resumo.append([])
+    aba_resumo.append(['Inventário (todos os equipamentos com valor)', None])
+    aba_resumo.append(['Valor de aquisição', resumo['executivo']['valor_aquisicao_total']])
+    aba_resumo.append(['Valor residual (depreciação linear)', resumo['executivo']['valor_residual_total']])
+    aba_resumo.append(['Custo total de manutenção', resumo['executivo']['custo_manutencao_total']])
+    aba_resumo.append(['ROI médio (%)', resumo['executivo']['roi_medio']])
+
+    workbook.save(destino)
+    return resumo
+
+
+def gerar_arquivo_temporario(filtros: Dict[str, Optional[str]]) -> str:
+    """Grava o workbook num arquivo temporário e devolve o caminho (o chamador remove)"""
+    descritor, caminho = tempfile.mkstemp(suffix='.xlsx', prefix='relatorio_')
+    os.close(descritor)
+    try:
+        escrever_planilha(caminho, filtros)
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
+
+
+def transmitir_e_remover(caminho: str) -> Iterator[bytes]:
+    """Envia o arquivo em blocos e o remove ao final (ou se o cliente desconectar)"""
+    try:
+        with open(caminho, 'rb') as f:
+            while True:
+                bloco = f.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                yield bloco
+    finally:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
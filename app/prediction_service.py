@@ -4,13 +4,12 @@ Análise preditiva para necessidades de compra de equipamentos
 """
 
 from datetime import datetime, timedelta
-from collections import defaultdict
 import numpy as np
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import PolynomialFeatures
 import pandas as pd
-from app.models import Equipamento, Emprestimo
-from sqlalchemy import func
+from app.rollup_service import contagem_por_tipo_e_mes, contagem_por_mes_do_ano
+from app.supabase_client import get_supabase_client
 
 
 class PredictionService:
@@ -28,29 +27,17 @@ class PredictionService:
             dict: Previsões e análises por tipo de equipamento
         """
         try:
-            # Buscar todos os empréstimos
-            emprestimos = Emprestimo.query.all()
+            # Empréstimos por tipo e mês, lidos do rollup mensal
+            por_tipo = contagem_por_tipo_e_mes()
             
-            if not emprestimos:
+            if not por_tipo:
                 return self._resposta_sem_dados()
             
-            # Agrupar por tipo de equipamento
-            dados_por_tipo = defaultdict(list)
-            
-            for emp in emprestimos:
-                if emp.equipamento and emp.equipamento.tipo:
-                    tipo = emp.equipamento.tipo
-                    mes = emp.data_emprestimo.strftime('%Y-%m')
-                    dados_por_tipo[tipo].append({
-                        'mes': mes,
-                        'data': emp.data_emprestimo
-                    })
-            
             # Processar previsões para cada tipo
             previsoes = []
             
-            for tipo, registros in dados_por_tipo.items():
-                previsao = self._prever_demanda_tipo(tipo, registros)
+            for tipo, emprestimos_por_mes in por_tipo.items():
+                previsao = self._prever_demanda_tipo(tipo, emprestimos_por_mes)
                 if previsao:
                     previsoes.append(previsao)
             
@@ -71,25 +58,20 @@ class PredictionService:
                 'previsoes': []
             }
     
-    def _prever_demanda_tipo(self, tipo, registros):
+    def _prever_demanda_tipo(self, tipo, emprestimos_por_mes):
         """
         Faz previsão de demanda para um tipo específico de equipamento
         
         Args:
             tipo (str): Tipo de equipamento
-            registros (list): Lista de registros de empréstimos
+            emprestimos_por_mes (dict): Empréstimos por mês ('YYYY-MM')
             
         Returns:
             dict: Previsão detalhada ou None se não houver dados suficientes
         """
-        if len(registros) < self.min_data_points:
+        if sum(emprestimos_por_mes.values()) < self.min_data_points:
             return None
         
-        # Contar empréstimos por mês
-        emprestimos_por_mes = defaultdict(int)
-        for reg in registros:
-            emprestimos_por_mes[reg['mes']] += 1
-        
         # Ordenar por data
         meses_ordenados = sorted(emprestimos_por_mes.keys())
         
@@ -114,21 +96,20 @@ class PredictionService:
         previsao_media = np.mean(y_futuro)
         taxa_crescimento = ((previsao_media - media_atual) / media_atual * 100) if media_atual > 0 else 0
         
+        client = get_supabase_client()
+        
         # Quantidade atual em estoque
-        qtd_estoque = Equipamento.query.filter_by(
-            tipo=tipo,
-            status='Estoque'
-        ).count()
+        qtd_estoque = client.table('equipamentos').select('id', count='exact') \
+            .eq('tipo', tipo).eq('status', 'Estoque').limit(1).execute().count or 0
         
         # Quantidade total
-        qtd_total = Equipamento.query.filter_by(tipo=tipo).count()
+        qtd_total = client.table('equipamentos').select('id', count='exact') \
+            .eq('tipo', tipo).limit(1).execute().count or 0
         
         # Taxa de utilização média (últimos 30 dias)
-        data_limite = datetime.now() - timedelta(days=30)
-        emprestimos_recentes = Emprestimo.query.join(Equipamento).filter(
-            Equipamento.tipo == tipo,
-            Emprestimo.data_emprestimo >= data_limite
-        ).count()
+        data_limite = (datetime.now() - timedelta(days=30)).isoformat()
+        emprestimos_recentes = client.table('emprestimos').select('id, equipamentos!inner(tipo)', count='exact') \
+            .eq('equipamentos.tipo', tipo).gte('data_emprestimo', data_limite).limit(1).execute().count or 0
         
         taxa_utilizacao = (emprestimos_recentes / qtd_total * 100) if qtd_total > 0 else 0
         
@@ -262,21 +243,16 @@ class PredictionService:
             dict: Análise de sazonalidade por mês do ano
         """
         try:
-            emprestimos = Emprestimo.query.all()
+            # Empréstimos por mês do ano (1-12), somando todos os anos do rollup mensal
+            por_mes = contagem_por_mes_do_ano()
             
-            if not emprestimos:
+            if not any(por_mes.values()):
                 return {'sucesso': False, 'mensagem': 'Sem dados suficientes'}
             
-            # Agrupar por mês do ano (1-12)
-            por_mes = defaultdict(list)
-            for emp in emprestimos:
-                mes_ano = emp.data_emprestimo.month
-                por_mes[mes_ano].append(emp)
-            
             # Calcular média por mês
             sazonalidade = []
             for mes in range(1, 13):
-                qtd = len(por_mes.get(mes, []))
+                qtd = por_mes.get(mes, 0)
                 sazonalidade.append({
                     'mes': mes,
                     'nome_mes': [
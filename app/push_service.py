@@ -5,6 +5,9 @@ from flask import current_app
 import json
 import os
 
+from app.instrumentacao import medir_http
+from app.metricas import notificacao
+
 try:
     from pywebpush import webpush, WebPushException
 except Exception:  # pywebpush ausente no ambiente serverless
@@ -32,6 +35,7 @@ class PushNotificationService:
         return private_key, public_key
     
     @staticmethod
+    @notificacao('push')
     def send_notification(subscription_info, title, body, url='/', tag=None, require_interaction=False):
         """
         Envia uma push notification para uma subscrição específica
@@ -79,14 +83,15 @@ class PushNotificationService:
             }
             
             # Envia a notificação
-            response = webpush(
-                subscription_info=subscription,
-                data=json.dumps(payload),
-                vapid_private_key=private_key,
-                vapid_claims={
-                    "sub": f"mailto:{os.environ.get('MAIL_USERNAME', 'admin@inventario.com')}"
-                }
-            )
+            with medir_http('push'):
+                response = webpush(
+                    subscription_info=subscription,
+                    data=json.dumps(payload),
+                    vapid_private_key=private_key,
+                    vapid_claims={
+                        "sub": f"mailto:{os.environ.get('MAIL_USERNAME', 'admin@inventario.com')}"
+                    }
+                )
             
             current_app.logger.info(f'Push notification enviada com sucesso: {response.status_code}')
             return True
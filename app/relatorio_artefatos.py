@@ -0,0 +1,255 @@
+"""
+Artefatos do relatório de empréstimos (PDF, CSV e XLSX)
+Funções puras sobre o resultado de relatorio_service.gerar_relatorio(), usadas tanto nas rotas
+quanto nos jobs de relatório em segundo plano.
+"""
+import csv
+import io
+from datetime import datetime
+from io import BytesIO
+from typing import Any, Dict, List
+
+from app.planilha_service import escrever_planilha
+from app.relatorio_service import atrasado, duracao_dias
+
+
+COLUNAS_EMPRESTIMOS = [
+    'id', 'equipamento_nome', 'equipamento_tipo', 'equipamento_numero_serie', 'responsavel', 'departamento',
+    'email_responsavel', 'telefone_responsavel', 'data_emprestimo', 'data_devolucao_prevista',
+    'data_devolucao_real', 'status', 'dias', 'observacoes'
+]
+
+MIMETYPES = {
+    'pdf': 'application/pdf',
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def linhas_relatorio(relatorio: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Empréstimos do relatório achatados em colunas (equipamento embutido + status de atraso)"""
+    hoje = datetime.utcnow().date()
+    linhas = []
+    for e in relatorio['emprestimos']:
+        eq = e.equipamento
+        linhas.append({
+            'id': e.id,
+            'equipamento_nome': f"{eq.nome} - {eq.marca} {eq.modelo}" if eq else None,
+            'equipamento_tipo': eq.tipo if eq else None,
+            'equipamento_numero_serie': eq.numero_serie if eq else None,
+            'responsavel': e.responsavel,
+            'departamento': e.departamento,
+            'email_responsavel': e.email_responsavel,
+            'telefone_responsavel': e.telefone_responsavel,
+            'data_emprestimo': e.data_emprestimo,
+            'data_devolucao_prevista': e.data_devolucao_prevista,
+            'data_devolucao_real': e.data_devolucao_real,
+            'status': 'Atrasado' if atrasado(e, hoje) else e.status,
+            'dias': duracao_dias(e, hoje),
+            'observacoes': e.observacoes
+        })
+    return linhas
+
+
+def gerar_csv(relatorio: Dict[str, Any]) -> bytes:
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.DictWriter(buffer, fieldnames=COLUNAS_EMPRESTIMOS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(linhas_relatorio(relatorio))
+    return buffer.getvalue().encode('utf-8')
+
+
+def gerar_xlsx(relatorio: Dict[str, Any]) -> bytes:
+    """Mesma planilha de /relatorios/exportar-xlsx (empréstimos, manutenções e indicadores executivos)"""
+    buffer = BytesIO()
+    escrever_planilha(buffer, relatorio['filtros'])
+    return buffer.getvalue()
+
+
+def gerar_pdf(relatorio: Dict[str, Any], gerado_por: str) -> bytes:
+    """PDF do relatório de empréstimos (reportlab importado sob demanda; ImportError se ausente)"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.enums import TA_CENTER
+
+    filtros = relatorio['filtros']
+    filtro = filtros['filtro']
+    data_inicio = filtros['data_inicio']
+    data_fim = filtros['data_fim']
+    departamento = filtros['departamento']
+    emprestimos = relatorio['emprestimos']
+
+    hoje = datetime.utcnow().date()
+    total = relatorio['estatisticas']['total']
+    ativos = relatorio['estatisticas']['ativos']
+    devolvidos = relatorio['estatisticas']['devolvidos']
+    atrasados = relatorio['estatisticas']['atrasados']
+
+    # Criar PDF
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=landscape(A4),
+        rightMargin=1*cm,
+        leftMargin=1*cm,
+        topMargin=2*cm,
+        bottomMargin=2*cm
+    )
+    
+    # Estilos
+    styles = getSampleStyleSheet()
+    titulo_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        textColor=colors.HexColor('#1e40af'),
+        spaceAfter=10,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    )
+    
+    subtitulo_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.grey,
+        spaceAfter=20,
+        alignment=TA_CENTER
+    )
+    
+    # Elementos do PDF
+    elements = []
+    
+    # Título
+    titulo = Paragraph("📊 Relatório de Empréstimos de Equipamentos", titulo_style)
+    elements.append(titulo)
+    
+    # Data de geração
+    data_geracao = datetime.now().strftime('%d/%m/%Y às %H:%M')
+    subtitulo = Paragraph(f"Gerado em {data_geracao} por {gerado_por}", subtitulo_style)
+    elements.append(subtitulo)
+    
+    # Filtros aplicados
+    filtros_texto = f"<b>Filtros:</b> Tipo: {filtro.capitalize()}"
+    if departamento and departamento != 'todos':
+        filtros_texto += f" | Departamento: {departamento}"
+    if data_inicio:
+        filtros_texto += f" | Início: {datetime.strptime(data_inicio, '%Y-%m-%d').strftime('%d/%m/%Y')}"
+    if data_fim:
+        filtros_texto += f" | Fim: {datetime.strptime(data_fim, '%Y-%m-%d').strftime('%d/%m/%Y')}"
+    
+    filtros_p = Paragraph(filtros_texto, styles['Normal'])
+    elements.append(filtros_p)
+    elements.append(Spacer(1, 0.5*cm))
+    
+    # Estatísticas
+    stats_data = [
+        ['Total', 'Ativos', 'Devolvidos', 'Atrasados'],
+        [str(total), str(ativos), str(devolvidos), str(atrasados)]
+    ]
+    
+    stats_table = Table(stats_data, colWidths=[5*cm, 5*cm, 5*cm, 5*cm])
+    stats_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('FONTSIZE', (0, 1), (-1, -1), 11),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey)
+    ]))
+    
+    elements.append(stats_table)
+    elements.append(Spacer(1, 0.8*cm))
+    
+    # Tabela de empréstimos
+    if emprestimos:
+        # Cabeçalho
+        table_data = [['Equipamento', 'Responsável', 'Depto', 'Data Emp.', 'Prev. Dev.', 'Status', 'Dias']]
+        
+        # Dados
+        def formatar_data(valor):
+            try:
+                return datetime.strptime(str(valor)[:10], '%Y-%m-%d').strftime('%d/%m/%Y')
+            except (TypeError, ValueError):
+                return None
+        
+        for e in emprestimos:
+            # Equipamento já vem embutido na consulta do relatório
+            equipamento_nome = (e.equipamento.nome if e.equipamento else None) or 'N/A'
+            data_emp = formatar_data(e.data_emprestimo) or 'N/A'
+            prev_dev = formatar_data(e.data_devolucao_prevista) or '-'
+            status_text = 'Atrasado' if atrasado(e, hoje) else e.status
+            dias = duracao_dias(e, hoje)
+            if dias is None:
+                dias = '-'
+            
+            table_data.append([
+                equipamento_nome[:25],
+                (e.responsavel or 'N/A')[:20],
+                (e.departamento or '-')[:15],
+                data_emp,
+                prev_dev,
+                status_text,
+                str(dias)
+            ])
+        
+        # Criar tabela
+        emprestimos_table = Table(table_data, colWidths=[5.5*cm, 4*cm, 3*cm, 2.5*cm, 2.5*cm, 2.5*cm, 1.5*cm])
+        
+        # Estilo da tabela
+        table_style = [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (3, 0), (6, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('TOPPADDING', (0, 1), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
+        ]
+        
+        # Destacar linhas atrasadas
+        for i, e in enumerate(emprestimos, 1):
+            if atrasado(e, hoje):
+                table_style.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#fee2e2')))
+        
+        emprestimos_table.setStyle(TableStyle(table_style))
+        elements.append(emprestimos_table)
+    else:
+        elements.append(Paragraph("Nenhum empréstimo encontrado com os filtros aplicados.", styles['Normal']))
+    
+    # Rodapé
+    elements.append(Spacer(1, 1*cm))
+    rodape = Paragraph(
+        f"<i>Sistema de Inventário de Equipamentos TI - {gerado_por}</i>",
+        ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey, alignment=TA_CENTER)
+    )
+    elements.append(rodape)
+    
+    # Gerar PDF
+    doc.build(elements)
+
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def gerar_artefato(formato: str, relatorio: Dict[str, Any], gerado_por: str = '') -> bytes:
+    if formato == 'pdf':
+        return gerar_pdf(relatorio, gerado_por)
+    if formato == 'csv':
+        return gerar_csv(relatorio)
+    if formato == 'xlsx':
+        return gerar_xlsx(relatorio)
+    raise ValueError(f'Formato inválido: {formato}. Use: {", ".join(MIMETYPES)}')
@@ -0,0 +1,322 @@
+"""
+Jobs de relatório em segundo plano
+O cliente envia os parâmetros do relatório, recebe o id do job e consulta o andamento até
+o artefato (PDF/CSV/XLSX) ficar pronto para download. Jobs com os mesmos parâmetros (e os
+mesmos dados) reaproveitam o artefato enquanto ele não expira.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from app.http_cache import obter_versoes
+from app.relatorio_artefatos import MIMETYPES, gerar_artefato
+from app.relatorio_service import chave_filtros, gerar_relatorio
+from app.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+TABELA = 'relatorio_jobs'
+FORMATOS = tuple(MIMETYPES)
+
+PENDENTE = 'Pendente'
+PROCESSANDO = 'Processando'
+CONCLUIDO = 'Concluído'
+ERRO = 'Erro'
+
+# Tempo de vida do artefato (e do registro do job), em segundos
+TTL_JOB = int(os.environ.get('RELATORIO_JOB_TTL', 3600))
+# Formatos que imprimem o nome de quem gerou: o artefato é por usuário, não compartilhado
+FORMATOS_COM_AUTOR = ('pdf',)
+# Job em processamento há mais tempo que isso é considerado abandonado (processo reiniciado)
+TIMEOUT_PROCESSAMENTO = timedelta(minutes=15)
+# Sem scheduler/worker, o próprio processo web limpa os expirados a cada tantos segundos
+INTERVALO_LIMPEZA_LOCAL = 5 * 60
+
+_ultima_limpeza_local = float('-inf')
+_lock_limpeza_local = threading.Lock()
+
+
+def hash_parametros(formato: str, filtros: Dict[str, Optional[str]], gerado_por: str = '') -> str:
+    """
+    Identifica o artefato: formato + filtros normalizados + versões das tabelas + dia (+ autor, nos
+    formatos que o imprimem). Qualquer escrita em empréstimos/equipamentos muda o hash, então um
+    artefato reaproveitado nunca está desatualizado.
+    """
+    versoes = obter_versoes(('emprestimos', 'equipamentos'))
+    marca_versao = 'sem-versao' if versoes is None else \
+        ','.join(f'{t}:{v}' for t, (v, _) in sorted(versoes.items()))
+    autor = gerado_por if formato in FORMATOS_COM_AUTOR else ''
+    base = '|'.join((formato, chave_filtros(filtros), date.today().isoformat(), marca_versao, autor))
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def caminho_artefato(pasta: str, job: Dict[str, Any]) -> Optional[str]:
+    if not job.get('arquivo'):
+        return None
+    return os.path.join(pasta, job['arquivo'])
+
+
+def nome_download(job: Dict[str, Any]) -> str:
+    filtro = (job.get('parametros') or {}).get('filtro') or 'todos'
+    data = (job.get('data_conclusao') or datetime.utcnow().isoformat())[:19]
+    data = data.replace('-', '').replace(':', '').replace('T', '_')
+    return f'relatorio_emprestimos_{filtro}_{data}.{job["formato"]}'
+
+
+def obter_job(job_id: str) -> Optional[Dict[str, Any]]:
+    client = get_supabase_client()
+    resultado = client.table(TABELA).select('*').eq('id', job_id).limit(1).execute()
+    return resultado.data[0] if resultado.data else None
+
+
+def pertence_ao_usuario(job: Dict[str, Any], usuario) -> bool:
+    """Só quem pediu o job (ou um administrador) consulta o andamento e baixa o artefato"""
+    return bool(usuario.is_admin) or job.get('usuario_id') == usuario.id
+
+
+def _job_reaproveitavel(hash_: str, pasta: str, usuario_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Job do mesmo usuário com o mesmo hash ainda em andamento, ou concluído com o artefato disponível"""
+    client = get_supabase_client()
+    consulta = client.table(TABELA).select('*').eq('hash_parametros', hash_)
+    consulta = consulta.is_('usuario_id', 'null') if usuario_id is None else consulta.eq('usuario_id', usuario_id)
+    linhas = consulta.in_('status', [PENDENTE, PROCESSANDO, CONCLUIDO]) \
+        .gt('expira_em', datetime.utcnow().isoformat()) \
+        .order('data_criacao', desc=True).limit(5).execute().data or []
+    for job in linhas:
+        if job['status'] != CONCLUIDO:
+            return job
+        caminho = caminho_artefato(pasta, job)
+        if caminho and os.path.exists(caminho):
+            return job
+    return None
+
+
+def submeter_job(app, formato: str, filtros: Dict[str, Optional[str]],
+                 usuario_id: Optional[int] = None, gerado_por: str = '') -> Tuple[Dict[str, Any], bool]:
+    """
+    Registra um job de relatório (ou devolve o job equivalente já existente) e agenda a execução.
+    Com RELATORIO_JOBS_SINCRONOS (ambientes serverless) o artefato é gerado antes de responder.
+
+    Returns:
+        (job, reaproveitado)
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato inválido. Use: {", ".join(FORMATOS)}')
+
+    pasta = app.config['RELATORIOS_FOLDER']
+    hash_ = hash_parametros(formato, filtros, gerado_por)
+    existente = _job_reaproveitavel(hash_, pasta, usuario_id)
+    if existente:
+        return existente, True
+
+    agora = datetime.utcnow()
+    job = {
+        'id': str(uuid.uuid4()),
+        'hash_parametros': hash_,
+        'formato': formato,
+        'parametros': filtros,
+        'status': PENDENTE,
+        'usuario_id': usuario_id,
+        'gerado_por': gerado_por,
+        'data_criacao': agora.isoformat(),
+        'expira_em': (agora + timedelta(seconds=TTL_JOB)).isoformat()
+    }
+    client = get_supabase_client()
+    job = client.table(TABELA).insert(job).execute().data[0]
+    if app.config.get('RELATORIO_JOBS_SINCRONOS'):
+        # Serverless: threads não sobrevivem ao fim da invocação e cada instância tem o próprio /tmp
+        _executar_e_limpar(app, job['id'])
+        return obter_job(job['id']) or job, False
+    agendar_execucao(app, job['id'])
+    return job, False
+
+
+def agendar_execucao(app, job_id: str):
+    """
+    Executa no scheduler da aplicação, se houver; com o worker dedicado (WORKER_ENABLED) o job fica
+    pendente até ele consumir; senão, executa numa thread daemon.
+    """
+    scheduler = app.extensions.get('scheduler')
+    if scheduler is None and app.config.get('WORKER_ENABLED'):
+        return
+    if scheduler is not None:
+        scheduler.add_job(
+            func=lambda: executar_job(app, job_id),
+            trigger='date',
+            id=f'relatorio_job_{job_id}',
+            name='Gerar relatório',
+            replace_existing=True
+        )
+    else:
+        threading.Thread(
+            target=_executar_e_limpar, args=(app, job_id), name=f'relatorio-job-{job_id[:8]}', daemon=True
+        ).start()
+
+
+def _executar_e_limpar(app, job_id: str):
+    """
+    Geração fora do scheduler (thread do processo web ou requisição serverless): a tarefa agendada
+    relatorio_jobs não roda neste processo, então ele mesmo remove os artefatos expirados da sua pasta
+    """
+    global _ultima_limpeza_local
+    executar_job(app, job_id)
+    with _lock_limpeza_local:
+        if time.monotonic() - _ultima_limpeza_local < INTERVALO_LIMPEZA_LOCAL:
+            return
+        _ultima_limpeza_local = time.monotonic()
+    try:
+        limpar_expirados(app)
+    except Exception as e:
+        logger.warning(f'Erro ao limpar relatórios expirados: {e}')
+
+
+def _reivindicar(job_id: str) -> Optional[Dict[str, Any]]:
+    """Passa o job de Pendente para Processando; só um processo consegue"""
+    client = get_supabase_client()
+    linhas = client.table(TABELA).update({
+        'status': PROCESSANDO, 'data_inicio': datetime.utcnow().isoformat()
+    }).eq('id', job_id).eq('status', PENDENTE).execute().data
+    return linhas[0] if linhas else None
+
+
+def executar_job(app, job_id: str) -> bool:
+    """Gera o artefato do job e grava em RELATORIOS_FOLDER"""
+    with app.app_context():
+        job = _reivindicar(job_id)
+        if job is None:
+            return False
+
+        client = get_supabase_client()
+        try:
+            relatorio = gerar_relatorio(job['parametros'])
+            conteudo = gerar_artefato(job['formato'], relatorio, job.get('gerado_por') or '')
+
+            arquivo = f'{job["hash_parametros"]}.{job["formato"]}'
+            caminho = os.path.join(app.config['RELATORIOS_FOLDER'], arquivo)
+            temporario = f'{caminho}.{job_id}.tmp'
+            with open(temporario, 'wb') as f:
+                f.write(conteudo)
+            os.replace(temporario, caminho)
+
+            agora = datetime.utcnow()
+            client.table(TABELA).update({
+                'status': CONCLUIDO,
+                'arquivo': arquivo,
+                'tamanho_bytes': len(conteudo),
+                'data_conclusao': agora.isoformat(),
+                'expira_em': (agora + timedelta(seconds=TTL_JOB)).isoformat()
+            }).eq('id', job_id).execute()
+            logger.info(f'Relatório {job_id} ({job["formato"]}) gerado: {len(conteudo)} bytes')
+            return True
+        except Exception as e:
+            logger.error(f'Erro ao gerar relatório {job_id}: {e}', exc_info=True)
+            client.table(TABELA).update({
+                'status': ERRO, 'erro': str(e)[:1000], 'data_conclusao': datetime.utcnow().isoformat()
+            }).eq('id', job_id).execute()
+            return False
+
+
+def processar_pendentes(app) -> int:
+    """
+    Executado periodicamente pelo scheduler: retoma jobs pendentes (ex.: submetidos antes de um
+    reinício) e devolve para a fila os que ficaram presos em Processando.
+    """
+    with app.app_context():
+        client = get_supabase_client()
+        limite = (datetime.utcnow() - TIMEOUT_PROCESSAMENTO).isoformat()
+        client.table(TABELA).update({'status': PENDENTE}) \
+            .eq('status', PROCESSANDO).lt('data_inicio', limite).execute()
+
+        pendentes = client.table(TABELA).select('id').eq('status', PENDENTE) \
+            .order('data_criacao').limit(20).execute().data or []
+
+    executados = 0
+    for job in pendentes:
+        if executar_job(app, job['id']):
+            executados += 1
+    return executados
+
+
+def _remover_artefatos_antigos(pasta: str) -> int:
+    """
+    Remove artefatos da pasta local gravados há mais de TTL_JOB: o arquivo é regravado a cada geração
+    e os jobs expiram TTL_JOB após ela, então nenhum job válido os usa. Cobre arquivos de processos
+    cujos registros já foram removidos por outro processo (pastas não compartilhadas).
+    """
+    limite = time.time() - TTL_JOB
+    removidos = 0
+    try:
+        entradas = list(os.scandir(pasta))
+    except FileNotFoundError:
+        return 0
+    for entrada in entradas:
+        if entrada.is_file() and entrada.name.rsplit('.', 1)[-1] in FORMATOS:
+            try:
+                if entrada.stat().st_mtime < limite:
+                    os.remove(entrada.path)
+                    removidos += 1
+            except OSError as e:
+                logger.warning(f'Não foi possível remover o relatório {entrada.name}: {e}')
+    return removidos
+
+
+def limpar_expirados(app) -> int:
+    """Remove artefatos e registros de jobs expirados"""
+    with app.app_context():
+        pasta = app.config['RELATORIOS_FOLDER']
+        _remover_artefatos_antigos(pasta)
+        client = get_supabase_client()
+        expirados = client.table(TABELA).select('id, arquivo') \
+            .lte('expira_em', datetime.utcnow().isoformat()).limit(1000).execute().data or []
+        if not expirados:
+            return 0
+
+        # Um mesmo arquivo pode ser de vários jobs (mesmo hash); só apaga se nenhum job válido o usa
+        arquivos = {job['arquivo'] for job in expirados if job.get('arquivo')}
+        em_uso = set()
+        if arquivos:
+            em_uso = {
+                linha['arquivo'] for linha in client.table(TABELA).select('arquivo')
+                .in_('arquivo', list(arquivos)).gt('expira_em', datetime.utcnow().isoformat())
+                .execute().data or []
+            }
+        for arquivo in arquivos - em_uso:
+            try:
+                os.remove(os.path.join(pasta, arquivo))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f'Não foi possível remover o relatório {arquivo}: {e}')
+
+        client.table(TABELA).delete().in_('id', [job['id'] for job in expirados]).execute()
+        logger.info(f'{len(expirados)} job(s) de relatório expirado(s) removido(s)')
+        return len(expirados)
+
+
+def manutencao_jobs(app):
+    """Tarefa agendada: processa pendentes e limpa expirados"""
+    try:
+        processar_pendentes(app)
+        limpar_expirados(app)
+    except Exception as e:
+        logger.error(f'Erro na manutenção dos jobs de relatório: {e}', exc_info=True)
+
+
+def status_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': job['id'],
+        'formato': job['formato'],
+        'parametros': job.get('parametros'),
+        'status': job['status'],
+        'erro': job.get('erro'),
+        'tamanho_bytes': job.get('tamanho_bytes'),
+        'data_criacao': job.get('data_criacao'),
+        'data_conclusao': job.get('data_conclusao'),
+        'expira_em': job.get('expira_em')
+    }
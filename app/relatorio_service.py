@@ -0,0 +1,197 @@
+"""
+Motor do relatório de empréstimos
+Usado por /relatorios/emprestimos e pelas exportações (PDF): os filtros vão para o banco,
+os agregados são calculados com GROUP BY (função relatorio_emprestimos_resumo) e ficam em cache
+pela combinação de filtros normalizados + versões das tabelas (as linhas não entram no cache).
+"""
+import json
+import logging
+import os
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cache import CacheTTL
+from app.export_service import paginar
+from app.http_cache import obter_versoes
+from app.models_supabase import Emprestimo
+from app.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+FILTROS_VALIDOS = ('todos', 'ativos', 'historico', 'atrasados')
+RPC_INEXISTENTE = 'PGRST202'
+
+# Sem versões das tabelas (versoes_tabelas ausente) o cache só pode confiar no tempo
+TTL_RELATORIO = int(os.environ.get('RELATORIO_CACHE_TTL', 300))
+TTL_SEM_VERSAO = 30
+
+_cache = CacheTTL(max_itens=64, ttl=TTL_RELATORIO, nome='relatorios')
+
+
+def _data_iso(valor: Optional[str]) -> Optional[str]:
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return None
+
+
+def normalizar_filtros(filtro: Optional[str] = None, data_inicio: Optional[str] = None,
+                       data_fim: Optional[str] = None, departamento: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Filtros canônicos: mesmo relatório sempre gera o mesmo dicionário (e a mesma chave de cache)"""
+    departamento = (departamento or '').strip()
+    return {
+        'filtro': filtro if filtro in FILTROS_VALIDOS else 'todos',
+        'data_inicio': _data_iso(data_inicio),
+        'data_fim': _data_iso(data_fim),
+        'departamento': departamento if departamento and departamento != 'todos' else None
+    }
+
+
+def filtros_da_requisicao(args) -> Dict[str, Optional[str]]:
+    return normalizar_filtros(
+        args.get('filtro'), args.get('data_inicio'), args.get('data_fim'), args.get('departamento')
+    )
+
+
+def chave_filtros(filtros: Dict[str, Optional[str]]) -> str:
+    return json.dumps(filtros, sort_keys=True, separators=(',', ':'))
+
+
+def _data(valor: Any) -> Optional[date]:
+    """Aceita 'YYYY-MM-DD' e timestamps ISO ('YYYY-MM-DDTHH:MM:SS...')"""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(str(valor)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def atrasado(emprestimo: Emprestimo, hoje: Optional[date] = None) -> bool:
+    hoje = hoje or datetime.utcnow().date()
+    prevista = _data(emprestimo.data_devolucao_prevista)
+    return emprestimo.status == 'Ativo' and prevista is not None and prevista < hoje
+
+
+def duracao_dias(emprestimo: Emprestimo, hoje: Optional[date] = None) -> Optional[int]:
+    """Dias emprestado (até hoje, se ativo; até a devolução, se devolvido)"""
+    inicio = _data(emprestimo.data_emprestimo)
+    if not inicio:
+        return None
+    if emprestimo.status == 'Ativo':
+        return ((hoje or datetime.utcnow().date()) - inicio).days
+    fim = _data(emprestimo.data_devolucao_real)
+    return (fim - inicio).days if fim else None
+
+
+def buscar_emprestimos(filtros: Dict[str, Optional[str]], campos: Optional[List[str]] = None) -> List[Emprestimo]:
+    """
+    Empréstimos filtrados no banco, mais recentes primeiro. Sem `campos`, traz todas as colunas e o
+    equipamento embutido; com `campos` (?fields=), só a projeção pedida (deve incluir data_emprestimo)
+    """
+    client = get_supabase_client()
+    select = Emprestimo.select_clause(campos)
+    emprestimos = [
+        Emprestimo(linha) for linha in paginar(
+            lambda: Emprestimo.aplicar_filtros(client.table('emprestimos').select(select), **filtros)
+        )
+    ]
+    emprestimos.sort(key=lambda e: e.data_emprestimo or '', reverse=True)
+    return emprestimos
+
+
+def _agregados_rpc(filtros: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    client = get_supabase_client()
+    return client.rpc('relatorio_emprestimos_resumo', {
+        'p_filtro': filtros['filtro'],
+        'p_data_inicio': filtros['data_inicio'],
+        'p_data_fim': filtros['data_fim'],
+        'p_departamento': filtros['departamento']
+    }).execute().data
+
+
+def _agregados_em_memoria(emprestimos: List[Emprestimo]) -> Dict[str, Any]:
+    """Mesmos agregados da função SQL, calculados sobre a lista já filtrada"""
+    hoje = datetime.utcnow().date()
+    duracoes = [
+        duracao_dias(e, hoje) for e in emprestimos
+        if e.status == 'Devolvido' and duracao_dias(e, hoje) is not None
+    ]
+    por_departamento = {}
+    por_equipamento = {}
+    for e in emprestimos:
+        dept = e.departamento or 'Não informado'
+        por_departamento[dept] = por_departamento.get(dept, 0) + 1
+        if e.equipamento and e.equipamento.nome:
+            por_equipamento[e.equipamento.nome] = por_equipamento.get(e.equipamento.nome, 0) + 1
+
+    top = sorted(por_equipamento.items(), key=lambda x: (-x[1], x[0]))[:10]
+    return {
+        'estatisticas': {
+            'total': len(emprestimos),
+            'ativos': sum(1 for e in emprestimos if e.status == 'Ativo'),
+            'devolvidos': sum(1 for e in emprestimos if e.status == 'Devolvido'),
+            'atrasados': sum(1 for e in emprestimos if atrasado(e, hoje)),
+            'duracao_media': round(sum(duracoes) / len(duracoes), 1) if duracoes else 0
+        },
+        'emprestimos_por_departamento': por_departamento,
+        'top_equipamentos': [{'nome': nome, 'quantidade': qtd} for nome, qtd in top]
+    }
+
+
+def _gerar_agregados(filtros: Dict[str, Optional[str]]) -> Tuple[Dict[str, Any], Optional[List[Emprestimo]]]:
+    """
+    Agregados do relatório. Sem a função SQL, são calculados sobre a lista completa, que também é
+    devolvida para não ser lida duas vezes
+    """
+    emprestimos = None
+    try:
+        agregados = _agregados_rpc(filtros)
+    except Exception as e:
+        if getattr(e, 'code', None) != RPC_INEXISTENTE:
+            raise
+        logger.warning('Função relatorio_emprestimos_resumo não encontrada no banco; agregando em memória')
+        emprestimos = buscar_emprestimos(filtros)
+        agregados = _agregados_em_memoria(emprestimos)
+
+    estatisticas = agregados['estatisticas']
+    estatisticas['duracao_media'] = float(estatisticas.get('duracao_media') or 0)
+    return {
+        'estatisticas': estatisticas,
+        'emprestimos_por_departamento': agregados['emprestimos_por_departamento'],
+        'top_equipamentos': agregados['top_equipamentos'],
+        'gerado_em': datetime.utcnow().isoformat()
+    }, emprestimos
+
+
+def gerar_relatorio(filtros: Dict[str, Optional[str]], campos: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Relatório de empréstimos para os filtros normalizados (ver normalizar_filtros); `campos` limita
+    as colunas lidas da lista de empréstimos (None = completa, como nas exportações).
+    Os agregados ficam em cache enquanto as tabelas não mudarem e o dia não virar (as versões vêm
+    de versoes_tabelas, incrementadas por trigger a cada escrita); a lista de empréstimos é lida do
+    banco a cada chamada, para o cache não guardar linhas (memória limitada por filtro, não pela tabela).
+    """
+    versoes = obter_versoes(('emprestimos', 'equipamentos'))
+    if versoes is None:
+        marca_versao, ttl = 'sem-versao', TTL_SEM_VERSAO
+    else:
+        marca_versao, ttl = ','.join(f'{t}:{v}' for t, (v, _) in sorted(versoes.items())), None
+
+    chave = (chave_filtros(filtros), date.today().isoformat(), marca_versao)
+    agregados = _cache.get(chave)
+    emprestimos = None
+    if agregados is None:
+        agregados, emprestimos = _gerar_agregados(filtros)
+        _cache.set(chave, agregados, ttl=ttl)
+    if emprestimos is None or campos:
+        emprestimos = buscar_emprestimos(filtros, campos)
+    return {'filtros': filtros, 'emprestimos': emprestimos, **agregados}
+
+
+def invalidar_cache():
+    """Descarta os relatórios em cache deste processo"""
+    _cache.limpar()
@@ -0,0 +1,174 @@
+"""
+Camada de resposta HTTP: serialização JSON rápida (orjson, se instalado)
+e compressão gzip/brotli negociada via Accept-Encoding.
+"""
+import gzip
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider, _default
+
+try:
+    import orjson
+except Exception:  # orjson ausente: usa o json da biblioteca padrão
+    orjson = None
+
+try:
+    import brotli
+except Exception:  # brotli ausente: negocia apenas gzip
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'application/manifest+json',
+    'text/javascript',
+    'text/css',
+    'text/html',
+    'text/plain',
+    'image/svg+xml',
+}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Provider JSON do Flask usando orjson; mantém o fallback do Flask para tipos especiais"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        # Evita o decode/encode intermediário: orjson já gera bytes UTF-8
+        body = orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+class _CacheEstaticos:
+    """Cache LRU de assets estáticos já comprimidos (evita recomprimir app.js a cada requisição)"""
+
+    def __init__(self, max_itens=64):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+
+def comprimir(data: bytes, encoding: str, nivel_gzip: int = 6, qualidade_brotli: int = 5) -> bytes:
+    """Comprime `data` com o encoding informado ('br' ou 'gzip')"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=qualidade_brotli)
+    return gzip.compress(data, compresslevel=nivel_gzip)
+
+
+def escolher_encoding():
+    """Escolhe o melhor encoding aceito pelo cliente (brotli > gzip)"""
+    aceitos = request.accept_encodings
+    if brotli is not None and aceitos['br']:
+        return 'br'
+    if aceitos['gzip']:
+        return 'gzip'
+    return None
+
+
+def _nao_modificado(response, etag: str, fraco: bool):
+    """304 para a representação comprimida; fecha o arquivo aberto pelo send_file sem lê-lo"""
+    response.close()
+    resposta = response.__class__(status=304)
+    for cabecalho in ('Cache-Control', 'Expires', 'Last-Modified', 'Vary'):
+        if cabecalho in response.headers:
+            resposta.headers[cabecalho] = response.headers[cabecalho]
+    resposta.set_etag(etag, weak=fraco)
+    return resposta
+
+
+def init_response_layer(app):
+    """Registra o provider JSON rápido e o hook de compressão na aplicação"""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+
+    app.config.setdefault('COMPRESSION_ENABLED', os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true')
+    app.config.setdefault('COMPRESSION_MIN_SIZE', int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)))
+    app.config.setdefault('COMPRESSION_GZIP_LEVEL', 6)
+    app.config.setdefault('COMPRESSION_BROTLI_QUALITY', 5)
+
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+
+    cache_estaticos = _CacheEstaticos()
+
+    @app.after_request
+    def comprimir_resposta(response):
+        if (
+            response.status_code != 200
+            or response.is_streamed and not response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'Content-Range' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = escolher_encoding()
+        if encoding is None:
+            return response
+
+        estatico = response.direct_passthrough
+        etag, etag_fraco = response.get_etag()
+        # O send_file compara o If-None-Match com o ETag original, mas o navegador devolve o ETag com
+        # o sufixo do encoding (definido abaixo): a revalidação dessa representação é respondida aqui
+        if etag and request.if_none_match.contains_weak(f'{etag}-{encoding}'):
+            return _nao_modificado(response, f'{etag}-{encoding}', etag_fraco)
+        chave = (request.path, encoding, etag or response.headers.get('Last-Modified'))
+        dados_comprimidos = cache_estaticos.get(chave) if estatico else None
+
+        if dados_comprimidos is None:
+            # Arquivos enviados via send_file vêm em modo passthrough; é preciso ler o conteúdo
+            response.direct_passthrough = False
+            dados = response.get_data()
+            if len(dados) < app.config['COMPRESSION_MIN_SIZE']:
+                return response
+            dados_comprimidos = comprimir(
+                dados, encoding,
+                nivel_gzip=app.config['COMPRESSION_GZIP_LEVEL'],
+                qualidade_brotli=app.config['COMPRESSION_BROTLI_QUALITY']
+            )
+            if estatico:
+                cache_estaticos.set(chave, dados_comprimidos)
+        else:
+            # Conteúdo já comprimido em cache: só garante o fechamento do arquivo original
+            fechar = getattr(response.response, 'close', None)
+            if fechar is not None:
+                response.call_on_close(fechar)
+            response.direct_passthrough = False
+
+        response.set_data(dados_comprimidos)
+        response.headers['Content-Encoding'] = encoding
+        # Representações diferentes precisam de ETags diferentes
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak=etag_fraco)
+        return response
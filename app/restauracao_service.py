@@ -0,0 +1,256 @@
+"""
+Restauração dos backups lógicos (ver app/backup_service.py)
+Cada snapshot tem todas as linhas das tabelas; os chunks são conferidos (SHA-256) antes de gravar.
+Cada tabela é gravada em upserts de várias linhas enviados por um pool de threads, na ordem de
+dependência das chaves estrangeiras; linhas que não existiam no momento do backup são removidas
+na ordem inversa. O progresso fica num arquivo de checkpoint: uma restauração interrompida
+continua da última linha confirmada (mesmo com outro tamanho de lote).
+"""
+import json
+import logging
+import os
+import threading
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.backup_service import COLUNAS_GERADAS, TABELAS, ler_manifesto, linhas_brutas, verificar_backup
+from app.export_service import paginar
+from app.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+RPC_INEXISTENTE = 'PGRST202'
+TAMANHO_LOTE = 1000
+WORKERS = 4
+TAMANHO_LOTE_REMOCAO = 500
+
+EM_ANDAMENTO = 'Em andamento'
+CONCLUIDA = 'Concluída'
+ERRO = 'Erro'
+
+
+class ErroRestauracao(Exception):
+    """Backup inválido para restauração (inexistente ou com checksum divergente)"""
+
+
+def obter_snapshot(pasta: str, nome: str) -> Dict[str, Any]:
+    manifesto = ler_manifesto(pasta, nome)
+    if not manifesto:
+        raise ErroRestauracao(f'Backup {nome} não encontrado')
+    return manifesto
+
+
+def caminho_checkpoint(pasta: str, nome: str) -> str:
+    return os.path.join(pasta, f'restauracao_{os.path.splitext(os.path.basename(nome))[0]}.json')
+
+
+def ler_checkpoint(pasta: str, nome: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(caminho_checkpoint(pasta, nome), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class _Checkpoint:
+    """Estado da restauração gravado em disco (escrita atômica, protegida por lock)"""
+
+    def __init__(self, caminho: str, estado: Dict[str, Any]):
+        self.caminho = caminho
+        self.estado = estado
+        self._lock = threading.Lock()
+
+    def atualizar(self, **campos):
+        with self._lock:
+            self.estado.update(campos)
+            self.estado['atualizado_em'] = datetime.utcnow().isoformat()
+            temporario = f'{self.caminho}.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(self.estado, f, ensure_ascii=False, indent=2)
+            os.replace(temporario, self.caminho)
+
+    def etapa(self, chave: str) -> Dict[str, Any]:
+        return self.estado['etapas'].setdefault(chave, {'lotes_confirmados': 0, 'linhas': 0, 'concluida': False})
+
+
+def _lotes(linhas: Iterator[bytes], tamanho: int) -> Iterator[List[Dict[str, Any]]]:
+    lote: List[Dict[str, Any]] = []
+    for linha in linhas:
+        lote.append(json.loads(linha))
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def linhas_gravaveis(tabela: str, lote: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Remove as colunas geradas (o banco recalcula) das linhas do snapshot"""
+    geradas = COLUNAS_GERADAS.get(tabela)
+    if not geradas:
+        return lote
+    return [{coluna: valor for coluna, valor in linha.items() if coluna not in geradas} for linha in lote]
+
+
+def _upsert_lote(tabela: str, lote: List[Dict[str, Any]]):
+    get_supabase_client().table(tabela).upsert(linhas_gravaveis(tabela, lote), on_conflict='id').execute()
+
+
+def _aplicar_tabela(pasta: str, manifesto: Dict[str, Any], tabela: str, checkpoint: _Checkpoint,
+                    tamanho_lote: int, workers: int, progresso: Optional[Callable[[str, int], None]]):
+    """
+    Envia os lotes da tabela em paralelo. O checkpoint guarda o maior prefixo de linhas confirmadas:
+    ao retomar, essas linhas são puladas (as seguintes, mesmo que já gravadas, são regravadas pelo
+    upsert). Pular por linhas, e não por índice de lote, permite retomar com outro tamanho de lote.
+    """
+    etapa = checkpoint.etapa(tabela)
+    if etapa['concluida']:
+        return
+    pular = etapa['linhas']
+    proximo = 0  # próximo lote desta execução a entrar no prefixo confirmado
+    confirmados: Dict[int, int] = {}  # lotes concluídos fora de ordem -> linhas
+
+    def confirmar(feitos):
+        nonlocal proximo
+        for futuro in feitos:
+            futuro.result()
+            indice, linhas = pendentes.pop(futuro)
+            confirmados[indice] = linhas
+        while proximo in confirmados:
+            etapa['linhas'] += confirmados.pop(proximo)
+            etapa['lotes_confirmados'] += 1
+            proximo += 1
+        checkpoint.atualizar()
+        if progresso:
+            progresso(tabela, etapa['linhas'])
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'restaurar-{tabela}') as executor:
+        pendentes: Dict[Any, Any] = {}
+        restantes = islice(linhas_brutas(pasta, manifesto, tabela), pular, None)
+        for indice, lote in enumerate(_lotes(restantes, tamanho_lote)):
+            # Limita os lotes em memória a duas vezes o número de workers
+            if len(pendentes) >= workers * 2:
+                confirmar(wait(pendentes, return_when=FIRST_COMPLETED)[0])
+            pendentes[executor.submit(_upsert_lote, tabela, lote)] = (indice, len(lote))
+        if pendentes:
+            confirmar(wait(pendentes)[0])
+
+    etapa['concluida'] = True
+    checkpoint.atualizar()
+
+
+def _ids_snapshot(pasta: str, manifesto: Dict[str, Any], tabela: str) -> Iterator[int]:
+    for linha in linhas_brutas(pasta, manifesto, tabela):
+        yield json.loads(linha)['id']
+
+
+def _remover_extras(pasta: str, manifesto: Dict[str, Any], tabela: str) -> int:
+    """Remove linhas criadas depois do backup (junção dos ids do banco e do snapshot, ambos em ordem)"""
+    client = get_supabase_client()
+    do_snapshot = _ids_snapshot(pasta, manifesto, tabela)
+    proximo = next(do_snapshot, None)
+    extras = []
+    for linha in paginar(lambda: client.table(tabela).select('id')):
+        while proximo is not None and proximo < linha['id']:
+            proximo = next(do_snapshot, None)
+        if proximo != linha['id']:
+            extras.append(linha['id'])
+    for inicio in range(0, len(extras), TAMANHO_LOTE_REMOCAO):
+        client.table(tabela).delete().in_('id', extras[inicio:inicio + TAMANHO_LOTE_REMOCAO]).execute()
+    return len(extras)
+
+
+def _ajustar_sequencia(tabela: str):
+    """Avança a sequência do id após inserir ids explícitos (função SQL ajustar_sequencia_id)"""
+    try:
+        get_supabase_client().rpc('ajustar_sequencia_id', {'p_tabela': tabela}).execute()
+    except Exception as e:
+        if getattr(e, 'code', None) != RPC_INEXISTENTE:
+            raise
+        logger.warning(f'Função ajustar_sequencia_id não encontrada no banco; ajuste a sequência de {tabela} manualmente')
+
+
+def restaurar(pasta: str, nome: str, tabelas: Optional[List[str]] = None, tamanho_lote: int = TAMANHO_LOTE,
+              workers: int = WORKERS, remover_extras: bool = True,
+              progresso: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
+    """
+    Restaura o snapshot `nome` a partir de BACKUP_FOLDER.
+
+    Args:
+        tabelas: subconjunto de TABELAS (padrão: todas), sempre aplicado na ordem de dependência
+        remover_extras: remove linhas que não existiam no momento do backup
+        progresso: callback(tabela, linhas enviadas) para a CLI
+
+    Returns:
+        Estado final do checkpoint
+    """
+    tabelas = [t for t in TABELAS if tabelas is None or t in tabelas]
+    manifesto = obter_snapshot(pasta, nome)
+
+    anterior = ler_checkpoint(pasta, nome)
+    if anterior and anterior.get('status') == CONCLUIDA:
+        anterior = None
+    checkpoint = _Checkpoint(caminho_checkpoint(pasta, nome), anterior or {
+        'backup': nome,
+        'tabelas': tabelas,
+        'iniciado_em': datetime.utcnow().isoformat(),
+        'etapas': {}
+    })
+    checkpoint.atualizar(status=EM_ANDAMENTO, erro=None)
+
+    try:
+        # Checksums conferidos antes de gravar qualquer linha
+        if not checkpoint.estado.get('verificado'):
+            problemas = verificar_backup(pasta, nome)
+            if problemas:
+                raise ErroRestauracao(f'Backup {nome} inválido: {"; ".join(problemas[:10])}')
+            checkpoint.atualizar(verificado=True)
+
+        tabelas = [t for t in tabelas if t in manifesto['tabelas']]
+        for tabela in tabelas:
+            logger.info(f'Restaurando {tabela} ({manifesto["tabelas"][tabela]["linhas"]} linhas)')
+            _aplicar_tabela(pasta, manifesto, tabela, checkpoint, tamanho_lote, workers, progresso)
+            _ajustar_sequencia(tabela)
+
+        if remover_extras:
+            for tabela in reversed(tabelas):
+                etapa = checkpoint.etapa(f'remocao:{tabela}')
+                if etapa['concluida']:
+                    continue
+                etapa['linhas'] = _remover_extras(pasta, manifesto, tabela)
+                etapa['concluida'] = True
+                checkpoint.atualizar()
+
+        checkpoint.atualizar(status=CONCLUIDA, concluido_em=datetime.utcnow().isoformat())
+        logger.info(f'Restauração de {nome} concluída')
+    except Exception as e:
+        logger.error(f'Erro ao restaurar {nome}: {e}', exc_info=True)
+        checkpoint.atualizar(status=ERRO, erro=str(e)[:1000])
+        raise
+    return checkpoint.estado
+
+
+def em_andamento(pasta: str, nome: str, inatividade_segundos: int = 300) -> bool:
+    """Restauração do backup com checkpoint atualizado recentemente (processo ainda ativo)"""
+    estado = ler_checkpoint(pasta, nome)
+    if not estado or estado.get('status') != EM_ANDAMENTO:
+        return False
+    atualizado_em = datetime.fromisoformat(estado['atualizado_em'])
+    return (datetime.utcnow() - atualizado_em).total_seconds() < inatividade_segundos
+
+
+def restaurar_em_segundo_plano(app, nome: str, **opcoes) -> threading.Thread:
+    """Usado pelo painel admin: a restauração de tabelas grandes leva minutos"""
+    def executar():
+        with app.app_context():
+            try:
+                restaurar(app.config['BACKUP_FOLDER'], nome, **opcoes)
+            except Exception:
+                pass  # registrado no checkpoint
+
+    thread = threading.Thread(target=executar, name=f'restaurar-{nome[:20]}', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,174 @@
+"""
+Rollup mensal de empréstimos e manutenções
+A tabela rollup_mensal guarda (mes, tipo, departamento) -> contagem, custo e dias_uso e é mantida
+por triggers a cada escrita (ver supabase_init.sql). Séries temporais do dashboard e a previsão de
+demanda leem dela, então o custo das consultas não cresce com o histórico.
+"""
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.export_service import paginar
+from app.models_supabase import Departamento
+from app.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+
+TABELA = 'rollup_mensal'
+RPC_INEXISTENTE = 'PGRST202'
+NAO_INFORMADO = 'Não informado'
+TAMANHO_LOTE = 1000
+
+Chave = Tuple[str, str, str]
+
+
+def _data(valor: Any) -> Optional[date]:
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(str(valor)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def mes_de(valor: Any) -> Optional[str]:
+    """Primeiro dia do mês ('YYYY-MM-01') de uma data ou timestamp ISO"""
+    data = _data(valor)
+    return data.replace(day=1).isoformat() if data else None
+
+
+def ultimos_meses(quantidade: int, hoje: Optional[date] = None) -> List[str]:
+    """Meses ('YYYY-MM-01') do mais antigo ao atual"""
+    hoje = hoje or date.today()
+    ano, mes = hoje.year, hoje.month
+    meses = []
+    for _ in range(quantidade):
+        meses.append(date(ano, mes, 1).isoformat())
+        ano, mes = (ano, mes - 1) if mes > 1 else (ano - 1, 12)
+    return meses[::-1]
+
+
+def _normalizar(texto: Optional[str]) -> str:
+    return (texto or '').strip() or NAO_INFORMADO
+
+
+def _somar(totais: Dict[Chave, Dict[str, Any]], chave: Chave, contagem=0, custo=0, dias_uso=0):
+    item = totais.setdefault(chave, {'contagem': 0, 'custo': 0, 'dias_uso': 0})
+    item['contagem'] += contagem
+    item['custo'] += custo
+    item['dias_uso'] += dias_uso
+
+
+def agregar_historico() -> Dict[Chave, Dict[str, Any]]:
+    """
+    Mesmo agrupamento de reconstruir_rollup_mensal(), calculado a partir das tabelas de origem
+    lidas em páginas (memória proporcional ao número de meses x tipos x departamentos).
+    """
+    client = get_supabase_client()
+    totais: Dict[Chave, Dict[str, Any]] = {}
+
+    for linha in paginar(lambda: client.table('emprestimos').select(
+            'id,departamento,status,data_emprestimo,data_devolucao_real,equipamentos(tipo)')):
+        mes = mes_de(linha.get('data_emprestimo'))
+        if not mes:
+            continue
+        dias_uso = 0
+        inicio, fim = _data(linha.get('data_emprestimo')), _data(linha.get('data_devolucao_real'))
+        if linha.get('status') == 'Devolvido' and inicio and fim:
+            dias_uso = max((fim - inicio).days, 0)
+        tipo = _normalizar((linha.get('equipamentos') or {}).get('tipo'))
+        _somar(totais, (mes, tipo, _normalizar(linha.get('departamento'))), contagem=1, dias_uso=dias_uso)
+
+    for linha in paginar(lambda: client.table('manutencoes').select(
+            'id,custo,data_inicio,data_registro,equipamentos(tipo,departamento_atual)')):
+        mes = mes_de(linha.get('data_inicio') or linha.get('data_registro'))
+        equipamento = linha.get('equipamentos')
+        if not mes or not equipamento:
+            continue
+        chave = (mes, _normalizar(equipamento.get('tipo')), _normalizar(equipamento.get('departamento_atual')))
+        _somar(totais, chave, custo=linha.get('custo') or 0)
+
+    return totais
+
+
+def reconstruir() -> int:
+    """
+    Recalcula a tabela inteira (carga inicial / correções).
+    Usa a função SQL reconstruir_rollup_mensal; sem ela, agrega em Python e regrava em lotes.
+
+    Returns:
+        Número de linhas do rollup
+    """
+    client = get_supabase_client()
+    try:
+        return client.rpc('reconstruir_rollup_mensal', {}).execute().data or 0
+    except Exception as e:
+        if getattr(e, 'code', None) != RPC_INEXISTENTE:
+            raise
+        logger.warning('Função reconstruir_rollup_mensal não encontrada no banco; reconstruindo em Python')
+
+    linhas = [
+        {'mes': mes, 'tipo': tipo, 'departamento': departamento, **valores}
+        for (mes, tipo, departamento), valores in agregar_historico().items()
+    ]
+    client.table(TABELA).delete().gte('mes', '1900-01-01').execute()
+    for inicio in range(0, len(linhas), TAMANHO_LOTE):
+        client.table(TABELA).insert(linhas[inicio:inicio + TAMANHO_LOTE]).execute()
+    return len(linhas)
+
+
+def linhas_rollup(desde: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Linhas do rollup a partir do mês `desde` ('YYYY-MM-01').
+    Sem a tabela (supabase_init.sql não aplicado), agrega direto das tabelas de origem.
+    """
+    client = get_supabase_client()
+
+    def montar_query():
+        query = client.table(TABELA).select('id,mes,tipo,departamento,contagem,custo,dias_uso')
+        return query.gte('mes', desde) if desde else query
+
+    try:
+        yield from paginar(montar_query)
+        return
+    except Exception as e:
+        if getattr(e, 'code', None) not in Departamento.ERROS_TABELA_INEXISTENTE:
+            raise
+        logger.warning('Tabela rollup_mensal não encontrada no banco; agregando o histórico completo')
+
+    for (mes, tipo, departamento), valores in agregar_historico().items():
+        if not desde or mes >= desde:
+            yield {'mes': mes, 'tipo': tipo, 'departamento': departamento, **valores}
+
+
+def serie_mensal(meses: int = 12, hoje: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Totais por mês dos últimos `meses` meses (meses sem movimento aparecem zerados)"""
+    chaves = ultimos_meses(meses, hoje)
+    serie = {mes: {'contagem': 0, 'custo': 0, 'dias_uso': 0} for mes in chaves}
+    for linha in linhas_rollup(desde=chaves[0]):
+        item = serie.get(str(linha['mes'])[:10])
+        if item is not None:
+            item['contagem'] += linha['contagem']
+            item['custo'] += linha['custo'] or 0
+            item['dias_uso'] += linha['dias_uso']
+    return [{'mes': mes[:7], **serie[mes]} for mes in chaves]
+
+
+def contagem_por_tipo_e_mes() -> Dict[str, Dict[str, int]]:
+    """{tipo: {'YYYY-MM': empréstimos}} com todo o histórico"""
+    por_tipo: Dict[str, Dict[str, int]] = {}
+    for linha in linhas_rollup():
+        if linha['contagem']:
+            meses = por_tipo.setdefault(linha['tipo'], {})
+            mes = str(linha['mes'])[:7]
+            meses[mes] = meses.get(mes, 0) + linha['contagem']
+    return por_tipo
+
+
+def contagem_por_mes_do_ano() -> Dict[int, int]:
+    """{1..12: empréstimos} somando todos os anos"""
+    por_mes = {mes: 0 for mes in range(1, 13)}
+    for linha in linhas_rollup():
+        por_mes[int(str(linha['mes'])[5:7])] += linha['contagem']
+    return por_mes
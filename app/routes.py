@@ -1,6 +1,8 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, make_response, current_app, send_from_directory
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, make_response, current_app, send_from_directory, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
-from app.models_supabase import Usuario, Equipamento, Emprestimo, EquipamentoFoto, Manutencao, PushSubscription
+from app.models_supabase import Usuario, Equipamento, Emprestimo, Departamento, EquipamentoFoto, Manutencao, PushSubscription, parse_campos
+from app.http_cache import conditional_get, nao_cachear
+from app.relatorio_service import invalidar_cache as invalidar_cache_relatorios
 try:
     from app.prediction_service import prediction_service
     _prediction_import_error = None
@@ -10,9 +12,8 @@ except Exception as _e:
 from datetime import datetime
 from functools import wraps
 from io import BytesIO
-from werkzeug.utils import secure_filename
 import os
-import uuid
+import time
 import qrcode
 import base64
 
@@ -29,6 +30,22 @@ def health():
         'message': 'API is running'
     })
 
+@main.route('/metrics')
+def metrics():
+    """Métricas no formato de texto do Prometheus, somadas entre os processos (METRICS_TOKEN protege a rota)"""
+    import hmac
+    from app.metricas import exportar
+
+    if not current_app.config.get('METRICS_ENABLED'):
+        return jsonify({'success': False, 'message': 'Métricas desativadas'}), 404
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        enviado = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(enviado.encode(), f'Bearer {token}'.encode()):
+            return jsonify({'success': False, 'message': 'Token inválido'}), 401
+    return Response(exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
+
 @main.route('/debug/config')
 def debug_config():
     """Rota de debug para verificar configuração (REMOVER EM PRODUÇÃO!)"""
@@ -68,7 +85,9 @@ def debug_db():
         client = get_supabase_client()
         
         # Tenta uma query simples
+        inicio = time.perf_counter()
         response = client.table('usuarios').select('id').limit(1).execute()
+        info['latencia_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
         
         info['can_connect'] = True
         info['count_usuarios'] = 'Query succeeded'
@@ -408,52 +427,38 @@ def realizar_backup_automatico(app):
     """Função para realizar backup automático (chamada pelo scheduler)"""
     with app.app_context():
         try:
-            import shutil
-            from datetime import datetime
-            
-            # Caminho do banco de dados
-            db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'inventario.db')
+            from app.backup_service import criar_backup
             
-            # Pasta de backups
             backup_folder = app.config['BACKUP_FOLDER']
             
-            # Nome do arquivo de backup com timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_filename = f'backup_auto_{timestamp}.db'
-            backup_path = os.path.join(backup_folder, backup_filename)
+            # Incremental, com leitura completa do banco a cada BACKUP_FULL_DAYS dias
+            manifesto = criar_backup(backup_folder, origem='auto', dias_completo=app.config['BACKUP_FULL_DAYS'])
             
-            # Copia o arquivo do banco de dados
-            shutil.copy2(db_path, backup_path)
+            # Retenção diária/semanal/mensal e coleta dos chunks sem referência
+            limpar_backups_antigos(app)
             
-            # Remove backups antigos (mantém apenas os últimos 30 dias)
-            limpar_backups_antigos(backup_folder, dias=30)
-            
-            print(f'[BACKUP] Backup automático realizado com sucesso: {backup_filename}')
+            print(f'[BACKUP] Backup automático ({manifesto["modo"]}) realizado com sucesso: {manifesto["nome"]}')
             return True
         except Exception as e:
             print(f'[BACKUP] Erro ao realizar backup automático: {str(e)}')
             return False
 
-def limpar_backups_antigos(backup_folder, dias=30):
-    """Remove backups mais antigos que X dias"""
+def limpar_backups_antigos(app):
+    """Aplica a retenção avô-pai-filho (BACKUP_KEEP_DAILY/WEEKLY/MONTHLY) e remove chunks sem referência"""
     try:
-        from datetime import datetime, timedelta
-        import glob
-        
-        # Data limite
-        data_limite = datetime.now() - timedelta(days=dias)
-        
-        # Lista todos os arquivos de backup
-        arquivos_backup = glob.glob(os.path.join(backup_folder, 'backup_*.db'))
-        
-        for arquivo in arquivos_backup:
-            # Obtém a data de modificação do arquivo
-            data_arquivo = datetime.fromtimestamp(os.path.getmtime(arquivo))
-            
-            # Remove se for mais antigo que a data limite
-            if data_arquivo < data_limite:
-                os.remove(arquivo)
-                print(f'[BACKUP] Backup antigo removido: {os.path.basename(arquivo)}')
+        from app.backup_service import aplicar_retencao, coletar_lixo
+        
+        backup_folder = app.config['BACKUP_FOLDER']
+        removidos = aplicar_retencao(
+            backup_folder,
+            diarios=app.config['BACKUP_KEEP_DAILY'],
+            semanais=app.config['BACKUP_KEEP_WEEKLY'],
+            mensais=app.config['BACKUP_KEEP_MONTHLY']
+        )
+        chunks, liberados = coletar_lixo(backup_folder)
+        if removidos or chunks:
+            print(f'[BACKUP] {len(removidos)} snapshot(s) fora da retenção removido(s); '
+                  f'{chunks} chunk(s) coletado(s), {liberados / (1024 * 1024):.2f} MB liberados')
     except Exception as e:
         print(f'[BACKUP] Erro ao limpar backups antigos: {str(e)}')
 
@@ -461,35 +466,26 @@ def limpar_backups_antigos(backup_folder, dias=30):
 @login_required
 @admin_required
 def criar_backup_manual():
-    """Cria um backup manual do banco de dados"""
+    """Cria um backup manual do banco de dados ({"incremental": true} lê do banco só as alterações)"""
     try:
-        import shutil
         from datetime import datetime
+        from app.backup_service import criar_backup
         
-        # Caminho do banco de dados
-        db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'inventario.db')
-        
-        # Pasta de backups
-        backup_folder = current_app.config['BACKUP_FOLDER']
-        
-        # Nome do arquivo de backup com timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f'backup_manual_{timestamp}.db'
-        backup_path = os.path.join(backup_folder, backup_filename)
-        
-        # Copia o arquivo do banco de dados
-        shutil.copy2(db_path, backup_path)
-        
-        # Obtém tamanho do arquivo
-        tamanho = os.path.getsize(backup_path)
-        tamanho_mb = tamanho / (1024 * 1024)
+        data = request.get_json(silent=True) or {}
+        manifesto = criar_backup(
+            current_app.config['BACKUP_FOLDER'], origem='manual', incremental=bool(data.get('incremental'))
+        )
+        tamanho_mb = sum(info['bytes'] for info in manifesto['tabelas'].values()) / (1024 * 1024)
         
         return jsonify({
             'success': True,
             'message': 'Backup criado com sucesso!',
             'backup': {
-                'nome': backup_filename,
+                'nome': manifesto['nome'],
+                'modo': manifesto['modo'],
                 'tamanho': f'{tamanho_mb:.2f} MB',
+                'chunks_novos': sum(info['chunks_novos'] for info in manifesto['tabelas'].values()),
+                'linhas': {tabela: info['linhas'] for tabela, info in manifesto['tabelas'].items()},
                 'data': datetime.now().strftime('%d/%m/%Y %H:%M:%S')
             }
         })
@@ -504,34 +500,20 @@ def criar_backup_manual():
 @login_required
 @admin_required
 def listar_backups():
-    """Lista todos os backups disponíveis"""
+    """Lista todos os backups disponíveis, com tamanho lógico e físico (deduplicado)"""
     try:
-        import glob
-        from datetime import datetime
-        
-        backup_folder = current_app.config['BACKUP_FOLDER']
-        
-        # Lista todos os arquivos de backup
-        arquivos_backup = glob.glob(os.path.join(backup_folder, 'backup_*.db'))
-        
-        backups = []
-        for arquivo in sorted(arquivos_backup, reverse=True):
-            nome = os.path.basename(arquivo)
-            tamanho = os.path.getsize(arquivo)
-            tamanho_mb = tamanho / (1024 * 1024)
-            data_modificacao = datetime.fromtimestamp(os.path.getmtime(arquivo))
-            
-            backups.append({
-                'nome': nome,
-                'tamanho': f'{tamanho_mb:.2f} MB',
-                'data': data_modificacao.strftime('%d/%m/%Y %H:%M:%S'),
-                'timestamp': data_modificacao.timestamp(),
-                'tipo': 'Manual' if 'manual' in nome else 'Automático'
-            })
-        
+        from app.backup_service import listar_backups as listar
+        
+        resultado = listar(current_app.config['BACKUP_FOLDER'])
+        if not resultado['backups'] and current_app.config.get('WORKER_ENABLED'):
+            # O backup diário roda no worker: sem pasta compartilhada, os backups ficam no disco dele
+            resultado['aviso'] = ('Nenhum backup nesta pasta. O backup diário é gravado pelo worker: '
+                                  'BACKUP_FOLDER precisa ser compartilhada entre web e worker.')
+            current_app.logger.warning(f'Nenhum backup em {current_app.config["BACKUP_FOLDER"]} com WORKER_ENABLED=true; '
+                                       'verifique se BACKUP_FOLDER é compartilhada com o worker')
         return jsonify({
             'success': True,
-            'backups': backups
+            **resultado
         })
         
     except Exception as e:
@@ -544,10 +526,31 @@ def listar_backups():
 @login_required
 @admin_required
 def baixar_backup(nome):
-    """Baixa um arquivo de backup"""
+    """
+    Baixa um backup (snapshot montado como .tar em streaming, ou arquivo legado).
+    Aceita Range/If-Range para retomar downloads interrompidos.
+    """
     try:
+        from app.backup_service import etag_snapshot, gravar_digest_tar, ler_digest_tar, segmentos_tar
+        from app.download_service import Conteudo, conteudo_arquivo, enviar
+        from werkzeug.security import safe_join
+        
         backup_folder = current_app.config['BACKUP_FOLDER']
-        return send_from_directory(backup_folder, nome, as_attachment=True)
+        segmentos = segmentos_tar(backup_folder, nome)
+        if segmentos is None:
+            caminho = safe_join(backup_folder, nome)
+            if not caminho or not os.path.isfile(caminho):
+                return jsonify({'success': False, 'message': 'Backup não encontrado'}), 404
+            # Cópias SQLite comprimem bem
+            return enviar(conteudo_arquivo(caminho, comprimivel=True))
+        
+        # Os chunks já são gzip: o .tar não é recomprimido
+        return enviar(Conteudo(
+            segmentos, f'{os.path.basename(nome)}.tar', etag_snapshot(backup_folder, nome),
+            mimetype='application/x-tar',
+            digest=ler_digest_tar(backup_folder, nome),
+            ao_concluir=lambda digest: gravar_digest_tar(backup_folder, nome, digest)
+        ))
     except Exception as e:
         return jsonify({
             'success': False,
@@ -558,30 +561,156 @@ def baixar_backup(nome):
 @login_required
 @admin_required
 def deletar_backup(nome):
-    """Deleta um arquivo de backup"""
+    """Deleta um backup (os chunks sem outra referência são removidos na próxima coleta)"""
     try:
+        from app.backup_service import PADRAO_LEGADO, remover_snapshot
+        import fnmatch
+        
         backup_folder = current_app.config['BACKUP_FOLDER']
+        nome = os.path.basename(nome)
         backup_path = os.path.join(backup_folder, nome)
         
-        # Verifica se o arquivo existe
-        if not os.path.exists(backup_path):
+        if not remover_snapshot(backup_folder, nome):
+            # Verifica se o arquivo legado existe
+            if not fnmatch.fnmatch(nome, PADRAO_LEGADO) or not os.path.exists(backup_path):
+                return jsonify({
+                    'success': False,
+                    'message': 'Backup não encontrado.'
+                }), 404
+            
+            # Remove o arquivo
+            os.remove(backup_path)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Backup deletado com sucesso!'
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao deletar backup: {str(e)}'
+        }), 400
+
+@main.route('/admin/backup/restaurar/<nome>', methods=['POST'])
+@login_required
+@admin_required
+def restaurar_backup(nome):
+    """Inicia a restauração de um backup em segundo plano"""
+    try:
+        from app.restauracao_service import em_andamento, obter_snapshot, restaurar_em_segundo_plano
+        
+        backup_folder = current_app.config['BACKUP_FOLDER']
+        nome = os.path.basename(nome)
+        data = request.get_json(silent=True) or {}
+        
+        if em_andamento(backup_folder, nome):
+            return jsonify({
+                'success': False,
+                'message': 'Restauração deste backup já está em andamento.'
+            }), 409
+        
+        # Valida o snapshot antes de responder (os checksums são conferidos na execução)
+        manifesto = obter_snapshot(backup_folder, nome)
+        restaurar_em_segundo_plano(
+            current_app._get_current_object(), nome,
+            tabelas=data.get('tabelas'),
+            remover_extras=data.get('remover_extras', True),
+            tamanho_lote=current_app.config['BACKUP_RESTORE_BATCH_SIZE'],
+            workers=current_app.config['BACKUP_RESTORE_WORKERS']
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': 'Restauração iniciada.',
+            'linhas': {tabela: info['linhas'] for tabela, info in manifesto['tabelas'].items()},
+            'status_url': f'/admin/backup/restaurar/{nome}/status'
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao restaurar backup: {str(e)}'
+        }), 400
+
+@main.route('/admin/backup/restaurar/<nome>/status')
+@login_required
+@admin_required
+def status_restauracao_backup(nome):
+    """Andamento da restauração (checkpoint): etapas concluídas e linhas gravadas por tabela"""
+    try:
+        from app.restauracao_service import ler_checkpoint
+        
+        estado = ler_checkpoint(current_app.config['BACKUP_FOLDER'], os.path.basename(nome))
+        if not estado:
             return jsonify({
                 'success': False,
-                'message': 'Backup não encontrado.'
+                'message': 'Nenhuma restauração encontrada para este backup.'
             }), 404
         
-        # Remove o arquivo
-        os.remove(backup_path)
+        return jsonify({
+            'success': True,
+            'restauracao': estado
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao consultar restauração: {str(e)}'
+        }), 400
+
+@main.route('/admin/fotos/armazenamento')
+@login_required
+@admin_required
+def uso_armazenamento_fotos():
+    """Uso do armazenamento de fotos por tipo de equipamento e órfãs pendentes (sem alterar nada)"""
+    try:
+        from app.coleta_fotos import executar_coleta
+
+        return jsonify({'success': True, **executar_coleta(current_app._get_current_object(), simular=True)})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao calcular o uso do armazenamento: {str(e)}'
+        }), 400
+
+@main.route('/admin/fotos/coletar', methods=['POST'])
+@login_required
+@admin_required
+def coletar_fotos_orfas():
+    """Executa a coleta de fotos órfãs agora (body opcional: {"modo": "quarentena" | "remover"})"""
+    try:
+        from app.coleta_fotos import executar_coleta
+
+        data = request.get_json(silent=True) or {}
+        resultado = executar_coleta(current_app._get_current_object(), modo=data.get('modo'))
+        return jsonify({'success': True, **resultado})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao coletar fotos órfãs: {str(e)}'
+        }), 400
+
+@main.route('/admin/agendador/execucoes')
+@login_required
+@admin_required
+def listar_execucoes_agendador():
+    """Histórico das tarefas agendadas: quem executou cada janela, duração, status e erro"""
+    try:
+        from app.agendador import listar_execucoes, DONO
         
+        limite = min(request.args.get('limite', 50, type=int), 500)
+        execucoes = listar_execucoes(request.args.get('job_id'), limite)
         return jsonify({
             'success': True,
-            'message': 'Backup deletado com sucesso!'
+            'processo_atual': DONO,
+            'execucoes': execucoes
         })
         
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Erro ao deletar backup: {str(e)}'
+            'message': f'Erro ao listar execuções: {str(e)}'
         }), 400
 
 # ==================== ROTAS PRINCIPAIS ====================
@@ -616,6 +745,7 @@ def service_worker():
 
 @main.route('/dashboard-data')
 @login_required
+@conditional_get('equipamentos', 'emprestimos', 'manutencoes')
 def dashboard_data():
     """Retorna dados para o dashboard"""
     try:
@@ -737,6 +867,7 @@ def dashboard_data():
         })
     except Exception as e:
         current_app.logger.error(f'Erro no dashboard_data: {str(e)}', exc_info=True)
+        nao_cachear()
         return jsonify({
             'total_equipamentos': 0,
             'equipamentos_estoque': 0,
@@ -758,15 +889,55 @@ def dashboard_data():
 
 @main.route('/equipamentos')
 @login_required
+@conditional_get('equipamentos')
 def listar_equipamentos():
-    """Lista todos os equipamentos"""
+    """Lista todos os equipamentos (aceita ?fields=nome,tipo,... para reduzir o payload)"""
     try:
-        equipamentos = Equipamento.get_all()
-        return jsonify([eq.to_dict() for eq in equipamentos])
+        campos = parse_campos(request.args.get('fields'))
+        equipamentos = Equipamento.get_all(campos)
+        return jsonify([eq.to_dict(campos) for eq in equipamentos])
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f'Erro ao listar equipamentos: {str(e)}', exc_info=True)
+        nao_cachear()
         return jsonify([])  # Retorna array vazio em caso de erro
 
+@main.route('/equipamentos/busca')
+@login_required
+def buscar_equipamentos():
+    """
+    Busca equipamentos no servidor, ordenada por relevância e paginada.
+    Query params: q (obrigatório), pagina, por_pagina (máx. 100), serie=true (apenas prefixo do
+    número de série), status, tipo
+    """
+    termo = (request.args.get('q') or '').strip()
+    if not termo:
+        return jsonify({'success': False, 'message': 'Informe o termo de busca (q)'}), 400
+
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = min(max(request.args.get('por_pagina', 20, type=int), 1), 100)
+    try:
+        resultados, total = Equipamento.buscar(
+            termo,
+            limite=por_pagina,
+            offset=(pagina - 1) * por_pagina,
+            somente_serie=request.args.get('serie', 'false').lower() == 'true',
+            status=request.args.get('status') or None,
+            tipo=request.args.get('tipo') or None
+        )
+    except Exception as e:
+        current_app.logger.error(f'Erro na busca de equipamentos: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro na busca: {str(e)}'}), 500
+
+    return jsonify({
+        'success': True,
+        'resultados': resultados,
+        'total': total,
+        'pagina': pagina,
+        'por_pagina': por_pagina
+    })
+
 @main.route('/equipamento/<int:id>')
 @login_required
 def obter_equipamento(id):
@@ -774,30 +945,87 @@ def obter_equipamento(id):
     equipamento = Equipamento.get_by_id(id)
     if not equipamento:
         return jsonify({'success': False, 'message': 'Equipamento não encontrado'}), 404
-    return jsonify(equipamento.to_dict())
-
-def _allowed_image(filename: str):
-    if not filename or '.' not in filename:
-        return False
-    ext = filename.rsplit('.', 1)[1].lower()
-    return ext in {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-
-
-def _save_equip_photo(file_storage):
-    """Salva a foto enviada e retorna a URL pública (em /static/uploads/equipamentos)."""
-    if not file_storage or file_storage.filename == '':
-        return None
-    if not _allowed_image(file_storage.filename):
-        raise ValueError('Formato de imagem não permitido. Use PNG, JPG, JPEG, GIF ou WEBP.')
-    filename = secure_filename(file_storage.filename)
-    # Garante um nome único
-    unique_name = f"{uuid.uuid4().hex}_{filename}"
-    upload_dir = current_app.config.get('UPLOAD_FOLDER_EQUIPAMENTOS')
-    os.makedirs(upload_dir, exist_ok=True)
-    full_path = os.path.join(upload_dir, unique_name)
-    file_storage.save(full_path)
-    # URL estática
-    return f"/static/uploads/equipamentos/{unique_name}"
+    foto = EquipamentoFoto.principal_de(id)
+    return jsonify({**equipamento.to_dict(), 'foto_url': foto.to_dict()['url'] if foto else None})
+
+def _foto_do_request(data):
+    """
+    Chave da foto enviada: `foto_chave` de um upload direto já concluído (ver /uploads/equipamentos/assinar)
+    ou arquivo `foto` no formulário multipart, gravado pelo servidor no backend de armazenamento.
+    """
+    from app.foto_storage import ErroArmazenamento, chave_valida, obter_armazenamento, salvar_arquivo
+
+    chave = data.get('foto_chave')
+    if chave:
+        if not chave_valida(chave) or not obter_armazenamento().existe(chave):
+            raise ErroArmazenamento('Foto enviada não encontrada no armazenamento')
+        return chave
+    if 'foto' in request.files:
+        return salvar_arquivo(request.files.get('foto'))
+    return None
+
+
+@main.route('/uploads/equipamentos/assinar', methods=['POST'])
+@login_required
+def assinar_upload_foto():
+    """
+    Autoriza o envio de uma foto direto do navegador para o armazenamento.
+    Body: {"nome": "foto.jpg", "tipo": "image/jpeg", "tamanho": 12345}; o cliente envia o arquivo
+    com `upload.metodo` para `upload.url` e depois informa `foto_chave` ao salvar o equipamento.
+    """
+    try:
+        from app.foto_storage import iniciar_upload
+
+        data = request.get_json(silent=True) or {}
+        upload = iniciar_upload(data.get('nome'), data.get('tipo'), int(data.get('tamanho') or 0))
+        return jsonify({'success': True, **upload})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao autorizar upload: {str(e)}'
+        }), 400
+
+
+@main.route('/uploads/equipamentos/<chave>', methods=['PUT'])
+@login_required
+def receber_upload_foto(chave):
+    """Destino do upload assinado no armazenamento local (o corpo é gravado em streaming)"""
+    try:
+        from app.foto_storage import obter_armazenamento
+
+        armazenamento = obter_armazenamento()
+        if armazenamento.tipo != 'local':
+            return jsonify({'success': False, 'message': 'Envie a foto para a URL assinada do armazenamento'}), 404
+        dados = armazenamento.validar_token(chave, request.args.get('token', ''),
+                                            current_app.config['PHOTO_UPLOAD_EXPIRES'])
+        if request.mimetype != dados['tipo']:
+            return jsonify({'success': False, 'message': f'Content-Type deve ser {dados["tipo"]}'}), 400
+        total = armazenamento.salvar(chave, request.stream, dados['tamanho'])
+        return jsonify({'success': True, 'chave': chave, 'tamanho': total}), 201
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao receber foto: {str(e)}'
+        }), 400
+
+
+@main.route('/uploads/equipamentos/<nome>')
+@login_required
+def baixar_foto_equipamento(nome):
+    """Foto original com ETag/Digest pelo conteúdo e suporte a Range (?download=1 para anexo)"""
+    from app.download_service import conteudo_arquivo, enviar
+    from app.foto_storage import chave_valida, obter_armazenamento
+
+    armazenamento = obter_armazenamento()
+    if not chave_valida(nome):
+        return jsonify({'success': False, 'message': 'Foto não encontrada'}), 404
+    if armazenamento.tipo != 'local':
+        return redirect(armazenamento.url(nome))
+    caminho = armazenamento.caminho(nome)
+    if not os.path.isfile(caminho):
+        return jsonify({'success': False, 'message': 'Foto não encontrada'}), 404
+    # Imagens já são comprimidas: sem gzip
+    return enviar(conteudo_arquivo(caminho), como_anexo=request.args.get('download') == '1')
 
 
 @main.route('/equipamento/adicionar', methods=['POST'])
@@ -818,8 +1046,7 @@ def adicionar_equipamento():
         current_app.logger.info(f'Dados recebidos: {list(data.keys())}')
         
         # Validação de campos obrigatórios
-        campos_obrigatorios = ['nome', 'tipo', 'marca', 'modelo', 'numero_serie', 'status']
-        campos_faltando = [c for c in campos_obrigatorios if not data.get(c)]
+        campos_faltando = [c for c in Equipamento.CAMPOS_OBRIGATORIOS if not data.get(c)]
         if campos_faltando:
             msg = f'Campos obrigatórios faltando: {", ".join(campos_faltando)}'
             current_app.logger.warning(msg)
@@ -857,16 +1084,13 @@ def adicionar_equipamento():
         current_app.logger.info(f'✅ Equipamento criado com ID: {equipamento.id}')
 
         # Foto (opcional)
-        if is_multipart and 'foto' in request.files:
-            foto_file = request.files.get('foto')
-            if foto_file and foto_file.filename:
-                try:
-                    url = _save_equip_photo(foto_file)
-                    if url:
-                        EquipamentoFoto.create(equipamento_id=equipamento.id, url=url, principal=True)
-                        current_app.logger.info(f'✅ Foto salva: {url}')
-                except Exception as foto_err:
-                    current_app.logger.warning(f'⚠️ Erro ao salvar foto: {foto_err}')
+        try:
+            chave = _foto_do_request(data)
+            if chave:
+                EquipamentoFoto.create(equipamento_id=equipamento.id, url=chave, principal=True)
+                current_app.logger.info(f'✅ Foto salva: {chave}')
+        except Exception as foto_err:
+            current_app.logger.warning(f'⚠️ Erro ao salvar foto: {foto_err}')
         
         return jsonify({
             'success': True,
@@ -931,12 +1155,9 @@ def editar_equipamento(id):
         equipamento.update(**update_data)
 
         # Substituição de foto (opcional)
-        if is_multipart and 'foto' in request.files:
-            foto_file = request.files.get('foto')
-            if foto_file and foto_file.filename:
-                url = _save_equip_photo(foto_file)
-                if url:
-                    EquipamentoFoto.create(equipamento_id=equipamento.id, url=url, principal=True)
+        chave = _foto_do_request(data)
+        if chave:
+            EquipamentoFoto.create(equipamento_id=equipamento.id, url=chave, principal=True).remover_anteriores()
         
         return jsonify({
             'success': True,
@@ -972,6 +1193,67 @@ def deletar_equipamento(id):
         }), 400
 
 
+@main.route('/equipamentos/importar', methods=['POST'])
+@login_required
+@admin_required
+def importar_equipamentos():
+    """
+    Importa equipamentos em lote a partir de um CSV ou XLSX (campo 'arquivo').
+    Query params opcionais: lote (linhas por insert), atualizar=true (upsert por numero_serie).
+    """
+    from app.import_service import ler_planilha, importar_equipamentos as importar
+
+    arquivo = request.files.get('arquivo')
+    if not arquivo or not arquivo.filename:
+        return jsonify({'success': False, 'message': 'Envie a planilha no campo "arquivo"'}), 400
+
+    tamanho_lote = request.args.get('lote', type=int) or current_app.config.get('IMPORT_BATCH_SIZE', 500)
+    atualizar = request.args.get('atualizar', 'false').lower() == 'true'
+
+    try:
+        linhas = ler_planilha(arquivo.stream, arquivo.filename)
+        relatorio = importar(linhas, tamanho_lote=tamanho_lote, atualizar_existentes=atualizar)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'❌ Erro na importação de equipamentos: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao importar equipamentos: {str(e)}'}), 500
+
+    current_app.logger.info(
+        f'Importação de {arquivo.filename}: {relatorio["inseridos"]} inseridos, '
+        f'{relatorio["atualizados"]} atualizados, {relatorio["total_erros"]} erros'
+    )
+    return jsonify({'success': relatorio['total_erros'] == 0, **relatorio})
+
+
+@main.route('/equipamentos/status-lote', methods=['POST'])
+@login_required
+def atualizar_status_equipamentos_lote():
+    """
+    Altera o status de vários equipamentos (Estoque, Manutenção ou Inativo).
+    Body JSON: {"status": "...", "ids": [...]} e/ou {"numeros_serie": [...]}
+    """
+    from app.lote_service import atualizar_status_equipamentos
+
+    data = request.get_json(silent=True) or {}
+    try:
+        resultado = atualizar_status_equipamentos(
+            data.get('status'), ids=data.get('ids'), numeros_serie=data.get('numeros_serie')
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Erro ao atualizar status em lote: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao atualizar status: {str(e)}'}), 500
+
+    return jsonify({
+        'success': not resultado['erros'],
+        'message': f'{len(resultado["equipamentos"])} equipamento(s) atualizado(s)',
+        'equipamentos': [eq.to_dict(['numero_serie', 'status']) for eq in resultado['equipamentos']],
+        'erros': resultado['erros']
+    })
+
+
 @main.route('/equipamento/<int:id>/qrcode')
 @login_required
 def gerar_qrcode(id):
@@ -1202,22 +1484,37 @@ def listar_equipamentos_estoque():
     equipamentos.sort(key=lambda e: e.nome or '')
     return jsonify([eq.to_dict() for eq in equipamentos])
 
+def _campos_com(campos, *necessarios):
+    """Acrescenta à projeção os campos que o servidor precisa para filtrar/ordenar"""
+    if not campos:
+        return campos
+    return campos + [c for c in necessarios if c not in campos]
+
 @main.route('/emprestimos')
 @login_required
+@conditional_get('emprestimos', 'equipamentos')
 def listar_emprestimos():
-    """Lista todos os empréstimos"""
-    emprestimos = Emprestimo.get_all()
+    """Lista todos os empréstimos (aceita ?fields=responsavel,equipamento.nome,...)"""
+    try:
+        campos = parse_campos(request.args.get('fields'))
+        emprestimos = Emprestimo.get_all(_campos_com(campos, 'data_emprestimo'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     emprestimos.sort(key=lambda e: e.data_emprestimo or '', reverse=True)
-    return jsonify([emp.to_dict() for emp in emprestimos])
+    return jsonify([emp.to_dict(campos) for emp in emprestimos])
 
 @main.route('/emprestimos-ativos')
 @login_required
+@conditional_get('emprestimos', 'equipamentos')
 def listar_emprestimos_ativos():
-    """Lista apenas empréstimos ativos"""
-    emprestimos = Emprestimo.get_all()
-    emprestimos = [emp for emp in emprestimos if emp.status == 'Ativo']
+    """Lista apenas empréstimos ativos (aceita ?fields=responsavel,equipamento.nome,...)"""
+    try:
+        campos = parse_campos(request.args.get('fields'))
+        emprestimos = Emprestimo.get_all(_campos_com(campos, 'data_emprestimo'), status='Ativo')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     emprestimos.sort(key=lambda e: e.data_emprestimo or '', reverse=True)
-    return jsonify([emp.to_dict() for emp in emprestimos])
+    return jsonify([emp.to_dict(campos) for emp in emprestimos])
 
 @main.route('/emprestimo/<int:id>')
 @login_required
@@ -1273,6 +1570,7 @@ def adicionar_emprestimo():
         
         # Atualiza o status do equipamento para Emprestado
         Equipamento.update(data['equipamento_id'], {'status': 'Emprestado'})
+        invalidar_cache_relatorios()
         
         # Envia e-mail de confirmação
         from app.email_service import enviar_email_confirmacao_emprestimo
@@ -1321,6 +1619,8 @@ def devolver_emprestimo(id):
         if equipamento:
             Equipamento.update(emprestimo.equipamento_id, {'status': 'Estoque'})
         
+        invalidar_cache_relatorios()
+        
         # Recarregar empréstimo para retornar dados atualizados
         emprestimo_atualizado = Emprestimo.get_by_id(id)
         
@@ -1345,6 +1645,73 @@ def devolver_emprestimo(id):
             'message': f'Erro ao registrar devolução: {str(e)}'
         }), 400
 
+@main.route('/emprestimos/devolver-lote', methods=['POST'])
+@login_required
+def devolver_emprestimos_lote():
+    """
+    Registra a devolução de vários empréstimos de uma vez.
+    Body JSON: {"ids": [1, 2, ...]} e/ou {"numeros_serie": ["SN1", ...]} (equipamentos escaneados)
+    """
+    from app.lote_service import devolver_emprestimos
+    from app.notification_queue import enfileirar_por_destinatario
+    from app.email_service import enviar_email_confirmacao_devolucao
+
+    data = request.get_json(silent=True) or {}
+    try:
+        resultado = devolver_emprestimos(ids=data.get('ids'), numeros_serie=data.get('numeros_serie'))
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Erro ao registrar devoluções em lote: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao registrar devoluções: {str(e)}'}), 500
+
+    devolvidos = resultado['emprestimos']
+    if devolvidos:
+        invalidar_cache_relatorios()
+        enfileirar_por_destinatario(current_app._get_current_object(), enviar_email_confirmacao_devolucao, devolvidos)
+
+    return jsonify({
+        'success': not resultado['erros'],
+        'message': f'{len(devolvidos)} devolução(ões) registrada(s)',
+        'devolvidos': [e.to_dict(['equipamento_id', 'responsavel', 'status', 'data_devolucao_real', 'equipamento_nome'])
+                       for e in devolvidos],
+        'erros': resultado['erros']
+    })
+
+@main.route('/emprestimos/emprestar-lote', methods=['POST'])
+@login_required
+def emprestar_equipamentos_lote():
+    """
+    Registra o empréstimo de vários equipamentos para o mesmo responsável.
+    Body JSON: responsavel, departamento, email_responsavel, telefone_responsavel,
+    data_devolucao_prevista, observacoes e {"ids": [...]} e/ou {"numeros_serie": [...]}
+    """
+    from app.lote_service import emprestar_equipamentos
+    from app.notification_queue import enfileirar_por_destinatario
+    from app.email_service import enviar_email_confirmacao_emprestimo
+
+    data = request.get_json(silent=True) or {}
+    try:
+        resultado = emprestar_equipamentos(data, ids=data.get('ids'), numeros_serie=data.get('numeros_serie'))
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Erro ao registrar empréstimos em lote: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao registrar empréstimos: {str(e)}'}), 500
+
+    criados = resultado['emprestimos']
+    if criados:
+        invalidar_cache_relatorios()
+        enfileirar_por_destinatario(current_app._get_current_object(), enviar_email_confirmacao_emprestimo, criados)
+
+    return jsonify({
+        'success': not resultado['erros'],
+        'message': f'{len(criados)} empréstimo(s) registrado(s)',
+        'emprestimos': [e.to_dict(['equipamento_id', 'responsavel', 'departamento', 'data_emprestimo',
+                                   'data_devolucao_prevista', 'status', 'equipamento_nome']) for e in criados],
+        'erros': resultado['erros']
+    }), 201 if criados else 200
+
 @main.route('/emprestimo/deletar/<int:id>', methods=['DELETE'])
 @login_required
 def deletar_emprestimo(id):
@@ -1361,6 +1728,7 @@ def deletar_emprestimo(id):
                 equipamento.update(status='Estoque')
         
         emprestimo.delete()
+        invalidar_cache_relatorios()
         
         return jsonify({
             'success': True,
@@ -1431,110 +1799,24 @@ def relatorios():
 @main.route('/relatorios/emprestimos')
 @login_required
 def relatorios_emprestimos():
-    """Retorna dados de empréstimos para relatórios"""
-    try:
-        filtro = request.args.get('filtro', 'todos')  # todos, ativos, historico, atrasados
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
-        departamento = request.args.get('departamento')
-        
-        # Buscar todos os empréstimos
-        emprestimos = Emprestimo.get_all()
-        
-        # Aplicar filtros
-        if filtro == 'ativos':
-            emprestimos = [e for e in emprestimos if e.status == 'Ativo']
-        elif filtro == 'historico':
-            emprestimos = [e for e in emprestimos if e.status == 'Devolvido']
-        elif filtro == 'atrasados':
-            hoje = datetime.utcnow().date()
-            emprestimos = [
-                e for e in emprestimos
-                if e.status == 'Ativo' and e.data_devolucao_prevista and str(e.data_devolucao_prevista) < str(hoje)
-            ]
-        
-        # Filtro por período
-        if data_inicio:
-            try:
-                data_inicio_dt = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-                emprestimos = [e for e in emprestimos if e.data_emprestimo and str(e.data_emprestimo) >= str(data_inicio_dt)]
-            except:
-                pass
-        
-        if data_fim:
-            try:
-                data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d').date()
-                emprestimos = [e for e in emprestimos if e.data_emprestimo and str(e.data_emprestimo) <= str(data_fim_dt)]
-            except:
-                pass
-        
-        # Filtro por departamento
-        if departamento and departamento != 'todos':
-            emprestimos = [e for e in emprestimos if e.departamento == departamento]
-        
-        # Ordenar por data de empréstimo (mais recentes primeiro)
-        emprestimos.sort(key=lambda e: e.data_emprestimo or '', reverse=True)
-        
-        # Calcular estatísticas
-        hoje = datetime.utcnow().date()
-        total_emprestimos = len(emprestimos)
-        ativos = sum(1 for e in emprestimos if e.status == 'Ativo')
-        devolvidos = sum(1 for e in emprestimos if e.status == 'Devolvido')
-        atrasados = sum(1 for e in emprestimos if e.status == 'Ativo' and e.data_devolucao_prevista and str(e.data_devolucao_prevista) < str(hoje))
-        
-        # Calcular duração média dos empréstimos devolvidos
-        duracoes = []
-        for e in emprestimos:
-            if e.status == 'Devolvido' and e.data_devolucao_real and e.data_emprestimo:
-                try:
-                    if isinstance(e.data_devolucao_real, str):
-                        data_dev_real = datetime.strptime(e.data_devolucao_real, '%Y-%m-%d').date()
-                    else:
-                        data_dev_real = e.data_devolucao_real
-                    
-                    if isinstance(e.data_emprestimo, str):
-                        data_emp = datetime.strptime(e.data_emprestimo, '%Y-%m-%d').date()
-                    else:
-                        data_emp = e.data_emprestimo
-                    
-                    duracao = (data_dev_real - data_emp).days
-                    duracoes.append(duracao)
-                except:
-                    pass
-        
-        duracao_media = sum(duracoes) / len(duracoes) if duracoes else 0
-        
-        # Empréstimos por departamento
-        emprestimos_por_dept = {}
-        for e in emprestimos:
-            dept = e.departamento or 'Não informado'
-            emprestimos_por_dept[dept] = emprestimos_por_dept.get(dept, 0) + 1
-        
-        # Equipamentos mais emprestados
-        equipamentos_count = {}
-        for e in emprestimos:
-            if e.equipamento_id:
-                # Buscar nome do equipamento
-                equip = Equipamento.get_by_id(e.equipamento_id)
-                if equip and equip.nome:
-                    nome = equip.nome
-                    equipamentos_count[nome] = equipamentos_count.get(nome, 0) + 1
-        
-        # Top 10 equipamentos
-        top_equipamentos = sorted(equipamentos_count.items(), key=lambda x: x[1], reverse=True)[:10]
-        
+    """Retorna dados de empréstimos para relatórios (aceita ?fields= para a lista de empréstimos)"""
+    from app.relatorio_service import filtros_da_requisicao, gerar_relatorio
+
+    try:
+        campos = parse_campos(request.args.get('fields'))
+        # Valida os campos antes de gerar o relatório
+        Emprestimo.select_clause(campos)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    try:
+        relatorio = gerar_relatorio(filtros_da_requisicao(request.args), _campos_com(campos, 'data_emprestimo'))
         return jsonify({
             'success': True,
-            'emprestimos': [e.to_dict() for e in emprestimos],
-            'estatisticas': {
-                'total': total_emprestimos,
-                'ativos': ativos,
-                'devolvidos': devolvidos,
-                'atrasados': atrasados,
-                'duracao_media': round(duracao_media, 1)
-            },
-            'emprestimos_por_departamento': emprestimos_por_dept,
-            'top_equipamentos': [{'nome': nome, 'quantidade': qtd} for nome, qtd in top_equipamentos]
+            'emprestimos': [e.to_dict(campos) for e in relatorio['emprestimos']],
+            'estatisticas': relatorio['estatisticas'],
+            'emprestimos_por_departamento': relatorio['emprestimos_por_departamento'],
+            'top_equipamentos': relatorio['top_equipamentos']
         })
         
     except Exception as e:
@@ -1546,23 +1828,13 @@ def relatorios_emprestimos():
 
 @main.route('/relatorios/departamentos')
 @login_required
+@conditional_get('emprestimos')
 def listar_departamentos():
     """Lista todos os departamentos únicos dos empréstimos"""
     try:
-        emprestimos = Emprestimo.get_all()
-        
-        # Extrair departamentos únicos e válidos
-        departamentos = set()
-        for e in emprestimos:
-            if e.departamento and e.departamento.strip():
-                departamentos.add(e.departamento)
-        
-        # Ordenar alfabeticamente
-        departamentos = sorted(list(departamentos))
-        
         return jsonify({
             'success': True,
-            'departamentos': departamentos
+            'departamentos': Departamento.listar()
         })
     except Exception as e:
         current_app.logger.error(f'Erro ao listar departamentos: {str(e)}', exc_info=True)
@@ -1571,19 +1843,33 @@ def listar_departamentos():
             'message': f'Erro ao listar departamentos: {str(e)}'
         }), 400
 
+@main.route('/departamentos/autocomplete')
+@login_required
+@conditional_get('emprestimos')
+def autocompletar_departamentos():
+    """Sugestões de departamento por prefixo, ordenadas pelo número de empréstimos (query params: q, limite)"""
+    limite = min(max(request.args.get('limite', 10, type=int), 1), 50)
+    try:
+        return jsonify({
+            'success': True,
+            'departamentos': Departamento.autocompletar(request.args.get('q', ''), limite)
+        })
+    except Exception as e:
+        current_app.logger.error(f'Erro no autocomplete de departamentos: {str(e)}', exc_info=True)
+        nao_cachear()
+        return jsonify({'success': False, 'departamentos': []})
+
 @main.route('/relatorios/exportar-pdf')
 @login_required
 def exportar_relatorio_pdf():
     """Exporta relatório de empréstimos em PDF"""
     try:
-        # Importações pesadas movidas para dentro da função (melhor para serverless)
+        from app.relatorio_service import filtros_da_requisicao, gerar_relatorio
+
+        # Importações pesadas ficam em relatorio_artefatos.gerar_pdf (melhor para serverless)
         try:
-            from reportlab.lib import colors
-            from reportlab.lib.pagesizes import A4, landscape
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.lib.units import cm
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-            from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+            from app.relatorio_artefatos import gerar_pdf
+            import reportlab  # noqa: F401
         except Exception as _imp_err:
             return jsonify({
                 'success': False,
@@ -1591,252 +1877,21 @@ def exportar_relatorio_pdf():
                 'detalhe': str(_imp_err)
             }), 501
 
-        filtro = request.args.get('filtro', 'todos')
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
-        departamento = request.args.get('departamento')
-        
-        # Buscar todos os empréstimos
-        emprestimos = Emprestimo.get_all()
-        
-        # Aplicar filtros
-        if filtro == 'ativos':
-            emprestimos = [e for e in emprestimos if e.status == 'Ativo']
-        elif filtro == 'historico':
-            emprestimos = [e for e in emprestimos if e.status == 'Devolvido']
-        elif filtro == 'atrasados':
-            hoje = datetime.utcnow().date()
-            emprestimos = [
-                e for e in emprestimos
-                if e.status == 'Ativo' and e.data_devolucao_prevista and str(e.data_devolucao_prevista) < str(hoje)
-            ]
-        
-        if data_inicio:
-            try:
-                data_inicio_dt = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-                emprestimos = [e for e in emprestimos if e.data_emprestimo and str(e.data_emprestimo) >= str(data_inicio_dt)]
-            except:
-                pass
-        
-        if data_fim:
-            try:
-                data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d').date()
-                emprestimos = [e for e in emprestimos if e.data_emprestimo and str(e.data_emprestimo) <= str(data_fim_dt)]
-            except:
-                pass
-        
-        if departamento and departamento != 'todos':
-            emprestimos = [e for e in emprestimos if e.departamento == departamento]
+        filtros = filtros_da_requisicao(request.args)
         
-        emprestimos.sort(key=lambda e: e.data_emprestimo or '', reverse=True)
-        
-        # Calcular estatísticas
-        hoje = datetime.utcnow().date()
-        total = len(emprestimos)
-        ativos = sum(1 for e in emprestimos if e.status == 'Ativo')
-        devolvidos = sum(1 for e in emprestimos if e.status == 'Devolvido')
-        atrasados = sum(1 for e in emprestimos if e.status == 'Ativo' and e.data_devolucao_prevista and str(e.data_devolucao_prevista) < str(hoje))
-        
-        # Criar PDF
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=landscape(A4),
-            rightMargin=1*cm,
-            leftMargin=1*cm,
-            topMargin=2*cm,
-            bottomMargin=2*cm
-        )
-        
-        # Estilos
-        styles = getSampleStyleSheet()
-        titulo_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1e40af'),
-            spaceAfter=10,
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold'
-        )
-        
-        subtitulo_style = ParagraphStyle(
-            'CustomSubtitle',
-            parent=styles['Normal'],
-            fontSize=11,
-            textColor=colors.grey,
-            spaceAfter=20,
-            alignment=TA_CENTER
-        )
-        
-        # Elementos do PDF
-        elements = []
-        
-        # Título
-        titulo = Paragraph("📊 Relatório de Empréstimos de Equipamentos", titulo_style)
-        elements.append(titulo)
-        
-        # Data de geração
-        data_geracao = datetime.now().strftime('%d/%m/%Y às %H:%M')
-        subtitulo = Paragraph(f"Gerado em {data_geracao} por {current_user.nome}", subtitulo_style)
-        elements.append(subtitulo)
-        
-        # Filtros aplicados
-        filtros_texto = f"<b>Filtros:</b> Tipo: {filtro.capitalize()}"
-        if departamento and departamento != 'todos':
-            filtros_texto += f" | Departamento: {departamento}"
-        if data_inicio:
-            filtros_texto += f" | Início: {datetime.strptime(data_inicio, '%Y-%m-%d').strftime('%d/%m/%Y')}"
-        if data_fim:
-            filtros_texto += f" | Fim: {datetime.strptime(data_fim, '%Y-%m-%d').strftime('%d/%m/%Y')}"
-        
-        filtros_p = Paragraph(filtros_texto, styles['Normal'])
-        elements.append(filtros_p)
-        elements.append(Spacer(1, 0.5*cm))
-        
-        # Estatísticas
-        stats_data = [
-            ['Total', 'Ativos', 'Devolvidos', 'Atrasados'],
-            [str(total), str(ativos), str(devolvidos), str(atrasados)]
-        ]
-        
-        stats_table = Table(stats_data, colWidths=[5*cm, 5*cm, 5*cm, 5*cm])
-        stats_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('FONTSIZE', (0, 1), (-1, -1), 11),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey)
-        ]))
-        
-        elements.append(stats_table)
-        elements.append(Spacer(1, 0.8*cm))
-        
-        # Tabela de empréstimos
-        if emprestimos:
-            # Cabeçalho
-            table_data = [['Equipamento', 'Responsável', 'Depto', 'Data Emp.', 'Prev. Dev.', 'Status', 'Dias']]
-            
-            # Dados
-            for e in emprestimos:
-                try:
-                    equip = Equipamento.get_by_id(e.equipamento_id) if e.equipamento_id else None
-                    equipamento_nome = equip.nome if equip else 'N/A'
-                except:
-                    equipamento_nome = 'N/A'
-                
-                # Parse dates
-                try:
-                    if isinstance(e.data_emprestimo, str):
-                        data_emp_obj = datetime.strptime(e.data_emprestimo, '%Y-%m-%d').date()
-                    else:
-                        data_emp_obj = e.data_emprestimo
-                    data_emp = data_emp_obj.strftime('%d/%m/%Y')
-                except:
-                    data_emp = 'N/A'
-                
-                # Prev dev
-                try:
-                    if e.data_devolucao_prevista:
-                        if isinstance(e.data_devolucao_prevista, str):
-                            prev_dev = datetime.strptime(e.data_devolucao_prevista, '%Y-%m-%d').strftime('%d/%m/%Y')
-                        else:
-                            prev_dev = e.data_devolucao_prevista.strftime('%d/%m/%Y')
-                    else:
-                        prev_dev = '-'
-                except:
-                    prev_dev = '-'
-                
-                # Status
-                is_atrasado = e.status == 'Ativo' and e.data_devolucao_prevista and str(e.data_devolucao_prevista) < str(hoje)
-                status_text = 'Atrasado' if is_atrasado else e.status
-                
-                # Dias
-                try:
-                    if isinstance(e.data_emprestimo, str):
-                        data_emp_date = datetime.strptime(e.data_emprestimo, '%Y-%m-%d').date()
-                    else:
-                        data_emp_date = e.data_emprestimo
-                    
-                    if e.status == 'Ativo':
-                        dias = (datetime.utcnow().date() - data_emp_date).days
-                    elif e.data_devolucao_real:
-                        if isinstance(e.data_devolucao_real, str):
-                            data_dev_date = datetime.strptime(e.data_devolucao_real, '%Y-%m-%d').date()
-                        else:
-                            data_dev_date = e.data_devolucao_real
-                        dias = (data_dev_date - data_emp_date).days
-                    else:
-                        dias = '-'
-                except:
-                    dias = '-'
-                
-                table_data.append([
-                    equipamento_nome[:25],
-                    (e.responsavel or 'N/A')[:20],
-                    (e.departamento or '-')[:15],
-                    data_emp,
-                    prev_dev,
-                    status_text,
-                    str(dias)
-                ])
-            
-            # Criar tabela
-            emprestimos_table = Table(table_data, colWidths=[5.5*cm, 4*cm, 3*cm, 2.5*cm, 2.5*cm, 2.5*cm, 1.5*cm])
-            
-            # Estilo da tabela
-            table_style = [
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('ALIGN', (3, 0), (6, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('TOPPADDING', (0, 1), (-1, -1), 4),
-                ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
-            ]
-            
-            # Destacar linhas atrasadas
-            for i, e in enumerate(emprestimos, 1):
-                is_atrasado = e.status == 'Ativo' and e.data_devolucao_prevista and str(e.data_devolucao_prevista) < str(hoje)
-                if is_atrasado:
-                    table_style.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#fee2e2')))
-            
-            emprestimos_table.setStyle(TableStyle(table_style))
-            elements.append(emprestimos_table)
-        else:
-            elements.append(Paragraph("Nenhum empréstimo encontrado com os filtros aplicados.", styles['Normal']))
-        
-        # Rodapé
-        elements.append(Spacer(1, 1*cm))
-        rodape = Paragraph(
-            f"<i>Sistema de Inventário de Equipamentos TI - {current_user.nome}</i>",
-            ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey, alignment=TA_CENTER)
-        )
-        elements.append(rodape)
-        
-        # Gerar PDF
-        doc.build(elements)
+        # Mesmo relatório (e mesmo cache) de /relatorios/emprestimos
+        relatorio = gerar_relatorio(filtros)
+        pdf = gerar_pdf(relatorio, current_user.nome)
         
         # Preparar resposta
-        buffer.seek(0)
-        response = make_response(buffer.getvalue())
+        response = make_response(pdf)
         response.headers['Content-Type'] = 'application/pdf'
         
         # Nome do arquivo
         data_arquivo = datetime.now().strftime('%Y%m%d_%H%M%S')
-        nome_arquivo = f'relatorio_emprestimos_{filtro}_{data_arquivo}.pdf'
+        nome_arquivo = f'relatorio_emprestimos_{filtros["filtro"]}_{data_arquivo}.pdf'
         response.headers['Content-Disposition'] = f'attachment; filename={nome_arquivo}'
         
-        buffer.close()
         return response
         
     except Exception as e:
@@ -1846,6 +1901,249 @@ def exportar_relatorio_pdf():
             'message': f'Erro ao gerar PDF: {str(e)}'
         }), 400
 
+@main.route('/relatorios/exportar-xlsx')
+@login_required
+def exportar_relatorio_xlsx():
+    """
+    Exporta o relatório em XLSX (mesmos filtros de /relatorios/emprestimos): abas de resumo,
+    empréstimos, manutenções e ROI por equipamento, escritas em memória constante
+    """
+    try:
+        from app.planilha_service import disponivel, gerar_arquivo_temporario, transmitir_e_remover
+        from app.relatorio_service import filtros_da_requisicao
+        from app.relatorio_artefatos import MIMETYPES
+
+        if not disponivel():
+            return jsonify({
+                'success': False,
+                'message': 'Exportação XLSX indisponível neste deploy (instale openpyxl).'
+            }), 501
+
+        filtros = filtros_da_requisicao(request.args)
+        caminho = gerar_arquivo_temporario(filtros)
+
+        data_arquivo = datetime.now().strftime('%Y%m%d_%H%M%S')
+        nome_arquivo = f'relatorio_emprestimos_{filtros["filtro"]}_{data_arquivo}.xlsx'
+        response = Response(transmitir_e_remover(caminho), mimetype=MIMETYPES['xlsx'])
+        response.headers['Content-Disposition'] = f'attachment; filename={nome_arquivo}'
+        response.headers['Content-Length'] = str(os.path.getsize(caminho))
+        return response
+        
+    except Exception as e:
+        current_app.logger.error(f'Erro ao gerar XLSX: {str(e)}', exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao gerar XLSX: {str(e)}'
+        }), 400
+
+# ====== JOBS DE RELATÓRIO (GERAÇÃO EM SEGUNDO PLANO) ======
+
+@main.route('/relatorios/jobs', methods=['POST'])
+@login_required
+def criar_job_relatorio():
+    """
+    Agenda a geração do relatório de empréstimos (formato: pdf, csv ou xlsx) com os mesmos
+    filtros de /relatorios/emprestimos. Parâmetros iguais reaproveitam o job/artefato existente.
+    """
+    try:
+        from app.relatorio_service import filtros_da_requisicao
+        from app.relatorio_jobs import submeter_job
+
+        dados = request.get_json(silent=True) or request.form or request.args
+        formato = (dados.get('formato') or 'pdf').lower()
+        filtros = filtros_da_requisicao(dados)
+
+        job, reaproveitado = submeter_job(
+            current_app._get_current_object(), formato, filtros,
+            usuario_id=current_user.id, gerado_por=current_user.nome
+        )
+        return jsonify({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'reaproveitado': reaproveitado,
+            'url_status': url_for('main.status_job_relatorio', job_id=job['id'])
+        }), 200 if reaproveitado else 202
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Erro ao criar job de relatório: {str(e)}', exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao criar job de relatório: {str(e)}'
+        }), 400
+
+@main.route('/relatorios/jobs/<job_id>')
+@login_required
+def status_job_relatorio(job_id):
+    """Andamento de um job de relatório (Pendente, Processando, Concluído ou Erro)"""
+    try:
+        from app.relatorio_jobs import obter_job, pertence_ao_usuario, status_job, CONCLUIDO
+
+        job = obter_job(job_id)
+        if not job or not pertence_ao_usuario(job, current_user):
+            return jsonify({'success': False, 'message': 'Job não encontrado'}), 404
+
+        resposta = {'success': True, 'job': status_job(job)}
+        if job['status'] == CONCLUIDO:
+            resposta['url_download'] = url_for('main.baixar_job_relatorio', job_id=job_id)
+        nao_cachear()
+        return jsonify(resposta)
+    except Exception as e:
+        current_app.logger.error(f'Erro ao consultar job de relatório: {str(e)}', exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao consultar job de relatório: {str(e)}'
+        }), 400
+
+@main.route('/relatorios/jobs/<job_id>/download')
+@login_required
+def baixar_job_relatorio(job_id):
+    """Baixa o artefato de um job concluído"""
+    try:
+        from app.relatorio_jobs import obter_job, caminho_artefato, nome_download, pertence_ao_usuario, CONCLUIDO
+        from app.relatorio_artefatos import MIMETYPES
+
+        job = obter_job(job_id)
+        if not job or not pertence_ao_usuario(job, current_user):
+            return jsonify({'success': False, 'message': 'Job não encontrado'}), 404
+        if job['status'] != CONCLUIDO:
+            return jsonify({'success': False, 'message': f'Relatório ainda não disponível (status: {job["status"]})'}), 409
+
+        pasta = current_app.config['RELATORIOS_FOLDER']
+        caminho = caminho_artefato(pasta, job)
+        if not caminho or not os.path.exists(caminho):
+            return jsonify({'success': False, 'message': 'Relatório expirado ou indisponível; gere novamente'}), 410
+
+        return send_from_directory(
+            pasta, job['arquivo'], as_attachment=True,
+            download_name=nome_download(job), mimetype=MIMETYPES[job['formato']]
+        )
+    except Exception as e:
+        current_app.logger.error(f'Erro ao baixar relatório: {str(e)}', exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao baixar relatório: {str(e)}'
+        }), 400
+
+# ====== EXPORTAÇÃO EM STREAMING (CSV / NDJSON) ======
+
+@main.route('/export/<recurso>.<formato>')
+@login_required
+def exportar_streaming(recurso, formato):
+    """
+    Exporta equipamentos, empréstimos ou manutenções em CSV/NDJSON sem carregar tudo em memória.
+    Aceita os mesmos filtros de /relatorios/emprestimos (filtro, data_inicio, data_fim, departamento).
+    """
+    from app.export_service import GERADORES, FORMATOS, COLUNAS
+    
+    if recurso not in GERADORES or formato not in FORMATOS:
+        return jsonify({'success': False, 'message': 'Exportação não suportada.'}), 404
+    
+    filtros = {
+        'filtro': request.args.get('filtro', 'todos'),
+        'data_inicio': request.args.get('data_inicio'),
+        'data_fim': request.args.get('data_fim'),
+        'departamento': request.args.get('departamento'),
+    }
+    
+    gerar, mimetype = FORMATOS[formato]
+    linhas = GERADORES[recurso](filtros)
+    corpo = stream_with_context(gerar(linhas, COLUNAS[recurso]))
+    
+    nome_arquivo = f"{recurso}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    response = Response(corpo, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={nome_arquivo}'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ====== AUDITORIA DE INVENTÁRIO FÍSICO ======
+
+def _ler_numeros_serie_da_requisicao():
+    """
+    Lê as leituras do corpo: JSON {"numeros_serie": [...]} ou texto puro com um número de série
+    por linha (lido em streaming, para sessões com dezenas de milhares de leituras)
+    """
+    if request.mimetype == 'application/json':
+        data = request.get_json(silent=True) or {}
+        return [str(n) for n in data.get('numeros_serie') or []]
+    return (linha.decode('utf-8', 'ignore') for linha in request.stream)
+
+@main.route('/auditorias', methods=['GET', 'POST'])
+@login_required
+def auditorias():
+    """Lista as auditorias (GET) ou abre uma nova sessão (POST: nome, departamento, tipo)"""
+    from app.auditoria_service import criar_auditoria, listar_auditorias
+
+    try:
+        if request.method == 'GET':
+            return jsonify(listar_auditorias())
+
+        data = request.get_json(silent=True) or {}
+        auditoria = criar_auditoria(
+            data.get('nome'),
+            departamento=data.get('departamento'),
+            tipo=data.get('tipo'),
+            usuario_id=current_user.id
+        )
+        return jsonify({'success': True, 'auditoria': auditoria}), 201
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Erro em auditorias: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao processar auditoria: {str(e)}'}), 500
+
+@main.route('/auditorias/<int:id>/leituras', methods=['POST'])
+@login_required
+def registrar_leituras_auditoria(id):
+    """Registra números de série lidos na sessão de auditoria (repetições são ignoradas)"""
+    from app.auditoria_service import obter_auditoria, registrar_leituras, contar_leituras
+
+    try:
+        auditoria = obter_auditoria(id)
+        if not auditoria:
+            return jsonify({'success': False, 'message': 'Auditoria não encontrada'}), 404
+        if auditoria['status'] != 'Aberta':
+            return jsonify({'success': False, 'message': 'Auditoria já finalizada'}), 400
+
+        recebidos = registrar_leituras(id, _ler_numeros_serie_da_requisicao())
+        return jsonify({'success': True, 'recebidos': recebidos, 'total_lidos': contar_leituras(id)})
+    except Exception as e:
+        current_app.logger.error(f'Erro ao registrar leituras da auditoria {id}: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao registrar leituras: {str(e)}'}), 500
+
+@main.route('/auditorias/<int:id>/reconciliacao')
+@login_required
+def reconciliar_auditoria(id):
+    """Relatório de faltantes, inesperados e status divergentes da auditoria"""
+    from app.auditoria_service import obter_auditoria, reconciliar
+
+    try:
+        auditoria = obter_auditoria(id)
+        if not auditoria:
+            return jsonify({'success': False, 'message': 'Auditoria não encontrada'}), 404
+        return jsonify({'success': True, 'auditoria': auditoria, **reconciliar(auditoria)})
+    except Exception as e:
+        current_app.logger.error(f'Erro ao reconciliar auditoria {id}: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao reconciliar auditoria: {str(e)}'}), 500
+
+@main.route('/auditorias/<int:id>/finalizar', methods=['POST'])
+@login_required
+def finalizar_auditoria(id):
+    """Reconcilia, grava o resumo e encerra a sessão de auditoria"""
+    from app.auditoria_service import obter_auditoria, finalizar_auditoria as finalizar
+
+    try:
+        auditoria = obter_auditoria(id)
+        if not auditoria:
+            return jsonify({'success': False, 'message': 'Auditoria não encontrada'}), 404
+        if auditoria['status'] != 'Aberta':
+            return jsonify({'success': False, 'message': 'Auditoria já finalizada'}), 400
+        return jsonify({'success': True, **finalizar(auditoria)})
+    except Exception as e:
+        current_app.logger.error(f'Erro ao finalizar auditoria {id}: {str(e)}', exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao finalizar auditoria: {str(e)}'}), 500
+
 # ====== ROTAS DO DASHBOARD EXECUTIVO ======
 
 @main.route('/dashboard-executivo')
@@ -1859,288 +2157,195 @@ def dashboard_executivo():
 def dashboard_executivo_dados():
     """Retorna dados consolidados para o dashboard executivo"""
     try:
-        from datetime import date, timedelta
-        from dateutil.relativedelta import relativedelta
-        
-        hoje = date.today()
+        from datetime import date
+        from app.cache import cache_paineis
         
-        # ========== MÉTRICAS DE INVENTÁRIO ==========
-        
-        # Total de equipamentos e valor total
-        equipamentos = Equipamento.get_all()
-        total_equipamentos = len(equipamentos)
-        valor_total_inventario = sum([eq.get('valor') or 0 for eq in [e.to_dict() for e in equipamentos]])
-        valor_medio_equipamento = valor_total_inventario / total_equipamentos if total_equipamentos > 0 else 0
+        # Requisições simultâneas compartilham um único cálculo; depois, cache curto com revalidação em segundo plano
+        dados = cache_paineis.obter(
+            f'dashboard-executivo:{date.today().isoformat()}',
+            calculo_com_contexto(calcular_dashboard_executivo)
+        )
+        return jsonify(dados)
         
-        # Equipamentos por departamento (baseado no empréstimo ativo ou último empréstimo)
-        equipamentos_por_dept = {}
-        valor_por_dept = {}
-        emprestimos_all = Emprestimo.get_all()
+    except Exception as e:
+        current_app.logger.error(f'Erro ao gerar dados do dashboard executivo: {str(e)}', exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao gerar dados: {str(e)}'
+        }), 400
+
+def calculo_com_contexto(funcao):
+    """Envolve `funcao` para rodar com o contexto da aplicação (também em threads de revalidação)"""
+    app = current_app._get_current_object()
+    
+    def calcular():
+        with app.app_context():
+            return funcao()
+    return calcular
+
+def calcular_dashboard_executivo():
+    """Dados consolidados do dashboard executivo (sem cache)"""
+    from datetime import date, timedelta
+    from app.financeiro_service import ranking_roi
+    from app.rollup_service import serie_mensal
+    
+    hoje = date.today()
+    
+    # ========== MÉTRICAS DE INVENTÁRIO ==========
+    
+    # Total de equipamentos e valor total
+    equipamentos = Equipamento.get_all()
+    total_equipamentos = len(equipamentos)
+    valor_total_inventario = sum([eq.get('valor') or 0 for eq in [e.to_dict() for e in equipamentos]])
+    valor_medio_equipamento = valor_total_inventario / total_equipamentos if total_equipamentos > 0 else 0
+    
+    # Equipamentos por departamento (baseado no empréstimo ativo ou último empréstimo)
+    equipamentos_por_dept = {}
+    valor_por_dept = {}
+    emprestimos_all = Emprestimo.get_all()
+    
+    for eq in equipamentos:
+        eq_dict = eq.to_dict()
+        # Busca o departamento do empréstimo ativo ou do último empréstimo
+        dept = None
+        emprestimos_eq = [e for e in emprestimos_all if e.equipamento_id == eq_dict['id']]
         
-        for eq in equipamentos:
-            eq_dict = eq.to_dict()
-            # Busca o departamento do empréstimo ativo ou do último empréstimo
-            dept = None
-            emprestimos_eq = [e for e in emprestimos_all if e.equipamento_id == eq_dict['id']]
-            
-            emprestimo_ativo = next((e for e in emprestimos_eq if e.status == 'Ativo'), None)
-            if emprestimo_ativo:
-                dept = emprestimo_ativo.departamento
+        emprestimo_ativo = next((e for e in emprestimos_eq if e.status == 'Ativo'), None)
+        if emprestimo_ativo:
+            dept = emprestimo_ativo.departamento
+        else:
+            # Se não tem empréstimo ativo, busca o último empréstimo
+            if emprestimos_eq:
+                emprestimos_eq.sort(key=lambda e: e.data_emprestimo or '', reverse=True)
+                dept = emprestimos_eq[0].departamento
             else:
-                # Se não tem empréstimo ativo, busca o último empréstimo
-                if emprestimos_eq:
-                    emprestimos_eq.sort(key=lambda e: e.data_emprestimo or '', reverse=True)
-                    dept = emprestimos_eq[0].departamento
-                else:
-                    # Fallback: usa o departamento_atual do equipamento
-                    dept = eq_dict.get('departamento_atual')
-            
-            dept = dept or 'Não Atribuído'
-            equipamentos_por_dept[dept] = equipamentos_por_dept.get(dept, 0) + 1
-            valor_por_dept[dept] = valor_por_dept.get(dept, 0) + (eq_dict.get('valor') or 0)
-        
-        # Custo total de manutenções
-        manutencoes = Manutencao.get_all()
-        custo_total_manutencoes = sum([m.custo or 0 for m in manutencoes])
-        manutencoes_pendentes = sum([1 for m in manutencoes if m.status == 'Agendada'])
-        
-        # Manutenções por equipamento (identificar equipamentos problemáticos)
-        manutencoes_por_equipamento = {}
-        custo_manutencao_por_equipamento = {}
-        for m in manutencoes:
-            eq_id = m.equipamento_id
-            manutencoes_por_equipamento[eq_id] = manutencoes_por_equipamento.get(eq_id, 0) + 1
-            custo_manutencao_por_equipamento[eq_id] = custo_manutencao_por_equipamento.get(eq_id, 0) + (m.custo or 0)
-        
-        # Top 5 equipamentos com mais manutenções
-        top_manutencoes = sorted(manutencoes_por_equipamento.items(), key=lambda x: x[1], reverse=True)[:5]
-        equipamentos_problematicos = []
-        for eq_id, qtd in top_manutencoes:
-            eq = Equipamento.get_by_id(eq_id)
-            if eq:
-                eq_dict = eq.to_dict()
-                equipamentos_problematicos.append({
-                    'nome': eq_dict.get('nome'),
-                    'tipo': eq_dict.get('tipo'),
-                    'marca': eq_dict.get('marca'),
-                    'modelo': eq_dict.get('modelo'),
-                    'quantidade_manutencoes': qtd,
-                    'custo_total': custo_manutencao_por_equipamento.get(eq_id, 0)
-                })
-        
-        # ========== MÉTRICAS DE UTILIZAÇÃO ==========
-        
-        # Empréstimos
-        emprestimos_ativos = [e for e in emprestimos_all if e.status == 'Ativo']
-        emprestimos_devolvidos = [e for e in emprestimos_all if e.status == 'Devolvido']
-        
-        # Taxa de utilização
-        equipamentos_em_uso = len(emprestimos_ativos)
-        taxa_utilizacao = (equipamentos_em_uso / total_equipamentos * 100) if total_equipamentos > 0 else 0
-        
-        # Empréstimos por departamento
-        emprestimos_por_dept = {}
-        tempo_medio_emprestimo_dept = {}
-        
-        for e in emprestimos_devolvidos:
-            dept = e.departamento or 'Não informado'
-            if dept not in emprestimos_por_dept:
-                emprestimos_por_dept[dept] = []
-            
-            # Calcular duração
-            if e.data_devolucao_real and e.data_emprestimo:
-                try:
-                    if isinstance(e.data_devolucao_real, str):
-                        data_dev = datetime.strptime(e.data_devolucao_real, '%Y-%m-%d').date()
-                    else:
-                        data_dev = e.data_devolucao_real
-                    
-                    if isinstance(e.data_emprestimo, str):
-                        data_emp = datetime.strptime(e.data_emprestimo, '%Y-%m-%d').date()
-                    else:
-                        data_emp = e.data_emprestimo
-                    
-                    duracao = (data_dev - data_emp).days
-                    emprestimos_por_dept[dept].append(duracao)
-                except:
-                    pass
+                # Fallback: usa o departamento_atual do equipamento
+                dept = eq_dict.get('departamento_atual')
         
-        # Calcular tempo médio por departamento
-        for dept, duracoes in emprestimos_por_dept.items():
-            tempo_medio_emprestimo_dept[dept] = sum(duracoes) / len(duracoes) if duracoes else 0
-        
-        # ========== CÁLCULO DE ROI E DEPRECIAÇÃO ==========
-        
-        # ROI (Return on Investment) = (Valor gerado - Custo) / Custo
-        # Vamos considerar que cada dia de uso gera valor proporcional
-        
-        roi_por_equipamento = []
-        equipamentos_com_valor = [eq for eq in equipamentos if eq.valor and eq.valor > 0]
-        
-        for eq in equipamentos_com_valor:
+        dept = dept or 'Não Atribuído'
+        equipamentos_por_dept[dept] = equipamentos_por_dept.get(dept, 0) + 1
+        valor_por_dept[dept] = valor_por_dept.get(dept, 0) + (eq_dict.get('valor') or 0)
+    
+    # Custo total de manutenções
+    manutencoes = Manutencao.get_all()
+    custo_total_manutencoes = sum([m.custo or 0 for m in manutencoes])
+    manutencoes_pendentes = sum([1 for m in manutencoes if m.status == 'Agendada'])
+    
+    # Manutenções por equipamento (identificar equipamentos problemáticos)
+    manutencoes_por_equipamento = {}
+    custo_manutencao_por_equipamento = {}
+    for m in manutencoes:
+        eq_id = m.equipamento_id
+        manutencoes_por_equipamento[eq_id] = manutencoes_por_equipamento.get(eq_id, 0) + 1
+        custo_manutencao_por_equipamento[eq_id] = custo_manutencao_por_equipamento.get(eq_id, 0) + (m.custo or 0)
+    
+    # Top 5 equipamentos com mais manutenções
+    top_manutencoes = sorted(manutencoes_por_equipamento.items(), key=lambda x: x[1], reverse=True)[:5]
+    equipamentos_problematicos = []
+    for eq_id, qtd in top_manutencoes:
+        eq = Equipamento.get_by_id(eq_id)
+        if eq:
             eq_dict = eq.to_dict()
-            # Contar dias de empréstimo
-            emprestimos_eq = [e for e in emprestimos_all if e.equipamento_id == eq_dict['id'] and e.status == 'Devolvido']
-            dias_uso = 0
-            for emp in emprestimos_eq:
-                try:
-                    if isinstance(emp.data_devolucao_real, str):
-                        data_dev = datetime.strptime(emp.data_devolucao_real, '%Y-%m-%d').date()
-                    else:
-                        data_dev = emp.data_devolucao_real
-                    
-                    if isinstance(emp.data_emprestimo, str):
-                        data_emp = datetime.strptime(emp.data_emprestimo, '%Y-%m-%d').date()
-                    else:
-                        data_emp = emp.data_emprestimo
-                    
-                    dias_uso += max((data_dev - data_emp).days, 0)
-                except:
-                    pass
-            
-            # Custo de manutenção deste equipamento
-            custo_manutencao = custo_manutencao_por_equipamento.get(eq_dict['id'], 0)
-            
-            # Valor depreciado (método linear)
-            vida_util_anos = eq_dict.get('vida_util_anos') or 5
-            data_aquisicao = eq_dict.get('data_aquisicao')
-            if data_aquisicao:
-                try:
-                    if isinstance(data_aquisicao, str):
-                        data_aquisicao_obj = datetime.strptime(data_aquisicao, '%Y-%m-%d').date()
-                    else:
-                        data_aquisicao_obj = data_aquisicao
-                    
-                    idade_anos = (hoje - data_aquisicao_obj).days / 365.25
-                    taxa_depreciacao = min(idade_anos / vida_util_anos, 1.0)  # Máximo 100%
-                    valor_residual = eq_dict.get('valor') * (1 - taxa_depreciacao)
-                except:
-                    valor_residual = eq_dict.get('valor')
-                    idade_anos = 0
-            else:
-                valor_residual = eq_dict.get('valor')
-                idade_anos = 0
-            
-            # Cálculo simplificado de ROI
-            # Considerando que cada dia de uso vale 0.3% do valor do equipamento
-            valor_gerado = (eq_dict.get('valor') * 0.003) * dias_uso
-            custo_total = eq_dict.get('valor') + custo_manutencao
-            roi_percentual = ((valor_gerado - custo_total) / custo_total * 100) if custo_total > 0 else 0
-            
-            roi_por_equipamento.append({
+            equipamentos_problematicos.append({
                 'nome': eq_dict.get('nome'),
                 'tipo': eq_dict.get('tipo'),
                 'marca': eq_dict.get('marca'),
                 'modelo': eq_dict.get('modelo'),
-                'valor_aquisicao': eq_dict.get('valor'),
-                'valor_residual': round(valor_residual, 2),
-                'dias_uso': dias_uso,
-                'custo_manutencao': custo_manutencao,
-                'roi_percentual': round(roi_percentual, 2),
-                'idade_anos': round(idade_anos, 1)
+                'quantidade_manutencoes': qtd,
+                'custo_total': custo_manutencao_por_equipamento.get(eq_id, 0)
             })
+    
+    # ========== MÉTRICAS DE UTILIZAÇÃO ==========
+    
+    # Empréstimos
+    emprestimos_ativos = [e for e in emprestimos_all if e.status == 'Ativo']
+    emprestimos_devolvidos = [e for e in emprestimos_all if e.status == 'Devolvido']
+    
+    # Taxa de utilização
+    equipamentos_em_uso = len(emprestimos_ativos)
+    taxa_utilizacao = (equipamentos_em_uso / total_equipamentos * 100) if total_equipamentos > 0 else 0
+    
+    # Empréstimos por departamento
+    emprestimos_por_dept = {}
+    tempo_medio_emprestimo_dept = {}
+    
+    for e in emprestimos_devolvidos:
+        dept = e.departamento or 'Não informado'
+        if dept not in emprestimos_por_dept:
+            emprestimos_por_dept[dept] = []
         
-        # Ordenar por ROI
-        roi_por_equipamento.sort(key=lambda x: x['roi_percentual'], reverse=True)
-        top_roi = roi_por_equipamento[:10]
-        bottom_roi = roi_por_equipamento[-10:] if len(roi_por_equipamento) > 10 else []
-        
-        # ========== ANÁLISE TEMPORAL ==========
-        
-        # Empréstimos por mês (últimos 12 meses)
-        emprestimos_por_mes = {}
-        for i in range(12):
-            mes = hoje - relativedelta(months=i)
-            mes_key = mes.strftime('%Y-%m')
-            emprestimos_por_mes[mes_key] = 0
-        
-        for e in emprestimos_all:
+        # Calcular duração
+        if e.data_devolucao_real and e.data_emprestimo:
             try:
+                if isinstance(e.data_devolucao_real, str):
+                    data_dev = datetime.strptime(e.data_devolucao_real, '%Y-%m-%d').date()
+                else:
+                    data_dev = e.data_devolucao_real
+                
                 if isinstance(e.data_emprestimo, str):
-                    data_emp_obj = datetime.strptime(e.data_emprestimo, '%Y-%m-%d').date()
+                    data_emp = datetime.strptime(e.data_emprestimo, '%Y-%m-%d').date()
                 else:
-                    data_emp_obj = e.data_emprestimo
+                    data_emp = e.data_emprestimo
                 
-                mes_key = data_emp_obj.strftime('%Y-%m')
-                if mes_key in emprestimos_por_mes:
-                    emprestimos_por_mes[mes_key] += 1
+                duracao = (data_dev - data_emp).days
+                emprestimos_por_dept[dept].append(duracao)
             except:
                 pass
-        
-        # Ordenar por data
-        emprestimos_por_mes_ordenado = dict(sorted(emprestimos_por_mes.items()))
-        
-        # Custos de manutenção por mês
-        custos_por_mes = {}
-        for i in range(12):
-            mes = hoje - relativedelta(months=i)
-            mes_key = mes.strftime('%Y-%m')
-            custos_por_mes[mes_key] = 0
-        
-        for m in manutencoes:
-            if m.data_inicio:
-                try:
-                    if isinstance(m.data_inicio, str):
-                        data_inicio_obj = datetime.strptime(m.data_inicio, '%Y-%m-%d').date()
-                    else:
-                        data_inicio_obj = m.data_inicio
-                    
-                    mes_key = data_inicio_obj.strftime('%Y-%m')
-                    if mes_key in custos_por_mes:
-                        custos_por_mes[mes_key] += (m.custo or 0)
-                except:
-                    pass
-        
-        custos_por_mes_ordenado = dict(sorted(custos_por_mes.items()))
-        
-        # ========== CONSOLIDAÇÃO DOS DADOS ==========
-        
-        return jsonify({
-            'success': True,
-            'inventario': {
-                'total_equipamentos': total_equipamentos,
-                'valor_total': round(valor_total_inventario, 2),
-                'valor_medio': round(valor_medio_equipamento, 2),
-                'equipamentos_por_departamento': [
-                    {'departamento': dept, 'quantidade': qtd, 'valor_total': round(valor_por_dept.get(dept, 0), 2)}
-                    for dept, qtd in sorted(equipamentos_por_dept.items(), key=lambda x: x[1], reverse=True)
-                ] if equipamentos_por_dept else []
-            },
-            'manutencoes': {
-                'custo_total': round(custo_total_manutencoes, 2),
-                'pendentes': manutencoes_pendentes,
-                'equipamentos_problematicos': equipamentos_problematicos,
-                'custos_por_mes': [
-                    {'mes': mes, 'custo': round(custo, 2)}
-                    for mes, custo in custos_por_mes_ordenado.items()
-                ]
-            },
-            'utilizacao': {
-                'emprestimos_ativos': len(emprestimos_ativos),
-                'taxa_utilizacao': round(taxa_utilizacao, 2),
-                'tempo_medio_por_departamento': [
-                    {'departamento': dept, 'tempo_medio_dias': round(tempo, 1)}
-                    for dept, tempo in sorted(tempo_medio_emprestimo_dept.items(), key=lambda x: x[1], reverse=True)
-                ],
-                'emprestimos_por_mes': [
-                    {'mes': mes, 'quantidade': qtd}
-                    for mes, qtd in emprestimos_por_mes_ordenado.items()
-                ]
-            },
-            'roi': {
-                'top_10': top_roi,
-                'bottom_10': bottom_roi,
-                'roi_medio': round(sum([r['roi_percentual'] for r in roi_por_equipamento]) / len(roi_por_equipamento), 2) if roi_por_equipamento else 0
-            },
-            'analise_uso': analisar_uso_equipamentos(equipamentos, emprestimos_all)
-        })
-        
-    except Exception as e:
-        current_app.logger.error(f'Erro ao gerar dados do dashboard executivo: {str(e)}', exc_info=True)
-        return jsonify({
-            'success': False,
-            'message': f'Erro ao gerar dados: {str(e)}'
-        }), 400
+    
+    # Calcular tempo médio por departamento
+    for dept, duracoes in emprestimos_por_dept.items():
+        tempo_medio_emprestimo_dept[dept] = sum(duracoes) / len(duracoes) if duracoes else 0
+    
+    # ========== CÁLCULO DE ROI E DEPRECIAÇÃO ==========
+    
+    # Indicadores por equipamento pré-calculados (metricas_equipamentos, recalculada diariamente);
+    # aqui só se lê o ranking com ORDER BY / LIMIT
+    roi = ranking_roi(10)
+    
+    # ========== ANÁLISE TEMPORAL ==========
+    
+    # Empréstimos e custos de manutenção por mês (últimos 12 meses), lidos do rollup mensal
+    serie_12_meses = serie_mensal(12, hoje)
+    emprestimos_por_mes_ordenado = {item['mes']: item['contagem'] for item in serie_12_meses}
+    custos_por_mes_ordenado = {item['mes']: item['custo'] for item in serie_12_meses}
+    
+    # ========== CONSOLIDAÇÃO DOS DADOS ==========
+    
+    return {
+        'success': True,
+        'inventario': {
+            'total_equipamentos': total_equipamentos,
+            'valor_total': round(valor_total_inventario, 2),
+            'valor_medio': round(valor_medio_equipamento, 2),
+            'equipamentos_por_departamento': [
+                {'departamento': dept, 'quantidade': qtd, 'valor_total': round(valor_por_dept.get(dept, 0), 2)}
+                for dept, qtd in sorted(equipamentos_por_dept.items(), key=lambda x: x[1], reverse=True)
+            ] if equipamentos_por_dept else []
+        },
+        'manutencoes': {
+            'custo_total': round(custo_total_manutencoes, 2),
+            'pendentes': manutencoes_pendentes,
+            'equipamentos_problematicos': equipamentos_problematicos,
+            'custos_por_mes': [
+                {'mes': mes, 'custo': round(custo, 2)}
+                for mes, custo in custos_por_mes_ordenado.items()
+            ]
+        },
+        'utilizacao': {
+            'emprestimos_ativos': len(emprestimos_ativos),
+            'taxa_utilizacao': round(taxa_utilizacao, 2),
+            'tempo_medio_por_departamento': [
+                {'departamento': dept, 'tempo_medio_dias': round(tempo, 1)}
+                for dept, tempo in sorted(tempo_medio_emprestimo_dept.items(), key=lambda x: x[1], reverse=True)
+            ],
+            'emprestimos_por_mes': [
+                {'mes': mes, 'quantidade': qtd}
+                for mes, qtd in emprestimos_por_mes_ordenado.items()
+            ]
+        },
+        'roi': roi,
+        'analise_uso': analisar_uso_equipamentos(equipamentos, emprestimos_all)
+    }
 
 def analisar_uso_equipamentos(equipamentos, emprestimos):
     """
@@ -2324,20 +2529,15 @@ def previsao_demanda_dados():
                 'message': 'Funcionalidade de IA indisponível neste deploy (dependências ausentes).',
                 'detalhe': _prediction_import_error
             }), 501
-        # Análise de demanda por tipo
-        resultado = prediction_service.analisar_demanda_por_tipo()
-        
-        # Análise de sazonalidade
-        sazonalidade = prediction_service.analisar_sazonalidade()
+        from datetime import date
+        from app.cache import cache_paineis
         
-        return jsonify({
-            'success': True,
-            'previsoes': resultado.get('previsoes', []),
-            'sazonalidade': sazonalidade if sazonalidade.get('sucesso') else None,
-            'horizonte_dias': resultado.get('horizonte_dias', 90),
-            'data_analise': resultado.get('data_analise'),
-            'mensagem': resultado.get('mensagem')
-        })
+        # Mesmo esquema do dashboard executivo: um cálculo por vez, cache curto com revalidação
+        dados = cache_paineis.obter(
+            f'previsao-demanda:{date.today().isoformat()}',
+            calculo_com_contexto(calcular_previsao_demanda)
+        )
+        return jsonify(dados)
         
     except Exception as e:
         print(f"Erro ao gerar previsão de demanda: {str(e)}")
@@ -2348,6 +2548,23 @@ def previsao_demanda_dados():
             'message': f'Erro ao gerar previsões: {str(e)}'
         }), 400
 
+def calcular_previsao_demanda():
+    """Previsões por tipo e sazonalidade (sem cache)"""
+    # Análise de demanda por tipo
+    resultado = prediction_service.analisar_demanda_por_tipo()
+    
+    # Análise de sazonalidade
+    sazonalidade = prediction_service.analisar_sazonalidade()
+    
+    return {
+        'success': True,
+        'previsoes': resultado.get('previsoes', []),
+        'sazonalidade': sazonalidade if sazonalidade.get('sucesso') else None,
+        'horizonte_dias': resultado.get('horizonte_dias', 90),
+        'data_analise': resultado.get('data_analise'),
+        'mensagem': resultado.get('mensagem')
+    }
+
 # ====== ROTAS DE E-MAIL ======
 
 @main.route('/admin/email-status', methods=['GET'])
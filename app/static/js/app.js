@@ -94,6 +94,12 @@ function configurarEventos() {
         if (btnCancelarManutencao) btnCancelarManutencao.onclick = () => fecharModalManutencao();
     }
 
+    // Autocomplete de departamento no formulário de empréstimo
+    const departamentoInput = document.getElementById('departamento');
+    if (departamentoInput) {
+        departamentoInput.oninput = (e) => sugerirDepartamentos(e.target.value);
+    }
+
     // Buscas
     searchInput.oninput = (e) => filtrarEquipamentos(e.target.value);
     if (searchEmprestimoInput) {
@@ -412,7 +418,7 @@ function criarGraficos(data) {
 // Equipamentos
 async function carregarEquipamentos() {
     try {
-        const response = await fetch('/equipamentos');
+        const response = await fetch('/equipamentos?fields=nome,tipo,marca,modelo,numero_serie,status');
         equipamentos = await response.json();
         renderizarEquipamentos(equipamentos);
     } catch (error) {
@@ -449,7 +455,59 @@ function renderizarEquipamentos(lista) {
     `).join('');
 }
 
+// Sugestões de departamento (mais usados primeiro)
+let sugestaoDepartamentoTimer = null;
+
+function sugerirDepartamentos(termo) {
+    clearTimeout(sugestaoDepartamentoTimer);
+    sugestaoDepartamentoTimer = setTimeout(async () => {
+        try {
+            const params = new URLSearchParams({ q: termo.trim(), limite: 10 });
+            const response = await fetch(`/departamentos/autocomplete?${params}`);
+            const data = await response.json();
+            const datalist = document.getElementById('departamentosSugeridos');
+            if (!datalist || !data.success) return;
+            datalist.innerHTML = '';
+            data.departamentos.forEach(dept => {
+                const option = document.createElement('option');
+                option.value = dept.nome;
+                datalist.appendChild(option);
+            });
+        } catch (error) {
+            console.error('Erro ao sugerir departamentos:', error);
+        }
+    }, 200);
+}
+
+// Busca no servidor (índice de texto completo); o filtro local fica como fallback
+let buscaEquipamentosTimer = null;
+let buscaEquipamentosSeq = 0;
+
 function filtrarEquipamentos(termo) {
+    clearTimeout(buscaEquipamentosTimer);
+    const termoLimpo = termo.trim();
+    if (termoLimpo.length < 2) {
+        filtrarEquipamentosLocal(termoLimpo);
+        return;
+    }
+
+    const seq = ++buscaEquipamentosSeq;
+    buscaEquipamentosTimer = setTimeout(async () => {
+        try {
+            const params = new URLSearchParams({ q: termoLimpo, por_pagina: 100 });
+            const response = await fetch(`/equipamentos/busca?${params}`);
+            const data = await response.json();
+            if (!response.ok || !data.success) throw new Error(data.message || 'Erro na busca');
+            // Ignora respostas de buscas anteriores que chegaram atrasadas
+            if (seq === buscaEquipamentosSeq) renderizarEquipamentos(data.resultados);
+        } catch (error) {
+            console.error('Erro na busca de equipamentos:', error);
+            if (seq === buscaEquipamentosSeq) filtrarEquipamentosLocal(termoLimpo);
+        }
+    }, 250);
+}
+
+function filtrarEquipamentosLocal(termo) {
     const termoLower = termo.toLowerCase();
     const filtrados = equipamentos.filter(eq => 
         eq.nome.toLowerCase().includes(termoLower) ||
@@ -656,13 +714,19 @@ async function salvarEquipamento() {
             fd.set('observacoes', obsExtra + (atual ? '\n\n' + atual : ''));
         }
     }
-    // Foto (se selecionada)
-    const fotoInput = document.getElementById('foto');
-    if (fotoInput && fotoInput.files && fotoInput.files[0]) {
-        fd.append('foto', fotoInput.files[0]);
-    }
 
     try {
+        // Foto (se selecionada): enviada direto para o armazenamento; o formulário leva só a chave
+        const fotoInput = document.getElementById('foto');
+        if (fotoInput && fotoInput.files && fotoInput.files[0]) {
+            const chave = await enviarFotoDireto(fotoInput.files[0]);
+            if (chave) {
+                fd.append('foto_chave', chave);
+            } else {
+                fd.append('foto', fotoInput.files[0]);
+            }
+        }
+
         const url = editandoId ? `/equipamento/editar/${editandoId}` : '/equipamento/adicionar';
         const method = editandoId ? 'PUT' : 'POST';
 
@@ -687,6 +751,27 @@ async function salvarEquipamento() {
     }
 }
 
+// Envia a foto para a URL assinada pelo servidor; retorna a chave ou null (usa o envio pelo formulário)
+async function enviarFotoDireto(arquivo) {
+    try {
+        const assinatura = await fetch('/uploads/equipamentos/assinar', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ nome: arquivo.name, tipo: arquivo.type, tamanho: arquivo.size })
+        }).then(r => r.json());
+        if (!assinatura.success) {
+            mostrarAlerta(assinatura.message, 'error');
+            return null;
+        }
+        const { url, metodo, headers } = assinatura.upload;
+        const envio = await fetch(url, { method: metodo, headers: headers, body: arquivo });
+        return envio.ok ? assinatura.chave : null;
+    } catch (error) {
+        console.error('Erro no upload direto da foto:', error);
+        return null;
+    }
+}
+
 async function editarEquipamento(id) {
     try {
         const response = await fetch(`/equipamento/${id}`);
@@ -747,7 +832,7 @@ function mostrarAlerta(mensagem, tipo) {
 
 async function carregarEmprestimos() {
     try {
-        const response = await fetch('/emprestimos-ativos');
+        const response = await fetch('/emprestimos-ativos?fields=responsavel,departamento,data_emprestimo,data_devolucao_prevista,equipamento.nome,equipamento.tipo,equipamento.numero_serie');
         emprestimos = await response.json();
         renderizarEmprestimos(emprestimos);
     } catch (error) {
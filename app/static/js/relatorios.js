@@ -45,7 +45,8 @@ async function aplicarFiltros() {
         
         // Monta a URL com os parâmetros
         const params = new URLSearchParams({
-            filtro: filtroTipo
+            filtro: filtroTipo,
+            fields: 'equipamento_nome,responsavel,departamento,email_responsavel,telefone_responsavel,data_emprestimo,data_devolucao_prevista,data_devolucao_real,status,observacoes'
         });
         
         if (filtroDepartamento && filtroDepartamento !== 'todos') {
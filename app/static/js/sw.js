@@ -1,4 +1,13 @@
-const CACHE_NAME = 'inventario-ti-v1';
+const CACHE_NAME = 'inventario-ti-v2';
+const API_CACHE_NAME = 'inventario-ti-api-v1';
+// Rotas JSON que respondem ETag / 304 (GET condicional)
+const REVALIDATED_API = [
+  '/equipamentos',
+  '/emprestimos',
+  '/emprestimos-ativos',
+  '/dashboard-data',
+  '/relatorios/departamentos'
+];
 const CORE_ASSETS = [
   '/',
   '/static/manifest.json',
@@ -18,7 +27,7 @@ self.addEventListener('install', event => {
 
 self.addEventListener('activate', event => {
   event.waitUntil(
-    caches.keys().then(keys => Promise.all(keys.map(k => k !== CACHE_NAME ? caches.delete(k) : null)))
+    caches.keys().then(keys => Promise.all(keys.map(k => (k !== CACHE_NAME && k !== API_CACHE_NAME) ? caches.delete(k) : null)))
       .then(() => self.clients.claim())
   );
 });
@@ -51,6 +60,12 @@ self.addEventListener('fetch', event => {
     return;
   }
 
+  // API JSON -> revalida com If-None-Match; 304 reaproveita a cópia local
+  if (req.method === 'GET' && REVALIDATED_API.includes(url.pathname)) {
+    event.respondWith(revalidateApi(req));
+    return;
+  }
+
   // Default: try network then cache
   event.respondWith(
     fetch(req).then(res => {
@@ -59,6 +74,29 @@ self.addEventListener('fetch', event => {
   );
 });
 
+async function revalidateApi(req) {
+  const cache = await caches.open(API_CACHE_NAME);
+  const cached = await cache.match(req);
+  const etag = cached && cached.headers.get('ETag');
+
+  const headers = new Headers(req.headers);
+  if (etag) headers.set('If-None-Match', etag);
+
+  try {
+    const res = await fetch(req.url, { headers, credentials: 'same-origin', cache: 'no-store' });
+    if (res.status === 304 && cached) {
+      return cached;
+    }
+    if (res.ok && res.headers.get('ETag')) {
+      cache.put(req, res.clone());
+    }
+    return res;
+  } catch (err) {
+    if (cached) return cached;
+    throw err;
+  }
+}
+
 // Push Notification Support
 self.addEventListener('push', event => {
   const options = {
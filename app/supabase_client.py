@@ -6,11 +6,13 @@ import os
 from supabase import create_client, Client
 from typing import Optional
 
+from app.instrumentacao import ClienteInstrumentado
+
 _supabase_client: Optional[Client] = None
 
 def get_supabase_client() -> Client:
     """
-    Retorna instância singleton do cliente Supabase
+    Retorna instância singleton do cliente Supabase (com as chamadas medidas, ver app/instrumentacao.py)
     """
     global _supabase_client
     
@@ -25,7 +27,7 @@ def get_supabase_client() -> Client:
                 "Configure no painel da Vercel: Settings → Environment Variables"
             )
         
-        _supabase_client = create_client(supabase_url, supabase_key)
+        _supabase_client = ClienteInstrumentado(create_client(supabase_url, supabase_key))
     
     return _supabase_client
 
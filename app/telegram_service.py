@@ -6,6 +6,9 @@ import logging
 from typing import Dict, Any
 import os
 
+from app.instrumentacao import medir_http
+from app.metricas import notificacao
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -64,6 +67,7 @@ class TelegramService:
         return chat_id
     
     @staticmethod
+    @notificacao('telegram')
     def send_message(chat_id: str, message: str, parse_mode: str = 'Markdown') -> Dict[str, Any]:
         """
         Envia mensagem via Telegram Bot API
@@ -108,7 +112,8 @@ class TelegramService:
             
             logger.info(f'Enviando mensagem Telegram para {formatted_chat_id}')
             
-            response = requests.post(url, json=data, timeout=10)
+            with medir_http('telegram'):
+                response = requests.post(url, json=data, timeout=10)
             
             if response.status_code == 200:
                 logger.info(f'Mensagem Telegram enviada com sucesso para {formatted_chat_id}')
@@ -349,7 +354,8 @@ _Sistema de Inventário de Equipamentos TI_
             
             url = f'https://api.telegram.org/bot{bot_token}/getMe'
             
-            response = requests.get(url, timeout=10)
+            with medir_http('telegram', 'GET'):
+                response = requests.get(url, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
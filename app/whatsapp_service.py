@@ -8,6 +8,9 @@ import logging
 from flask import current_app
 from typing import Optional, Dict, Any
 
+from app.instrumentacao import medir_http
+from app.metricas import notificacao
+
 logger = logging.getLogger(__name__)
 
 
@@ -61,6 +64,7 @@ class WhatsAppService:
         return '+' + phone
     
     @staticmethod
+    @notificacao('whatsapp')
     def send_message_twilio(to: str, message: str) -> dict:
         """
         Envia mensagem via Twilio WhatsApp API
@@ -107,11 +111,12 @@ class WhatsAppService:
             
             logger.info(f'Enviando WhatsApp Twilio: De {from_number} para {to}')
             
-            response = requests.post(
-                url,
-                data=data,
-                auth=(account_sid, auth_token)
-            )
+            with medir_http('whatsapp'):
+                response = requests.post(
+                    url,
+                    data=data,
+                    auth=(account_sid, auth_token)
+                )
             
             if response.status_code == 201:
                 logger.info(f'WhatsApp enviado via Twilio para {to}')
@@ -156,6 +161,7 @@ class WhatsAppService:
             }
     
     @staticmethod
+    @notificacao('whatsapp')
     def send_message_messagebird(to: str, message: str) -> bool:
         """Envia mensagem via MessageBird WhatsApp API"""
         try:
@@ -182,7 +188,8 @@ class WhatsAppService:
                 }
             }
             
-            response = requests.post(url, json=data, headers=headers)
+            with medir_http('whatsapp'):
+                response = requests.post(url, json=data, headers=headers)
             
             if response.status_code == 200:
                 logger.info(f'WhatsApp enviado via MessageBird para {to}')
@@ -196,6 +203,7 @@ class WhatsAppService:
             return False
     
     @staticmethod
+    @notificacao('whatsapp')
     def send_message_meta(to: str, message: str) -> bool:
         """Envia mensagem via Meta (Facebook) WhatsApp Business API"""
         try:
@@ -222,7 +230,8 @@ class WhatsAppService:
                 }
             }
             
-            response = requests.post(url, json=data, headers=headers)
+            with medir_http('whatsapp'):
+                response = requests.post(url, json=data, headers=headers)
             
             if response.status_code == 200:
                 logger.info(f'WhatsApp enviado via Meta para {to}')
@@ -0,0 +1,169 @@
+"""
+Benchmark da camada de resposta (serialização JSON e compressão)
+Gera payloads sintéticos no formato de /emprestimos e /dashboard-executivo/dados
+e compara json (configuração padrão do Flask) x orjson, e tamanho bruto x gzip x brotli.
+
+Execute: python benchmark_respostas.py [quantidade_emprestimos]
+"""
+import gzip
+import json
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+TIPOS = ['Notebook', 'Desktop', 'Monitor', 'Tablet', 'Smartphone', 'Impressora']
+MARCAS = ['Dell', 'Lenovo', 'HP', 'Apple', 'Samsung', 'LG']
+DEPARTAMENTOS = ['TI', 'Financeiro', 'RH', 'Comercial', 'Marketing', 'Jurídico', 'Operações', 'Diretoria']
+
+
+def gerar_equipamento(i):
+    """Equipamento no formato de Equipamento.to_dict()"""
+    return {
+        'id': i,
+        'nome': f'{random.choice(TIPOS)} {i:05d}',
+        'tipo': random.choice(TIPOS),
+        'marca': random.choice(MARCAS),
+        'modelo': f'Modelo {random.randint(100, 999)}',
+        'numero_serie': f'SN{random.randint(10**9, 10**10 - 1)}',
+        'processador': 'Intel Core i7-1165G7 @ 2.80GHz',
+        'memoria_ram': '16GB DDR4',
+        'armazenamento': '512GB SSD NVMe',
+        'sistema_operacional': 'Windows 11 Pro',
+        'status': random.choice(['Estoque', 'Emprestado', 'Manutenção']),
+        'data_aquisicao': (date(2020, 1, 1) + timedelta(days=random.randint(0, 1500))).isoformat(),
+        'valor': round(random.uniform(800, 12000), 2),
+        'vida_util_anos': 5,
+        'departamento_atual': random.choice(DEPARTAMENTOS),
+        'observacoes': 'Equipamento com garantia estendida até o fim do contrato. Carregador original incluso.',
+        'data_cadastro': '2023-03-15T10:22:31.123456',
+        'data_atualizacao': '2024-07-01T08:01:12.654321'
+    }
+
+
+def gerar_emprestimos(qtd, qtd_equipamentos=500):
+    """Lista no formato de /emprestimos (cada item embute o equipamento completo)"""
+    equipamentos = [gerar_equipamento(i) for i in range(1, qtd_equipamentos + 1)]
+    emprestimos = []
+    for i in range(1, qtd + 1):
+        eq = random.choice(equipamentos)
+        data_emp = date(2022, 1, 1) + timedelta(days=random.randint(0, 1000))
+        devolvido = random.random() < 0.8
+        emprestimos.append({
+            'id': i,
+            'equipamento_id': eq['id'],
+            'responsavel': f'Colaborador {random.randint(1, 2000)}',
+            'departamento': random.choice(DEPARTAMENTOS),
+            'email_responsavel': f'colaborador{random.randint(1, 2000)}@empresa.com.br',
+            'telefone_responsavel': '+55 11 99999-0000',
+            'telegram_chat_id': None,
+            'data_emprestimo': data_emp.isoformat(),
+            'data_devolucao_prevista': (data_emp + timedelta(days=30)).isoformat(),
+            'data_devolucao_real': (data_emp + timedelta(days=random.randint(1, 60))).isoformat() if devolvido else None,
+            'status': 'Devolvido' if devolvido else 'Ativo',
+            'observacoes': 'Empréstimo para trabalho remoto',
+            'equipamento': eq,
+            'equipamento_nome': f"{eq['nome']} - {eq['marca']} {eq['modelo']}"
+        })
+    return emprestimos
+
+
+def gerar_dashboard_executivo(qtd_equipamentos=500):
+    """Payload no formato de /dashboard-executivo/dados"""
+    def item_roi(i):
+        return {
+            'nome': f'Equipamento {i}', 'tipo': random.choice(TIPOS), 'marca': random.choice(MARCAS),
+            'modelo': 'X1', 'valor_aquisicao': 5000.0, 'valor_residual': 2500.5, 'dias_uso': 320,
+            'custo_manutencao': 150.0, 'roi_percentual': -12.34, 'idade_anos': 2.4
+        }
+
+    def item_uso(i):
+        return {
+            'id': i, 'nome': f'Equipamento {i}', 'tipo': random.choice(TIPOS), 'marca': random.choice(MARCAS),
+            'modelo': 'X1', 'status': 'Estoque', 'total_emprestimos': 12, 'emprestimos_recentes': 2,
+            'dias_emprestado': 210, 'taxa_ocupacao': 57.5, 'classificacao': 'medio',
+            'recomendacao': 'Baixa utilização - considere redistribuir', 'valor': 5000.0
+        }
+
+    return {
+        'success': True,
+        'inventario': {
+            'total_equipamentos': qtd_equipamentos, 'valor_total': 2500000.0, 'valor_medio': 5000.0,
+            'equipamentos_por_departamento': [
+                {'departamento': d, 'quantidade': 60, 'valor_total': 300000.0} for d in DEPARTAMENTOS
+            ]
+        },
+        'manutencoes': {
+            'custo_total': 45000.0, 'pendentes': 4,
+            'equipamentos_problematicos': [
+                {'nome': f'Eq {i}', 'tipo': 'Notebook', 'marca': 'Dell', 'modelo': 'X', 'quantidade_manutencoes': 5, 'custo_total': 900.0}
+                for i in range(5)
+            ],
+            'custos_por_mes': [{'mes': f'2024-{m:02d}', 'custo': 1200.0} for m in range(1, 13)]
+        },
+        'utilizacao': {
+            'emprestimos_ativos': 120, 'taxa_utilizacao': 24.0,
+            'tempo_medio_por_departamento': [{'departamento': d, 'tempo_medio_dias': 21.5} for d in DEPARTAMENTOS],
+            'emprestimos_por_mes': [{'mes': f'2024-{m:02d}', 'quantidade': 80} for m in range(1, 13)]
+        },
+        'roi': {'top_10': [item_roi(i) for i in range(10)], 'bottom_10': [item_roi(i) for i in range(10)], 'roi_medio': -5.2},
+        'analise_uso': {
+            'mais_requisitados': [item_uso(i) for i in range(10)],
+            'subutilizados': [item_uso(i) for i in range(10)],
+            'estatisticas': {
+                'total_equipamentos': qtd_equipamentos, 'total_com_emprestimos': 400, 'total_nunca_usados': 100,
+                'taxa_ocupacao_media': 33.3, 'por_classificacao': {'alto': 50, 'medio': 150, 'baixo': 300}
+            }
+        }
+    }
+
+
+def medir(funcao, repeticoes):
+    """Tempo médio (ms) de `funcao` em `repeticoes` execuções"""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def benchmark(nome, payload, repeticoes):
+    print(f'\n📦 {nome}')
+
+    # Mesma configuração do DefaultJSONProvider do Flask
+    tempo_json, corpo = medir(lambda: json.dumps(payload, ensure_ascii=True, sort_keys=True).encode('utf-8'), repeticoes)
+    print(f'   json (padrão Flask): {tempo_json:8.2f} ms  | {len(corpo) / 1024:10.1f} KB')
+
+    if orjson is not None:
+        tempo_orjson, corpo_orjson = medir(lambda: orjson.dumps(payload), repeticoes)
+        print(f'   orjson:              {tempo_orjson:8.2f} ms  | {len(corpo_orjson) / 1024:10.1f} KB  ({tempo_json / tempo_orjson:.1f}x mais rápido)')
+        corpo = corpo_orjson
+    else:
+        print('   orjson:              não instalado (pip install orjson)')
+
+    tempo_gzip, corpo_gzip = medir(lambda: gzip.compress(corpo, compresslevel=6), max(1, repeticoes // 2))
+    print(f'   gzip (nível 6):      {tempo_gzip:8.2f} ms  | {len(corpo_gzip) / 1024:10.1f} KB  ({len(corpo) / len(corpo_gzip):.1f}x menor)')
+
+    if brotli is not None:
+        tempo_br, corpo_br = medir(lambda: brotli.compress(corpo, quality=5), max(1, repeticoes // 2))
+        print(f'   brotli (q=5):        {tempo_br:8.2f} ms  | {len(corpo_br) / 1024:10.1f} KB  ({len(corpo) / len(corpo_br):.1f}x menor)')
+    else:
+        print('   brotli:              não instalado (pip install Brotli)')
+
+
+if __name__ == '__main__':
+    random.seed(42)
+    qtd = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    benchmark(f'/emprestimos ({qtd} empréstimos com equipamento embutido)', gerar_emprestimos(qtd), repeticoes=10)
+    benchmark('/dashboard-executivo/dados', gerar_dashboard_executivo(), repeticoes=200)
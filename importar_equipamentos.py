@@ -0,0 +1,61 @@
+"""
+Script para importar equipamentos em lote a partir de uma planilha CSV ou XLSX
+Execute: python importar_equipamentos.py planilha.csv [--lote 500] [--atualizar]
+
+Colunas obrigatórias: nome, tipo, marca, modelo, numero_serie, status
+Colunas opcionais: processador, memoria_ram, armazenamento, sistema_operacional,
+data_aquisicao (AAAA-MM-DD ou DD/MM/AAAA), valor, vida_util_anos, departamento_atual, observacoes
+"""
+import argparse
+import os
+import sys
+
+# Carrega variáveis de ambiente do arquivo .env manualmente
+env_path = os.path.join(os.path.dirname(__file__), '.env')
+if os.path.exists(env_path):
+    with open(env_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                os.environ.setdefault(key.strip(), value.strip())
+
+from app.import_service import ler_planilha, importar_equipamentos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importa equipamentos de uma planilha CSV/XLSX')
+    parser.add_argument('arquivo', help='caminho do arquivo .csv ou .xlsx')
+    parser.add_argument('--lote', type=int, default=int(os.environ.get('IMPORT_BATCH_SIZE', 500)),
+                        help='linhas por insert (padrão: 500)')
+    parser.add_argument('--atualizar', action='store_true',
+                        help='atualiza equipamentos com número de série já cadastrado em vez de reportar erro')
+    args = parser.parse_args()
+
+    print(f'📥 Importando {args.arquivo} (lotes de {args.lote})...')
+    try:
+        with open(args.arquivo, 'rb') as arquivo:
+            relatorio = importar_equipamentos(
+                ler_planilha(arquivo, args.arquivo),
+                tamanho_lote=args.lote,
+                atualizar_existentes=args.atualizar
+            )
+    except ValueError as e:
+        print(f'❌ {e}')
+        return 1
+
+    print(f'\n📋 Linhas processadas: {relatorio["total_linhas"]}')
+    print(f'   ✅ Inseridos: {relatorio["inseridos"]}')
+    print(f'   🔄 Atualizados: {relatorio["atualizados"]}')
+    print(f'   ❌ Com erro: {relatorio["total_erros"]}')
+
+    for erro in relatorio['erros']:
+        print(f'   • Linha {erro["linha"]} ({erro["numero_serie"] or "sem número de série"}): {"; ".join(erro["erros"])}')
+    if relatorio['total_erros'] > len(relatorio['erros']):
+        print(f'   ... e mais {relatorio["total_erros"] - len(relatorio["erros"])} linhas com erro')
+
+    return 0 if relatorio['total_erros'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Script para reconstruir o rollup mensal (mes, tipo, departamento) a partir do histórico
+Execute: python reconstruir_rollup.py
+
+Necessário na carga inicial de um banco existente e depois de alterar o tipo ou o
+departamento_atual de equipamentos (os triggers mantêm apenas as novas escritas).
+"""
+import os
+import sys
+
+# Carrega variáveis de ambiente do arquivo .env manualmente
+env_path = os.path.join(os.path.dirname(__file__), '.env')
+if os.path.exists(env_path):
+    with open(env_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                os.environ.setdefault(key.strip(), value.strip())
+
+from app.rollup_service import reconstruir
+
+
+def main():
+    print('🔄 Reconstruindo rollup mensal a partir de empréstimos e manutenções...')
+    try:
+        linhas = reconstruir()
+    except Exception as e:
+        print(f'❌ Erro ao reconstruir o rollup: {e}')
+        return 1
+
+    print(f'✅ Rollup reconstruído: {linhas} linhas (mês x tipo x departamento)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Script para restaurar um backup lógico (gerado em /admin/backup/criar ou pelo backup diário)
+Execute: python restaurar_backup.py <nome_do_backup> [--tabelas usuarios,equipamentos]
+                                    [--workers 8] [--lote 1000] [--manter-extras] [--pasta backups]
+
+Se a restauração for interrompida, execute o mesmo comando: ela continua do último checkpoint.
+"""
+import argparse
+import os
+import sys
+
+# Carrega variáveis de ambiente do arquivo .env manualmente
+env_path = os.path.join(os.path.dirname(__file__), '.env')
+if os.path.exists(env_path):
+    with open(env_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                os.environ.setdefault(key.strip(), value.strip())
+
+from app.backup_service import TABELAS
+from app.restauracao_service import (
+    TAMANHO_LOTE, WORKERS, ErroRestauracao, caminho_checkpoint, obter_snapshot, restaurar
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Restaura um backup lógico do inventário')
+    parser.add_argument('backup', help='Nome do backup (veja GET /admin/backup/listar)')
+    parser.add_argument('--pasta', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backups'),
+                        help='Pasta dos backups (padrão: ./backups)')
+    parser.add_argument('--tabelas', help=f'Tabelas separadas por vírgula (padrão: {",".join(TABELAS)})')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Upserts simultâneos por tabela')
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Linhas por upsert')
+    parser.add_argument('--manter-extras', action='store_true',
+                        help='Não remove linhas criadas depois do backup')
+    args = parser.parse_args()
+
+    nome = os.path.basename(args.backup)
+    tabelas = [t.strip() for t in args.tabelas.split(',')] if args.tabelas else None
+    if tabelas and set(tabelas) - set(TABELAS):
+        print(f'❌ Tabelas inválidas: {", ".join(sorted(set(tabelas) - set(TABELAS)))}')
+        return 1
+
+    try:
+        manifesto = obter_snapshot(args.pasta, nome)
+    except ErroRestauracao as e:
+        print(f'❌ {e}')
+        return 1
+
+    print(f'🔄 Restaurando {nome} ({args.workers} workers, lotes de {args.lote} linhas)')
+    for tabela, info in manifesto['tabelas'].items():
+        print(f'   - {tabela}: {info["linhas"]} linhas em {len(info["chunks"])} chunks')
+
+    def progresso(tabela, linhas):
+        print(f'\r   {tabela}: {linhas} linhas', end='', flush=True)
+
+    try:
+        estado = restaurar(
+            args.pasta, nome, tabelas=tabelas, tamanho_lote=args.lote, workers=args.workers,
+            remover_extras=not args.manter_extras, progresso=progresso
+        )
+    except Exception as e:
+        print(f'\n❌ Erro ao restaurar: {e}')
+        print(f'   Checkpoint: {caminho_checkpoint(args.pasta, nome)} (execute novamente para continuar)')
+        return 1
+
+    removidas = sum(e['linhas'] for chave, e in estado['etapas'].items() if chave.startswith('remocao:'))
+    print(f'\n✅ Restauração concluída ({removidas} linhas criadas depois do backup removidas)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -97,6 +97,669 @@ CREATE INDEX IF NOT EXISTS idx_emprestimos_equipamento_id ON emprestimos(equipam
 CREATE INDEX IF NOT EXISTS idx_emprestimos_status ON emprestimos(status);
 CREATE INDEX IF NOT EXISTS idx_push_subscriptions_usuario_id ON push_subscriptions(usuario_id);
 
+-- Versões por tabela (ETag / GET condicional nas rotas de leitura)
+-- Cada INSERT/UPDATE/DELETE incrementa o contador da tabela afetada
+CREATE TABLE IF NOT EXISTS versoes_tabelas (
+    tabela VARCHAR(64) PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO versoes_tabelas (tabela)
+VALUES ('equipamentos'), ('emprestimos'), ('manutencoes'), ('equipamentos_fotos')
+ON CONFLICT (tabela) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION incrementar_versao_tabela() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO versoes_tabelas (tabela, versao, atualizado_em)
+    VALUES (TG_TABLE_NAME, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (tabela) DO UPDATE
+        SET versao = versoes_tabelas.versao + 1,
+            atualizado_em = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_versao_equipamentos ON equipamentos;
+CREATE TRIGGER trg_versao_equipamentos AFTER INSERT OR UPDATE OR DELETE ON equipamentos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+
+DROP TRIGGER IF EXISTS trg_versao_emprestimos ON emprestimos;
+CREATE TRIGGER trg_versao_emprestimos AFTER INSERT OR UPDATE OR DELETE ON emprestimos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+
+DROP TRIGGER IF EXISTS trg_versao_manutencoes ON manutencoes;
+CREATE TRIGGER trg_versao_manutencoes AFTER INSERT OR UPDATE OR DELETE ON manutencoes
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+
+DROP TRIGGER IF EXISTS trg_versao_equipamentos_fotos ON equipamentos_fotos;
+CREATE TRIGGER trg_versao_equipamentos_fotos AFTER INSERT OR UPDATE OR DELETE ON equipamentos_fotos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+
+-- Operações em lote (check-in / check-out de vários equipamentos numa única transação)
+-- Empréstimos e status dos equipamentos são atualizados por conjunto, não linha a linha
+CREATE OR REPLACE FUNCTION devolver_emprestimos_lote(p_ids INTEGER[])
+RETURNS SETOF emprestimos AS $$
+    WITH devolvidos AS (
+        UPDATE emprestimos
+           SET status = 'Devolvido',
+               data_devolucao_real = (NOW() AT TIME ZONE 'utc')
+         WHERE id = ANY(p_ids) AND status <> 'Devolvido'
+        RETURNING *
+    ), equipamentos_devolvidos AS (
+        UPDATE equipamentos e
+           SET status = 'Estoque',
+               data_atualizacao = (NOW() AT TIME ZONE 'utc')
+          FROM devolvidos d
+         WHERE e.id = d.equipamento_id AND e.status = 'Emprestado'
+    )
+    SELECT * FROM devolvidos;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION emprestar_equipamentos_lote(p_equipamento_ids INTEGER[], p_dados JSONB)
+RETURNS SETOF emprestimos AS $$
+    WITH disponiveis AS (
+        UPDATE equipamentos
+           SET status = 'Emprestado',
+               data_atualizacao = (NOW() AT TIME ZONE 'utc')
+         WHERE id = ANY(p_equipamento_ids) AND status = 'Estoque'
+        RETURNING id
+    )
+    INSERT INTO emprestimos (
+        equipamento_id, responsavel, departamento, email_responsavel, telefone_responsavel,
+        data_devolucao_prevista, observacoes, status, data_emprestimo
+    )
+    SELECT id,
+           p_dados->>'responsavel',
+           p_dados->>'departamento',
+           p_dados->>'email_responsavel',
+           p_dados->>'telefone_responsavel',
+           (p_dados->>'data_devolucao_prevista')::DATE,
+           p_dados->>'observacoes',
+           'Ativo',
+           (NOW() AT TIME ZONE 'utc')::DATE
+      FROM disponiveis
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- Auditoria de inventário físico (leituras de QR Code / número de série)
+CREATE TABLE IF NOT EXISTS auditorias (
+    id SERIAL PRIMARY KEY,
+    nome VARCHAR(100) NOT NULL,
+    departamento VARCHAR(100),
+    tipo VARCHAR(50),
+    status VARCHAR(20) NOT NULL DEFAULT 'Aberta',
+    usuario_id INTEGER REFERENCES usuarios(id),
+    resumo JSONB,
+    data_inicio TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    data_fim TIMESTAMP
+);
+
+-- A chave primária faz da tabela um conjunto: leituras repetidas são ignoradas
+CREATE TABLE IF NOT EXISTS auditoria_leituras (
+    auditoria_id INTEGER NOT NULL REFERENCES auditorias(id) ON DELETE CASCADE,
+    numero_serie VARCHAR(100) NOT NULL,
+    data_leitura TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (auditoria_id, numero_serie)
+);
+
+-- Reconciliação por conjunto: leituras x equipamentos do escopo da auditoria
+-- situacao: 'faltante' (esperado e não lido), 'inesperado' (lido e fora do cadastro/escopo),
+-- 'status_divergente' (lido, mas cadastrado como Emprestado/Inativo)
+CREATE OR REPLACE FUNCTION reconciliar_auditoria(p_auditoria_id INTEGER)
+RETURNS TABLE (
+    situacao TEXT,
+    numero_serie VARCHAR,
+    equipamento_id INTEGER,
+    nome VARCHAR,
+    tipo VARCHAR,
+    status VARCHAR,
+    departamento_atual VARCHAR
+) AS $$
+    WITH auditoria AS (
+        SELECT departamento, tipo FROM auditorias WHERE id = p_auditoria_id
+    ), escopo AS (
+        SELECT e.*
+          FROM equipamentos e, auditoria a
+         WHERE (a.departamento IS NULL OR e.departamento_atual = a.departamento)
+           AND (a.tipo IS NULL OR e.tipo = a.tipo)
+    ), leituras AS (
+        SELECT l.numero_serie FROM auditoria_leituras l WHERE l.auditoria_id = p_auditoria_id
+    )
+    SELECT CASE
+               WHEN l.numero_serie IS NULL THEN 'faltante'
+               WHEN e.id IS NULL THEN 'inesperado'
+               ELSE 'status_divergente'
+           END,
+           COALESCE(e.numero_serie, l.numero_serie),
+           e.id, e.nome, e.tipo, e.status, e.departamento_atual
+      FROM escopo e
+      FULL OUTER JOIN leituras l ON l.numero_serie = e.numero_serie
+     WHERE (l.numero_serie IS NULL AND e.status IN ('Estoque', 'Manutenção'))
+        OR e.id IS NULL
+        OR (l.numero_serie IS NOT NULL AND e.status IN ('Emprestado', 'Inativo'));
+$$ LANGUAGE sql STABLE;
+
+-- Busca de equipamentos: texto completo (tsvector), similaridade (pg_trgm) e prefixo de número de série
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE equipamentos ADD COLUMN IF NOT EXISTS busca TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('portuguese', COALESCE(nome, '')), 'A') ||
+    setweight(to_tsvector('simple', COALESCE(numero_serie, '')), 'A') ||
+    setweight(to_tsvector('portuguese', COALESCE(marca, '') || ' ' || COALESCE(modelo, '')), 'B') ||
+    setweight(to_tsvector('portuguese', COALESCE(processador, '')), 'C') ||
+    setweight(to_tsvector('portuguese', COALESCE(observacoes, '')), 'D')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_equipamentos_busca ON equipamentos USING GIN (busca);
+CREATE INDEX IF NOT EXISTS idx_equipamentos_trgm ON equipamentos
+    USING GIN ((lower(nome || ' ' || marca || ' ' || modelo)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_equipamentos_numero_serie_prefixo ON equipamentos
+    (upper(numero_serie) text_pattern_ops);
+
+-- Resultados ordenados por relevância; `total` traz o número de resultados sem paginação
+CREATE OR REPLACE FUNCTION buscar_equipamentos(
+    p_termo TEXT,
+    p_limite INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0,
+    p_somente_serie BOOLEAN DEFAULT FALSE,
+    p_status TEXT DEFAULT NULL,
+    p_tipo TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    id INTEGER,
+    nome VARCHAR,
+    tipo VARCHAR,
+    marca VARCHAR,
+    modelo VARCHAR,
+    numero_serie VARCHAR,
+    status VARCHAR,
+    departamento_atual VARCHAR,
+    relevancia REAL,
+    total BIGINT
+) AS $$
+    WITH consulta AS (
+        SELECT websearch_to_tsquery('portuguese', p_termo) AS q,
+               upper(trim(p_termo)) AS prefixo,
+               lower(trim(p_termo)) AS texto
+    ), encontrados AS (
+        -- Um ramo por índice: com OR entre as condições o planejador cai numa varredura sequencial.
+        -- O termo vai direto nas condições (não via `consulta`) para o planejador estimar pelo valor.
+        -- Prefixo do número de série como intervalo nos operadores do text_pattern_ops (o LIKE com
+        -- padrão calculado não usa o índice); chr(1114111) é o maior caractere Unicode
+        SELECT e.id
+          FROM equipamentos e
+         WHERE upper(e.numero_serie) ~>=~ upper(trim(p_termo))
+           AND upper(e.numero_serie) ~<~ (upper(trim(p_termo)) || chr(1114111))
+        UNION
+        SELECT e.id
+          FROM equipamentos e
+         WHERE NOT p_somente_serie
+           AND e.busca @@ websearch_to_tsquery('portuguese', p_termo)
+        UNION
+        SELECT e.id
+          FROM equipamentos e
+         WHERE NOT p_somente_serie
+           AND lower(e.nome || ' ' || e.marca || ' ' || e.modelo) % lower(trim(p_termo))
+    ), candidatos AS (
+        -- Relevância calculada só para os encontrados
+        SELECT e.*,
+               (CASE WHEN starts_with(upper(e.numero_serie), c.prefixo) THEN 1.0 ELSE 0.0 END
+                + CASE WHEN p_somente_serie THEN 0.0 ELSE
+                      ts_rank(e.busca, c.q) + similarity(lower(e.nome || ' ' || e.marca || ' ' || e.modelo), c.texto)
+                  END)::REAL AS relevancia
+          FROM encontrados f
+          JOIN equipamentos e ON e.id = f.id
+         CROSS JOIN consulta c
+         WHERE (p_status IS NULL OR e.status = p_status)
+           AND (p_tipo IS NULL OR e.tipo = p_tipo)
+    )
+    SELECT id, nome, tipo, marca, modelo, numero_serie, status, departamento_atual, relevancia,
+           COUNT(*) OVER () AS total
+      FROM candidatos
+     ORDER BY relevancia DESC, id
+     LIMIT p_limite OFFSET p_offset;
+$$ LANGUAGE sql STABLE;
+
+-- Catálogo de departamentos (dimensão mantida por trigger a partir dos empréstimos)
+-- Alimenta os filtros de relatório e o autocomplete do formulário de empréstimo
+CREATE TABLE IF NOT EXISTS departamentos (
+    nome VARCHAR(100) PRIMARY KEY,
+    total_emprestimos INTEGER NOT NULL DEFAULT 0,
+    ultimo_uso TIMESTAMP
+);
+
+-- O autocomplete filtra com ILIKE 'prefixo%' em nome: atendido pelo índice trigram (pg_trgm, criado acima)
+DROP INDEX IF EXISTS idx_departamentos_nome_prefixo;
+CREATE INDEX IF NOT EXISTS idx_departamentos_nome_trgm ON departamentos USING GIN (nome gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION atualizar_catalogo_departamentos() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND NULLIF(trim(OLD.departamento), '') IS NOT NULL THEN
+        IF TG_OP = 'DELETE' OR trim(OLD.departamento) IS DISTINCT FROM trim(NEW.departamento) THEN
+            UPDATE departamentos
+               SET total_emprestimos = GREATEST(total_emprestimos - 1, 0)
+             WHERE nome = trim(OLD.departamento);
+            DELETE FROM departamentos WHERE nome = trim(OLD.departamento) AND total_emprestimos = 0;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NULLIF(trim(NEW.departamento), '') IS NOT NULL THEN
+        IF TG_OP = 'INSERT' OR trim(OLD.departamento) IS DISTINCT FROM trim(NEW.departamento) THEN
+            INSERT INTO departamentos (nome, total_emprestimos, ultimo_uso)
+            VALUES (trim(NEW.departamento), 1, NEW.data_emprestimo)
+            ON CONFLICT (nome) DO UPDATE
+                SET total_emprestimos = departamentos.total_emprestimos + 1,
+                    ultimo_uso = GREATEST(departamentos.ultimo_uso, EXCLUDED.ultimo_uso);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_catalogo_departamentos ON emprestimos;
+CREATE TRIGGER trg_catalogo_departamentos AFTER INSERT OR UPDATE OF departamento OR DELETE ON emprestimos
+    FOR EACH ROW EXECUTE FUNCTION atualizar_catalogo_departamentos();
+
+-- Carga inicial / reconstrução a partir dos empréstimos existentes
+INSERT INTO departamentos (nome, total_emprestimos, ultimo_uso)
+SELECT trim(departamento), COUNT(*), MAX(data_emprestimo)
+  FROM emprestimos
+ WHERE NULLIF(trim(departamento), '') IS NOT NULL
+ GROUP BY trim(departamento)
+ON CONFLICT (nome) DO UPDATE
+    SET total_emprestimos = EXCLUDED.total_emprestimos,
+        ultimo_uso = EXCLUDED.ultimo_uso;
+
+-- Agregados do relatório de empréstimos (mesmos filtros de /relatorios/emprestimos), calculados com GROUP BY
+CREATE OR REPLACE FUNCTION relatorio_emprestimos_resumo(
+    p_filtro TEXT DEFAULT 'todos',
+    p_data_inicio DATE DEFAULT NULL,
+    p_data_fim DATE DEFAULT NULL,
+    p_departamento TEXT DEFAULT NULL
+)
+RETURNS JSONB AS $$
+    WITH filtrados AS (
+        SELECT e.departamento, e.status, e.data_emprestimo, e.data_devolucao_prevista,
+               e.data_devolucao_real, eq.nome AS equipamento_nome
+          FROM emprestimos e
+          LEFT JOIN equipamentos eq ON eq.id = e.equipamento_id
+         WHERE CASE p_filtro
+                   WHEN 'ativos' THEN e.status = 'Ativo'
+                   WHEN 'historico' THEN e.status = 'Devolvido'
+                   WHEN 'atrasados' THEN e.status = 'Ativo' AND e.data_devolucao_prevista < CURRENT_DATE
+                   ELSE TRUE
+               END
+           AND (p_data_inicio IS NULL OR e.data_emprestimo >= p_data_inicio)
+           AND (p_data_fim IS NULL OR e.data_emprestimo < p_data_fim + 1)
+           AND (p_departamento IS NULL OR e.departamento = p_departamento)
+    )
+    SELECT jsonb_build_object(
+        'estatisticas', (
+            SELECT jsonb_build_object(
+                'total', COUNT(*),
+                'ativos', COUNT(*) FILTER (WHERE status = 'Ativo'),
+                'devolvidos', COUNT(*) FILTER (WHERE status = 'Devolvido'),
+                'atrasados', COUNT(*) FILTER (WHERE status = 'Ativo' AND data_devolucao_prevista < CURRENT_DATE),
+                'duracao_media', COALESCE(ROUND(AVG(data_devolucao_real::DATE - data_emprestimo::DATE)
+                    FILTER (WHERE status = 'Devolvido' AND data_devolucao_real IS NOT NULL), 1), 0)
+            )
+            FROM filtrados
+        ),
+        'emprestimos_por_departamento', (
+            SELECT COALESCE(jsonb_object_agg(departamento, quantidade), '{}'::JSONB)
+              FROM (
+                  SELECT COALESCE(NULLIF(departamento, ''), 'Não informado') AS departamento, COUNT(*) AS quantidade
+                    FROM filtrados
+                   GROUP BY 1
+              ) d
+        ),
+        'top_equipamentos', (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object('nome', nome, 'quantidade', quantidade)
+                                      ORDER BY quantidade DESC, nome), '[]'::JSONB)
+              FROM (
+                  SELECT equipamento_nome AS nome, COUNT(*) AS quantidade
+                    FROM filtrados
+                   WHERE equipamento_nome IS NOT NULL
+                   GROUP BY 1
+                   ORDER BY 2 DESC, 1
+                   LIMIT 10
+              ) t
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Rollup mensal (mes, tipo do equipamento, departamento) para séries temporais e previsão de demanda
+-- contagem: empréstimos iniciados no mês | dias_uso: dias dos empréstimos devolvidos, no mês de início
+-- custo: custo das manutenções iniciadas no mês (departamento = departamento_atual do equipamento)
+-- Mantido por triggers em emprestimos/manutencoes; mudanças de tipo/departamento_atual do equipamento
+-- só são refletidas ao reconstruir (python reconstruir_rollup.py ou SELECT reconstruir_rollup_mensal()).
+CREATE TABLE IF NOT EXISTS rollup_mensal (
+    id BIGSERIAL UNIQUE,
+    mes DATE NOT NULL,
+    tipo VARCHAR(50) NOT NULL,
+    departamento VARCHAR(100) NOT NULL,
+    contagem INTEGER NOT NULL DEFAULT 0,
+    custo FLOAT NOT NULL DEFAULT 0,
+    dias_uso INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (mes, tipo, departamento)
+);
+
+CREATE OR REPLACE FUNCTION rollup_mensal_somar(
+    p_mes DATE, p_tipo TEXT, p_departamento TEXT, p_contagem INTEGER, p_custo FLOAT, p_dias_uso INTEGER
+) RETURNS VOID AS $$
+    INSERT INTO rollup_mensal (mes, tipo, departamento, contagem, custo, dias_uso)
+    VALUES (date_trunc('month', p_mes)::DATE, COALESCE(p_tipo, 'Não informado'),
+            COALESCE(NULLIF(trim(p_departamento), ''), 'Não informado'), p_contagem, p_custo, p_dias_uso)
+    ON CONFLICT (mes, tipo, departamento) DO UPDATE
+        SET contagem = rollup_mensal.contagem + EXCLUDED.contagem,
+            custo = rollup_mensal.custo + EXCLUDED.custo,
+            dias_uso = rollup_mensal.dias_uso + EXCLUDED.dias_uso;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION atualizar_rollup_emprestimos() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_mensal_somar(
+            OLD.data_emprestimo::DATE, (SELECT tipo FROM equipamentos WHERE id = OLD.equipamento_id), OLD.departamento,
+            -1, 0,
+            -CASE WHEN OLD.status = 'Devolvido' AND OLD.data_devolucao_real IS NOT NULL
+                  THEN GREATEST(OLD.data_devolucao_real::DATE - OLD.data_emprestimo::DATE, 0) ELSE 0 END
+        );
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_mensal_somar(
+            NEW.data_emprestimo::DATE, (SELECT tipo FROM equipamentos WHERE id = NEW.equipamento_id), NEW.departamento,
+            1, 0,
+            CASE WHEN NEW.status = 'Devolvido' AND NEW.data_devolucao_real IS NOT NULL
+                 THEN GREATEST(NEW.data_devolucao_real::DATE - NEW.data_emprestimo::DATE, 0) ELSE 0 END
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rollup_emprestimos ON emprestimos;
+CREATE TRIGGER trg_rollup_emprestimos
+    AFTER INSERT OR UPDATE OF equipamento_id, departamento, data_emprestimo, data_devolucao_real, status OR DELETE
+    ON emprestimos
+    FOR EACH ROW EXECUTE FUNCTION atualizar_rollup_emprestimos();
+
+CREATE OR REPLACE FUNCTION atualizar_rollup_manutencoes() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_mensal_somar(
+            COALESCE(OLD.data_inicio, OLD.data_registro::DATE), eq.tipo, eq.departamento_atual, 0, -COALESCE(OLD.custo, 0), 0
+        ) FROM equipamentos eq WHERE eq.id = OLD.equipamento_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_mensal_somar(
+            COALESCE(NEW.data_inicio, NEW.data_registro::DATE), eq.tipo, eq.departamento_atual, 0, COALESCE(NEW.custo, 0), 0
+        ) FROM equipamentos eq WHERE eq.id = NEW.equipamento_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rollup_manutencoes ON manutencoes;
+CREATE TRIGGER trg_rollup_manutencoes
+    AFTER INSERT OR UPDATE OF equipamento_id, data_inicio, data_registro, custo OR DELETE
+    ON manutencoes
+    FOR EACH ROW EXECUTE FUNCTION atualizar_rollup_manutencoes();
+
+-- Ao excluir um equipamento, as manutenções são apagadas em cascata depois da linha dele, e o trigger
+-- acima já não encontra tipo/departamento: o custo delas é descontado aqui, antes da exclusão
+CREATE OR REPLACE FUNCTION descontar_rollup_equipamento_excluido() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM rollup_mensal_somar(
+        COALESCE(m.data_inicio, m.data_registro::DATE), OLD.tipo, OLD.departamento_atual, 0, -COALESCE(m.custo, 0), 0
+    ) FROM manutencoes m
+     WHERE m.equipamento_id = OLD.id
+       AND COALESCE(m.data_inicio, m.data_registro::DATE) IS NOT NULL;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rollup_equipamento_excluido ON equipamentos;
+CREATE TRIGGER trg_rollup_equipamento_excluido
+    BEFORE DELETE ON equipamentos
+    FOR EACH ROW EXECUTE FUNCTION descontar_rollup_equipamento_excluido();
+
+-- Reconstrução completa a partir do histórico (carga inicial e correções); retorna o número de linhas
+CREATE OR REPLACE FUNCTION reconstruir_rollup_mensal() RETURNS INTEGER AS $$
+DECLARE
+    v_linhas INTEGER;
+BEGIN
+    DELETE FROM rollup_mensal WHERE TRUE;
+
+    INSERT INTO rollup_mensal (mes, tipo, departamento, contagem, custo, dias_uso)
+    SELECT mes, tipo, departamento, SUM(contagem), SUM(custo), SUM(dias_uso)
+      FROM (
+          SELECT date_trunc('month', e.data_emprestimo)::DATE AS mes,
+                 COALESCE(eq.tipo, 'Não informado') AS tipo,
+                 COALESCE(NULLIF(trim(e.departamento), ''), 'Não informado') AS departamento,
+                 1 AS contagem, 0::FLOAT AS custo,
+                 CASE WHEN e.status = 'Devolvido' AND e.data_devolucao_real IS NOT NULL
+                      THEN GREATEST(e.data_devolucao_real::DATE - e.data_emprestimo::DATE, 0) ELSE 0 END AS dias_uso
+            FROM emprestimos e
+            LEFT JOIN equipamentos eq ON eq.id = e.equipamento_id
+          UNION ALL
+          SELECT date_trunc('month', COALESCE(m.data_inicio, m.data_registro::DATE))::DATE,
+                 COALESCE(eq.tipo, 'Não informado'),
+                 COALESCE(NULLIF(trim(eq.departamento_atual), ''), 'Não informado'),
+                 0, COALESCE(m.custo, 0), 0
+            FROM manutencoes m
+            JOIN equipamentos eq ON eq.id = m.equipamento_id
+           WHERE COALESCE(m.data_inicio, m.data_registro::DATE) IS NOT NULL
+      ) historico
+     GROUP BY mes, tipo, departamento;
+
+    GET DIAGNOSTICS v_linhas = ROW_COUNT;
+    RETURN v_linhas;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT reconstruir_rollup_mensal();
+
+-- Indicadores financeiros por equipamento (ROI e depreciação linear), recalculados pela tarefa
+-- agendada diária e lidos pelo dashboard executivo com ORDER BY roi_percentual LIMIT 10
+CREATE TABLE IF NOT EXISTS metricas_equipamentos (
+    equipamento_id INTEGER PRIMARY KEY REFERENCES equipamentos(id) ON DELETE CASCADE,
+    valor_aquisicao FLOAT NOT NULL,
+    valor_residual FLOAT NOT NULL,
+    idade_anos FLOAT NOT NULL DEFAULT 0,
+    dias_uso INTEGER NOT NULL DEFAULT 0,
+    custo_manutencao FLOAT NOT NULL DEFAULT 0,
+    roi_percentual FLOAT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_metricas_equipamentos_roi ON metricas_equipamentos(roi_percentual);
+
+-- Mesmas fórmulas de app/financeiro_service.metricas_roi: cada dia de uso vale 0.3% do valor e
+-- vida útil padrão de 5 anos; retorna o número de equipamentos calculados
+CREATE OR REPLACE FUNCTION atualizar_metricas_equipamentos() RETURNS INTEGER AS $$
+DECLARE
+    v_linhas INTEGER;
+BEGIN
+    INSERT INTO metricas_equipamentos (equipamento_id, valor_aquisicao, valor_residual, idade_anos,
+                                       dias_uso, custo_manutencao, roi_percentual, atualizado_em)
+    SELECT eq.id,
+           eq.valor,
+           ROUND((eq.valor * (1 - LEAST(d.idade / d.vida_util, 1)))::NUMERIC, 2),
+           ROUND(d.idade::NUMERIC, 1),
+           COALESCE(u.dias, 0),
+           COALESCE(c.custo, 0),
+           COALESCE(ROUND((((eq.valor * 0.003 * COALESCE(u.dias, 0)) - (eq.valor + COALESCE(c.custo, 0)))
+                  / NULLIF(eq.valor + COALESCE(c.custo, 0), 0) * 100)::NUMERIC, 2), 0),
+           CURRENT_TIMESTAMP
+      FROM equipamentos eq
+      LEFT JOIN (
+          SELECT equipamento_id, SUM(GREATEST(data_devolucao_real::DATE - data_emprestimo::DATE, 0)) AS dias
+            FROM emprestimos
+           WHERE status = 'Devolvido' AND data_devolucao_real IS NOT NULL
+           GROUP BY equipamento_id
+      ) u ON u.equipamento_id = eq.id
+      LEFT JOIN (
+          SELECT equipamento_id, SUM(COALESCE(custo, 0)) AS custo
+            FROM manutencoes
+           GROUP BY equipamento_id
+      ) c ON c.equipamento_id = eq.id
+      CROSS JOIN LATERAL (
+          SELECT COALESCE((CURRENT_DATE - eq.data_aquisicao) / 365.25, 0) AS idade,
+                 COALESCE(NULLIF(eq.vida_util_anos, 0), 5) AS vida_util
+      ) d
+     WHERE eq.valor > 0
+    ON CONFLICT (equipamento_id) DO UPDATE
+        SET valor_aquisicao = EXCLUDED.valor_aquisicao,
+            valor_residual = EXCLUDED.valor_residual,
+            idade_anos = EXCLUDED.idade_anos,
+            dias_uso = EXCLUDED.dias_uso,
+            custo_manutencao = EXCLUDED.custo_manutencao,
+            roi_percentual = EXCLUDED.roi_percentual,
+            atualizado_em = EXCLUDED.atualizado_em;
+    GET DIAGNOSTICS v_linhas = ROW_COUNT;
+
+    -- Equipamentos que deixaram de ter valor de aquisição
+    DELETE FROM metricas_equipamentos m
+     WHERE NOT EXISTS (SELECT 1 FROM equipamentos eq WHERE eq.id = m.equipamento_id AND eq.valor > 0);
+
+    RETURN v_linhas;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION metricas_equipamentos_resumo() RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total', COUNT(*),
+        'roi_medio', COALESCE(ROUND(AVG(roi_percentual)::NUMERIC, 2), 0),
+        'atualizado_em', MAX(atualizado_em)
+    )
+      FROM metricas_equipamentos;
+$$ LANGUAGE sql STABLE;
+
+SELECT atualizar_metricas_equipamentos();
+
+-- Execuções das tarefas agendadas (APScheduler): uma linha por job e janela de agendamento
+-- A chave (job_id, janela) garante que cada execução rode uma vez no cluster, mesmo com vários
+-- processos/workers; o lease (renovado durante a execução) permite a outro processo assumir
+-- uma execução cujo dono morreu.
+CREATE TABLE IF NOT EXISTS agendador_execucoes (
+    id BIGSERIAL PRIMARY KEY,
+    job_id VARCHAR(100) NOT NULL,
+    janela VARCHAR(40) NOT NULL,
+    dono VARCHAR(200) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'Executando',
+    tentativas INTEGER NOT NULL DEFAULT 1,
+    inicio TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    fim TIMESTAMP,
+    duracao_ms INTEGER,
+    erro TEXT,
+    lease_expira_em TIMESTAMP NOT NULL,
+    UNIQUE (job_id, janela)
+);
+
+CREATE INDEX IF NOT EXISTS idx_agendador_execucoes_inicio ON agendador_execucoes(inicio DESC);
+CREATE INDEX IF NOT EXISTS idx_agendador_execucoes_abandonadas ON agendador_execucoes(lease_expira_em)
+    WHERE status = 'Executando';
+
+-- Reivindica a execução de um job numa janela: retorna a linha se este processo deve executar
+-- (janela ainda não reivindicada, ou dono anterior sem renovar o lease)
+CREATE OR REPLACE FUNCTION reivindicar_execucao_job(
+    p_job_id TEXT, p_janela TEXT, p_dono TEXT, p_lease_segundos INTEGER
+)
+RETURNS SETOF agendador_execucoes AS $$
+    INSERT INTO agendador_execucoes (job_id, janela, dono, status, inicio, lease_expira_em)
+    VALUES (p_job_id, p_janela, p_dono, 'Executando', (NOW() AT TIME ZONE 'utc'),
+            (NOW() AT TIME ZONE 'utc') + make_interval(secs => p_lease_segundos))
+    ON CONFLICT (job_id, janela) DO UPDATE
+        SET dono = EXCLUDED.dono,
+            inicio = EXCLUDED.inicio,
+            lease_expira_em = EXCLUDED.lease_expira_em,
+            tentativas = agendador_execucoes.tentativas + 1,
+            erro = NULL
+      WHERE agendador_execucoes.status = 'Executando'
+        AND agendador_execucoes.lease_expira_em < (NOW() AT TIME ZONE 'utc')
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- Jobs de relatório em segundo plano (artefatos PDF/CSV/XLSX reaproveitados por hash dos parâmetros)
+CREATE TABLE IF NOT EXISTS relatorio_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    hash_parametros VARCHAR(64) NOT NULL,
+    formato VARCHAR(10) NOT NULL,
+    parametros JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'Pendente',
+    arquivo VARCHAR(255),
+    tamanho_bytes BIGINT,
+    erro TEXT,
+    usuario_id INTEGER REFERENCES usuarios(id) ON DELETE SET NULL,
+    gerado_por VARCHAR(100),
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    data_inicio TIMESTAMP,
+    data_conclusao TIMESTAMP,
+    expira_em TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_relatorio_jobs_hash ON relatorio_jobs(hash_parametros, status);
+CREATE INDEX IF NOT EXISTS idx_relatorio_jobs_expira_em ON relatorio_jobs(expira_em);
+
+-- Backups lógicos incrementais (app/backup_service.py): data_atualizacao em todas as tabelas copiadas,
+-- atualizada por trigger em qualquer INSERT/UPDATE (inclusive linhas restauradas de um backup, que
+-- trazem a data antiga); o backup incremental lê só as linhas com data_atualizacao posterior à
+-- marca d'água do backup anterior
+ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE emprestimos ADD COLUMN IF NOT EXISTS data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE equipamentos_fotos ADD COLUMN IF NOT EXISTS data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE manutencoes ADD COLUMN IF NOT EXISTS data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE push_subscriptions ADD COLUMN IF NOT EXISTS data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION tocar_data_atualizacao() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.data_atualizacao := (NOW() AT TIME ZONE 'utc');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['usuarios', 'equipamentos', 'emprestimos', 'equipamentos_fotos', 'manutencoes', 'push_subscriptions']
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_data_atualizacao_%1$s ON %1$I', t);
+        EXECUTE format('CREATE TRIGGER trg_data_atualizacao_%1$s BEFORE INSERT OR UPDATE ON %1$I
+                            FOR EACH ROW EXECUTE FUNCTION tocar_data_atualizacao()', t);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS idx_%1$s_data_atualizacao ON %1$I(data_atualizacao)', t);
+    END LOOP;
+END;
+$$;
+
+-- Restauração de backups (app/restauracao_service.py): as linhas voltam com os ids originais,
+-- então a sequência do SERIAL precisa avançar até o maior id restaurado
+CREATE OR REPLACE FUNCTION ajustar_sequencia_id(p_tabela TEXT)
+RETURNS BIGINT AS $$
+DECLARE
+    v_maximo BIGINT;
+BEGIN
+    IF p_tabela NOT IN ('usuarios', 'equipamentos', 'emprestimos', 'equipamentos_fotos', 'manutencoes', 'push_subscriptions') THEN
+        RAISE EXCEPTION 'Tabela % não pode ter a sequência ajustada', p_tabela;
+    END IF;
+    EXECUTE format('SELECT COALESCE(MAX(id), 0) FROM %I', p_tabela) INTO v_maximo;
+    PERFORM setval(pg_get_serial_sequence(p_tabela, 'id'), GREATEST(v_maximo, 1), v_maximo > 0);
+    RETURN v_maximo;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Coleta de fotos órfãs (app/coleta_fotos.py): chaves referenciadas e tipo do equipamento numa única
+-- consulta, sem o limite de linhas por requisição do PostgREST
+CREATE OR REPLACE FUNCTION fotos_referenciadas() RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_agg(jsonb_build_object('url', f.url, 'tipo', e.tipo)), '[]'::JSONB)
+      FROM equipamentos_fotos f
+      LEFT JOIN equipamentos e ON e.id = f.equipamento_id;
+$$ LANGUAGE sql STABLE;
+
 -- Criar usuário administrador inicial
 -- IMPORTANTE: Altere a senha após o primeiro login!
 INSERT INTO usuarios (nome, email, senha_hash, departamento, is_admin, ativo)
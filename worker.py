@@ -0,0 +1,55 @@
+"""
+Processo dedicado às tarefas em segundo plano
+Execute: python worker.py
+
+Roda o APScheduler (backup, notificações, indicadores, manutenção dos jobs) e consome a fila
+de jobs de relatório, fora dos processos web. Os processos web iniciam com SCHEDULER_ENABLED=false
+(padrão) e, com WORKER_ENABLED=true, só registram os jobs de relatório para este processo gerar.
+
+Concorrência: SCHEDULER_THREADS (padrão 4) e WORKER_POLL_SECONDS (intervalo da fila, padrão 5).
+Vários workers podem rodar ao mesmo tempo: cada tarefa executa uma única vez no cluster.
+BACKUP_FOLDER e RELATORIOS_FOLDER devem ser as mesmas pastas (volume compartilhado) vistas pelos
+processos web: o worker grava os backups e relatórios que a aplicação lista e serve.
+"""
+import logging
+import os
+import sys
+
+# Carrega variáveis de ambiente do arquivo .env manualmente
+env_path = os.path.join(os.path.dirname(__file__), '.env')
+if os.path.exists(env_path):
+    with open(env_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                os.environ.setdefault(key.strip(), value.strip())
+
+# O worker cria o próprio agendador (bloqueante); create_app não deve iniciar outro
+os.environ['SCHEDULER_ENABLED'] = 'false'
+
+from app import create_app
+from app.agendador import criar_agendador
+
+
+def main():
+    logging.basicConfig(
+        level=os.environ.get('LOG_LEVEL', 'INFO'),
+        format='%(asctime)s %(levelname)s [%(name)s] %(message)s'
+    )
+    app = create_app()
+    scheduler = criar_agendador(app, bloqueante=True)
+
+    print(f'⚙️  Worker iniciado ({app.config["SCHEDULER_THREADS"]} threads)')
+    for job in scheduler.get_jobs():
+        print(f'   - {job.id}: {job.name} ({job.trigger})')
+
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        print('🛑 Worker encerrado')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())